@@ -0,0 +1,15 @@
+#!/bin/bash
+
+set -e
+
+# cd to repo root
+cd "$(dirname "${0}")"
+cd ../
+
+# Activate venv
+if [ -z "${VIRTUAL_ENV}" ]; then
+    source .venv/bin/activate
+fi
+
+# e.g. ./scripts/scale-bench.sh --pages 1000,10000,30000 --churn 0.01,0.1
+python3 tests/e2e-scale/harness.py "$@"
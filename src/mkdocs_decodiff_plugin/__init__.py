@@ -1,8 +1,16 @@
 from importlib.metadata import PackageNotFoundError, version
 
+from .decodiff import FileChange, LineChange, aiter_file_changes, iter_file_changes
+
 try:
     __version__ = version("mkdocs_decodiff_plugin")
 except PackageNotFoundError:
     __version__ = "unknown"
 
-__all__ = ("__version__",)
+__all__ = (
+    "__version__",
+    "FileChange",
+    "LineChange",
+    "aiter_file_changes",
+    "iter_file_changes",
+)
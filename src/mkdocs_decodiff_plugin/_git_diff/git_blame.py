@@ -0,0 +1,209 @@
+import hashlib
+import os
+import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional
+
+from .._cache import DiskCache
+from .git_diff import iter_git_output, read_git_blobs
+
+# commit of the lines not committed yet
+UNCOMMITTED_SHA = "0" * 40
+
+
+def blob_sha(data: bytes) -> str:
+    """Returns the git blob hash of the data without running git"""
+
+    return hashlib.sha1(b"blob %d\0" % len(data) + data).hexdigest()
+
+
+def parse_blame_incremental(
+    lines: Iterable[str], uncommitted_lines: Optional[List[int]] = None
+) -> List[int]:
+    """Parses git blame --incremental output into author times per line
+
+    The lines not committed yet are appended to `uncommitted_lines` if it is
+    given.
+    """
+
+    times: Dict[int, int] = {}
+    commit_times: Dict[str, int] = {}
+    sha = None
+    final_line = 0
+    num_lines = 0
+    for line in lines:
+        line = line.rstrip("\n")
+        if sha is None:
+            # <sha> <orig_line> <final_line> <num_lines>
+            fields = line.split(" ")
+            if len(fields) != 4:
+                continue
+            sha = fields[0]
+            final_line = int(fields[2])
+            num_lines = int(fields[3])
+        elif line.startswith("author-time "):
+            commit_times[sha] = int(line[12:])
+        elif line.startswith("filename "):
+            # the entry ends with the file name
+            t = commit_times.get(sha, int(time.time()))
+            for line_no in range(final_line, final_line + num_lines):
+                times[line_no] = t
+            if uncommitted_lines is not None and sha == UNCOMMITTED_SHA:
+                uncommitted_lines.extend(range(final_line, final_line + num_lines))
+            sha = None
+
+    return [times.get(line_no, 0) for line_no in range(1, len(times) + 1)]
+
+
+def run_git_blame(
+    git_root_path: str,
+    file_path: str,
+    target: Optional[str] = None,
+    uncommitted_lines: Optional[List[int]] = None,
+) -> List[int]:
+    """Runs git blame --incremental and returns the author time of each line
+
+    `file_path` is relative to the git root. The working tree file is blamed
+    unless `target` is given. The lines not committed yet are appended to
+    `uncommitted_lines` if it is given.
+    """
+
+    args = ["git", "-C", git_root_path, "blame", "--incremental"]
+    if target:
+        args.append(f"{target}")
+    args.extend(["--", file_path])
+
+    try:
+        p = subprocess.Popen(
+            args,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+            encoding="utf-8",
+            errors="replace",
+        )
+    except FileNotFoundError as e:
+        raise RuntimeError("git is not available in PATH") from e
+
+    with p:
+        times = parse_blame_incremental(p.stdout, uncommitted_lines)
+
+    if p.returncode > 0:
+        raise RuntimeError(f"git blame failed: {file_path}")
+
+    return times
+
+
+def read_last_commits(
+    git_root_path: str, file_paths: List[str], target: Optional[str] = None
+) -> Dict[str, str]:
+    """Returns the last commit changing each file in the history of `target`
+
+    A single git log walks the history of HEAD, unless `target` is given, and
+    stops when every file is found. Files without a commit are not returned.
+    """
+
+    if not file_paths:
+        return {}
+
+    args = ["git", "-C", git_root_path, "log", "--format=%x01%H", "--name-only"]
+    args.extend(["-z", target or "HEAD", "--", *file_paths])
+
+    remaining = set(file_paths)
+    commits: Dict[str, str] = {}
+    lines = iter_git_output(args)
+    try:
+        # \x01<sha> NUL LF <path> NUL <path> NUL ... for each commit
+        sha = None
+        pending = ""
+        for line in lines:
+            *tokens, pending = (pending + line).split("\0")
+            for token in tokens:
+                if token.startswith("\x01"):
+                    sha = token[1:]
+                    continue
+                path = token[1:] if token.startswith("\n") else token
+                if path in remaining:
+                    remaining.discard(path)
+                    commits[path] = sha
+            if not remaining:
+                break
+    finally:
+        # git is killed if the history is not walked to the end
+        lines.close()
+
+    return commits
+
+
+def _encode_runs(times: List[int]) -> List[List[int]]:
+    runs: List[List[int]] = []
+    for t in times:
+        if runs and runs[-1][0] == t:
+            runs[-1][1] += 1
+        else:
+            runs.append([t, 1])
+    return runs
+
+
+def _decode_runs(runs: List[List[int]]) -> List[int]:
+    return [t for t, count in runs for _ in range(count)]
+
+
+def read_line_times(
+    git_root_path: str,
+    file_paths: List[str],
+    cache: Optional[DiskCache] = None,
+    jobs: int = 4,
+    target: Optional[str] = None,
+) -> Dict[str, List[int]]:
+    """Returns the author time of each line of the files
+
+    Results are cached by the path, its blob hash and the last commit changing
+    it in `target` or HEAD, so a file is blamed again only when one of them
+    changes, not on every commit. Results with uncommitted lines are not
+    cached, their time is the time of the build. At most `jobs` git blame
+    processes run at the same time.
+    """
+
+    if target:
+        blobs = read_git_blobs(target, file_paths)
+    else:
+        blobs = {}
+        for file_path in file_paths:
+            try:
+                with open(os.path.join(git_root_path, file_path), "rb") as f:
+                    blobs[file_path] = f.read()
+            except OSError:
+                pass
+
+    # the history the lines are blamed in
+    last_commits: Dict[str, str] = {}
+    if cache is not None:
+        try:
+            last_commits = read_last_commits(git_root_path, list(blobs), target)
+        except RuntimeError:
+            pass
+
+    def blame(file_path: str) -> List[int]:
+        key = None
+        if file_path in last_commits:
+            key = hashlib.sha256(
+                f"{file_path}\0{blob_sha(blobs[file_path])}\0"
+                f"{last_commits[file_path]}".encode("utf-8")
+            ).hexdigest()
+        runs = cache.get_json(key) if key is not None else None
+        if runs is not None:
+            return _decode_runs(runs)
+
+        uncommitted_lines: List[int] = []
+        try:
+            times = run_git_blame(git_root_path, file_path, target, uncommitted_lines)
+        except RuntimeError:
+            return []
+        if key is not None and not uncommitted_lines:
+            cache.put_json(key, _encode_runs(times))
+        return times
+
+    with ThreadPoolExecutor(max_workers=max(jobs, 1)) as executor:
+        return dict(zip(blobs, executor.map(blame, blobs)))
@@ -1,7 +1,13 @@
 import subprocess
+import sys
+import threading
+import time
 from dataclasses import dataclass, field
 from enum import Enum
-from typing import List, Optional
+from typing import Dict, Iterator, List, Optional, Tuple
+
+# seconds between two progress reports
+_PROGRESS_INTERVAL = 10.0
 
 
 @dataclass
@@ -19,6 +25,27 @@ class FileDiff:
     line_diffs: List[LineDiff] = field(default_factory=list)
 
 
+def file_diffs_to_json(file_diffs: List[FileDiff]) -> list:
+    return [
+        [
+            d.from_file,
+            d.to_file,
+            [
+                [ld.line_no, ld.col_start, ld.col_end, ld.anchor_no]
+                for ld in d.line_diffs
+            ],
+        ]
+        for d in file_diffs
+    ]
+
+
+def file_diffs_from_json(data: list) -> List[FileDiff]:
+    return [
+        FileDiff(from_file, to_file, [LineDiff(*ld) for ld in line_diffs])
+        for from_file, to_file, line_diffs in data
+    ]
+
+
 class WordDiff(Enum):
     """--word-diff option type of git-diff"""
 
@@ -34,9 +61,177 @@ class WordDiff(Enum):
             return "none"
 
 
-def run_git_diff(base: str, word_diff: WordDiff, target_dir: Optional[str]) -> str:
-    """Runs git diff"""
+class GitBudgetExceeded(RuntimeError):
+    """git exceeded the time or output size budget"""
+
+
+class GitBudget:
+    """Time and output size budget shared by the git processes of a stage
+
+    Used as a context manager. While it is active, the files and bytes read so
+    far are reported to stderr periodically. When `timeout` seconds pass or
+    more than `max_bytes` are read, all running processes are killed.
+    Without both limits, git runs as without a budget.
+    """
+
+    def __init__(
+        self,
+        timeout: Optional[float] = None,
+        max_bytes: Optional[int] = None,
+        progress_interval: float = _PROGRESS_INTERVAL,
+    ):
+        self.timeout = timeout
+        self.max_bytes = max_bytes
+        self.progress_interval = progress_interval
+        self.file_count = 0
+        self.byte_count = 0
+        # reason of the excess, None while within the budget
+        self.exceeded: Optional[str] = None
+        self._start = 0.0
+        self._lock = threading.Lock()
+        self._processes: List[subprocess.Popen] = []
+        self._done = threading.Event()
+        self._watchdog: Optional[threading.Thread] = None
+
+    @property
+    def is_bounded(self) -> bool:
+        return self.timeout is not None or self.max_bytes is not None
+
+    def __enter__(self):
+        self._start = time.monotonic()
+        self._done.clear()
+        self._watchdog = None
+        if self.is_bounded:
+            self._watchdog = threading.Thread(target=self._watch, daemon=True)
+            self._watchdog.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._done.set()
+        if self._watchdog is not None:
+            self._watchdog.join()
+
+    def _watch(self):
+        while True:
+            wait = self.progress_interval
+            if self.timeout is not None:
+                rest = self._start + self.timeout - time.monotonic()
+                wait = min(wait, max(rest, 0))
+            if self._done.wait(wait):
+                return
+
+            elapsed = time.monotonic() - self._start
+            if self.timeout is not None and elapsed >= self.timeout:
+                self._exceed(f"git timed out after {self.timeout} seconds")
+                return
+            print(
+                f"git: {self.file_count} files, {self.byte_count} bytes"
+                f" in {elapsed:.0f}s",
+                file=sys.stderr,
+            )
+
+    def _exceed(self, reason: str):
+        with self._lock:
+            if self.exceeded is None:
+                self.exceeded = reason
+            for p in self._processes:
+                p.kill()
+
+    def add_process(self, p: subprocess.Popen):
+        with self._lock:
+            self._processes.append(p)
+            if self.exceeded is not None:
+                p.kill()
+
+    def remove_process(self, p: subprocess.Popen):
+        with self._lock:
+            self._processes.remove(p)
+
+    def add_line(self, line: bytes):
+        """Counts a line of the output"""
+
+        with self._lock:
+            self.byte_count += len(line)
+            if line.startswith(b"diff --git "):
+                self.file_count += 1
+            is_over = self.max_bytes is not None and self.byte_count > self.max_bytes
+        if is_over:
+            self._exceed(f"git output exceeded {self.max_bytes} bytes")
+
+
+def _run_git(args: List[str]) -> str:
+    try:
+        r = subprocess.run(args, capture_output=True, text=True, check=False)
+    except FileNotFoundError as e:
+        raise RuntimeError("git is not available in PATH") from e
+
+    if r.returncode > 0:
+        raise RuntimeError(r.stderr.strip() or f"git {args[1]} failed")
+
+    return r.stdout
+
+
+def iter_git_output(
+    args: List[str], budget: Optional[GitBudget] = None, cwd: Optional[str] = None
+) -> Iterator[str]:
+    """Runs git and yields the output lines as git writes them
+
+    stderr is drained while stdout is read, so git never blocks on it. Lines
+    end with LF as in text mode. If `budget` has a limit, git is killed and
+    GitBudgetExceeded is raised when it exceeds the budget. If the generator
+    is closed before the end, git is killed.
+    """
+
+    try:
+        p = subprocess.Popen(
+            args, cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+        )
+    except FileNotFoundError as e:
+        raise RuntimeError("git is not available in PATH") from e
+
+    err_chunks: List[bytes] = []
+    err_reader = threading.Thread(
+        target=lambda: err_chunks.extend(p.stderr), daemon=True
+    )
+    err_reader.start()
+
+    is_bounded = budget is not None and budget.is_bounded
+    if is_bounded:
+        budget.add_process(p)
+    is_completed = False
+    try:
+        for line in p.stdout:
+            if is_bounded:
+                budget.add_line(line)
+                if budget.exceeded is not None:
+                    break
+            yield line.decode("utf-8", errors="replace").replace("\r\n", "\n")
+        is_completed = not is_bounded or budget.exceeded is None
+    finally:
+        if is_bounded:
+            budget.remove_process(p)
+        if not is_completed:
+            p.kill()
+        p.stdout.close()
+        p.wait()
+        err_reader.join()
+        p.stderr.close()
+
+    if is_bounded and budget.exceeded is not None:
+        raise GitBudgetExceeded(budget.exceeded)
+
+    if p.returncode > 0:
+        err = b"".join(err_chunks).decode("utf-8", errors="replace").strip()
+        raise RuntimeError(err or f"git {args[1]} failed")
+
 
+def _git_diff_args(
+    base: str,
+    word_diff: WordDiff,
+    target_dir: Optional[str],
+    pathspecs: Optional[List[str]] = None,
+    target: Optional[str] = None,
+) -> List[str]:
     args = [
         "git",
         "diff",
@@ -47,15 +242,187 @@ def run_git_diff(base: str, word_diff: WordDiff, target_dir: Optional[str]) -> s
         f"{base}",
     ]
 
+    if target:
+        args.append(f"{target}")
+
+    if pathspecs is not None:
+        args.extend(["--", *pathspecs])
+    elif target_dir:
+        args.extend(["--", target_dir])
+
+    return args
+
+
+def run_git_diff(
+    base: str,
+    word_diff: WordDiff,
+    target_dir: Optional[str],
+    pathspecs: Optional[List[str]] = None,
+    target: Optional[str] = None,
+    budget: Optional[GitBudget] = None,
+) -> str:
+    """Runs git diff
+
+    `pathspecs` limits the diff to the given paths instead of `target_dir`.
+    If `target` is given, `base` is compared with it instead of the working
+    tree. If `budget` has a limit, GitBudgetExceeded is raised when git
+    exceeds it.
+    """
+
+    args = _git_diff_args(base, word_diff, target_dir, pathspecs, target)
+    if budget is not None and budget.is_bounded:
+        return "".join(iter_git_output(args, budget))
+    return _run_git(args)
+
+
+def stream_git_diff(
+    git_root_path: str,
+    base: str,
+    word_diff: WordDiff,
+    target_dir: Optional[str],
+    target: Optional[str] = None,
+) -> Iterator[str]:
+    """Runs git diff in `git_root_path` and yields the output lines
+
+    Lines are read as git writes them. If the generator is closed before the
+    end, git is killed.
+    """
+
+    args = _git_diff_args(base, word_diff, target_dir, target=target)
+    return iter_git_output(args, cwd=git_root_path)
+
+
+def run_git_diff_paths(
+    base: str, target_dir: Optional[str], target: Optional[str] = None
+) -> List[List[str]]:
+    """Runs git diff --name-status -M and returns the paths of each change
+
+    A renamed or copied file has its old and new path, other changes one.
+    The paths are relative to the repository root and sorted as git diff does.
+    """
+
+    args = ["git", "diff", "--name-status", "-M", "-z", f"{base}"]
+    if target:
+        args.append(f"{target}")
     if target_dir:
         args.extend(["--", target_dir])
 
-    try:
-        r = subprocess.run(args, capture_output=True, text=True, check=False)
-    except FileNotFoundError as e:
-        raise RuntimeError("git is not available in PATH") from e
+    fields = _run_git(args).split("\0")
+    changes = []
+    i = 0
+    while i < len(fields) - 1:
+        status = fields[i]
+        count = 2 if status[:1] in ("R", "C") else 1
+        changes.append(fields[i + 1 : i + 1 + count])
+        i += 1 + count
+    return changes
 
-    if r.returncode > 0:
-        raise RuntimeError(r.stderr.strip() or "git diff failed")
 
-    return r.stdout
+def run_git_diff_name_status(
+    base: str, target_dir: Optional[str], target: Optional[str] = None
+) -> List[Tuple[str, str]]:
+    """Runs git diff --name-status and returns (status, path) of the files
+
+    The status is the first letter of git's status (A, D, M, ...). Renames
+    are reported as a removed file and an added file.
+    """
+
+    args = ["git", "diff", "--name-status", "--no-renames", "-z", f"{base}"]
+    if target:
+        args.append(f"{target}")
+    if target_dir:
+        args.extend(["--", target_dir])
+
+    fields = _run_git(args).split("\0")
+    return [(fields[i][:1], fields[i + 1]) for i in range(0, len(fields) - 1, 2)]
+
+
+class GitBlobReader:
+    """Reads files at `rev` from git objects through one git cat-file process
+
+    Used as a context manager or closed with `close`. git runs in `cwd` if it
+    is given. If git fails, RuntimeError is raised with its error.
+    """
+
+    def __init__(self, rev: str, cwd: Optional[str] = None):
+        self.rev = rev
+        try:
+            self._p: Optional[subprocess.Popen] = subprocess.Popen(
+                ["git", "cat-file", "--batch"],
+                cwd=cwd,
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+            )
+        except FileNotFoundError as e:
+            raise RuntimeError("git is not available in PATH") from e
+
+    def __enter__(self) -> "GitBlobReader":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def read(self, path: str) -> Optional[bytes]:
+        """Returns the file at `path` relative to the root, None if missing"""
+
+        p = self._p
+        if p is None:
+            raise RuntimeError("git cat-file is closed")
+
+        # one object at a time, so neither pipe fills up
+        try:
+            p.stdin.write(f"{self.rev}:{path}\n".encode("utf-8"))
+            p.stdin.flush()
+            header = p.stdout.readline()
+        except BrokenPipeError:
+            header = b""
+        if not header:
+            # git exited, its error is raised
+            self._close(failed=True)
+
+        fields = header.decode("utf-8").split()
+        if len(fields) != 3:
+            # "<object> missing" or "<object> ambiguous"
+            return None
+        blob = p.stdout.read(int(fields[2]))
+        p.stdout.read(1)  # LF after the content
+        return blob
+
+    def close(self):
+        self._close(failed=False)
+
+    def _close(self, failed: bool):
+        p = self._p
+        if p is None:
+            return
+        self._p = None
+        try:
+            p.stdin.close()
+        except BrokenPipeError:
+            failed = True
+        p.stdout.close()
+        err = p.stderr.read().decode("utf-8").strip()
+        p.stderr.close()
+        p.wait()
+
+        if failed or p.returncode != 0:
+            raise RuntimeError(err or "git cat-file failed")
+
+
+def read_git_blobs(
+    rev: str, paths: List[str], cwd: Optional[str] = None
+) -> Dict[str, bytes]:
+    """Reads files at `rev` from git objects with one git cat-file process
+
+    `paths` are relative to the repository root. Missing files are omitted.
+    git runs in `cwd` if it is given.
+    """
+
+    blobs: Dict[str, bytes] = {}
+    with GitBlobReader(rev, cwd) as reader:
+        for path in paths:
+            blob = reader.read(path)
+            if blob is not None:
+                blobs[path] = blob
+    return blobs
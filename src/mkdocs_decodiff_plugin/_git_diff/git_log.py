@@ -0,0 +1,195 @@
+import re
+import sys
+from bisect import bisect_right
+from dataclasses import dataclass, field
+from itertools import accumulate
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from .git_diff import GitBudget, iter_git_output
+
+
+@dataclass(frozen=True)
+class CommitInfo:
+    sha: str
+    subject: str
+
+    @property
+    def short_sha(self) -> str:
+        return self.sha[:7]
+
+
+# owner of the lines changed in the working tree
+UNCOMMITTED = CommitInfo("", "Uncommitted changes")
+
+
+@dataclass
+class LineOwners:
+    """Commit that last touched each line of a file
+
+    Lines are stored as runs of [commit, count]. Lines after the last run and
+    lines of a None run are unchanged since the base.
+    """
+
+    runs: List[list] = field(default_factory=list)
+    # 0-based start line of each run and the end of the last one, made on the
+    # first lookup after the runs change
+    _starts: Optional[List[int]] = field(default=None, repr=False, compare=False)
+
+    def _split(self, pos: int) -> int:
+        """Makes a run start at 0-based line `pos` and returns the run index"""
+
+        line = 0
+        for i, run in enumerate(self.runs):
+            if line == pos:
+                return i
+            if pos < line + run[1]:
+                head = pos - line
+                self.runs[i : i + 1] = [[run[0], head], [run[0], run[1] - head]]
+                return i + 1
+            line += run[1]
+
+        if line < pos:
+            self.runs.append([None, pos - line])
+        return len(self.runs)
+
+    def replace(self, line_no: int, count: int, commit: CommitInfo, new_count: int):
+        """Replaces `count` lines from `line_no` with `new_count` lines"""
+
+        start = self._split(line_no - 1)
+        end = self._split(line_no - 1 + count)
+        self.runs[start:end] = [[commit, new_count]] if new_count > 0 else []
+        self._starts = None
+
+    def owner(self, line_no: int) -> Optional[CommitInfo]:
+        if self._starts is None:
+            self._starts = list(accumulate((run[1] for run in self.runs), initial=0))
+        i = bisect_right(self._starts, line_no - 1) - 1
+        if i >= len(self.runs):
+            return None
+        return self.runs[i][0]
+
+
+class LineHistory:
+    """Attributes changed lines to the commits which last touched them
+
+    Diffs with --unified=0 are fed in chronological order. Each hunk remaps
+    the line numbers of the file, so the owners always refer to the lines of
+    the latest version.
+    """
+
+    def __init__(self):
+        self.commits: List[CommitInfo] = []
+        self.files: Dict[str, LineOwners] = {}
+
+    def feed(self, lines: Iterable[str], commit: Optional[CommitInfo] = None):
+        """Feeds git log -p (or git diff) output with --unified=0"""
+
+        from_file = None
+        to_file = None
+        hunk_rest = 0
+        for i, line in enumerate(lines):
+            line = line.rstrip("\n")
+
+            # skip hunk contents, they can look like headers
+            if hunk_rest > 0:
+                if not line.startswith("\\"):
+                    hunk_rest -= 1
+                continue
+
+            # commit header: "\0<sha> <subject>"
+            if line.startswith("\0"):
+                sha, _, subject = line[1:].partition(" ")
+                commit = CommitInfo(sha, subject)
+                self.commits.append(commit)
+            elif line.startswith("diff --git "):
+                from_file = None
+                to_file = None
+            elif line.startswith("--- "):
+                from_file = line[6:] if line.startswith("--- a/") else None
+            elif line.startswith("+++ "):
+                to_file = line[6:] if line.startswith("+++ b/") else None
+                if to_file is None:
+                    # removed file
+                    self.files.pop(from_file, None)
+                elif from_file is None:
+                    # added file
+                    self.files[to_file] = LineOwners()
+            elif line.startswith("@@ "):
+                m = re.match(
+                    r"@@ -\d+(?:,(?P<fc>\d+))? \+(?P<ts>\d+)(?:,(?P<tc>\d+))? @@",
+                    line,
+                )
+                if not m or to_file is None or commit is None:
+                    print(f"Unexpected line {i + 1}: {line}", file=sys.stderr)
+                    continue
+
+                from_count = int(m.group("fc") or "1")
+                to_start = int(m.group("ts"))
+                to_count = int(m.group("tc") or "1")
+                hunk_rest = from_count + to_count
+
+                # "+n,0" means the lines are removed after line n
+                line_no = to_start if to_count > 0 else to_start + 1
+                owners = self.files.setdefault(to_file, LineOwners())
+                owners.replace(line_no, from_count, commit, to_count)
+
+    def owner(self, file_path: str, line_no: int) -> Optional[CommitInfo]:
+        """Returns the commit which last touched the line of the file"""
+
+        owners = self.files.get(file_path)
+        return owners.owner(line_no) if owners is not None else None
+
+
+def read_line_history(
+    base: str,
+    target_dir: Optional[str],
+    target: Optional[str] = None,
+    budget: Optional[GitBudget] = None,
+) -> LineHistory:
+    """Reads the history from `base` to `target` (or the working tree)
+
+    All commits are read from a single git log pass. Only the first parent is
+    followed, so changes merged from a branch belong to the merge commit.
+    If `budget` has a limit, GitBudgetExceeded is raised when git exceeds it.
+    """
+
+    pathspecs = ["--", target_dir] if target_dir else []
+    history = LineHistory()
+    history.feed(
+        iter_git_output(
+            [
+                "git",
+                "log",
+                "-p",
+                "-m",
+                "--first-parent",
+                "--reverse",
+                "--no-color",
+                "--no-renames",
+                "--unified=0",
+                "--format=format:%x00%H %s",
+                f"{base}..{target or 'HEAD'}",
+                *pathspecs,
+            ],
+            budget,
+        )
+    )
+
+    if not target:
+        history.feed(
+            iter_git_output(
+                [
+                    "git",
+                    "diff",
+                    "--no-color",
+                    "--no-renames",
+                    "--unified=0",
+                    "HEAD",
+                    *pathspecs,
+                ],
+                budget,
+            ),
+            UNCOMMITTED,
+        )
+
+    return history
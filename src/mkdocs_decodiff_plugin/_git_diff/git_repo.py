@@ -0,0 +1,183 @@
+import os
+import re
+import subprocess
+import time
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+_SHA_RE = re.compile(r"^(?:[0-9a-f]{40}|[0-9a-f]{64})$")
+
+# A file modified this close to when it was read may be rewritten within the
+# mtime granularity, so it is parsed again like git's racily clean index entries
+_RACY_NS = 1_000_000_000
+
+# path -> ((mtime_ns, ctime_ns, size, ino), parsed value)
+_file_cache: Dict[str, Tuple[Tuple[int, int, int, int], object]] = {}
+
+
+def _read_cached(path: str, parse):
+    """Returns the parsed file, parsed again only when its stat changes
+
+    Loose refs always have the same size and git replaces them by renaming a
+    lockfile, so the inode and ctime are part of the stamp. None is returned if
+    the file does not exist.
+    """
+
+    try:
+        st = os.stat(path)
+    except OSError:
+        _file_cache.pop(path, None)
+        return None
+
+    stamp = (st.st_mtime_ns, st.st_ctime_ns, st.st_size, st.st_ino)
+    cached = _file_cache.get(path)
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
+
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            value = parse(f.read())
+    except (OSError, UnicodeDecodeError):
+        return None
+    if time.time_ns() - max(st.st_mtime_ns, st.st_ctime_ns) < _RACY_NS:
+        _file_cache.pop(path, None)
+    else:
+        _file_cache[path] = (stamp, value)
+    return value
+
+
+def _parse_packed_refs(text: str) -> Dict[str, str]:
+    refs = {}
+    for line in text.splitlines():
+        # comments and peeled tags (^<sha>)
+        if not line or line.startswith(("#", "^")):
+            continue
+        sha, _, name = line.partition(" ")
+        refs[name] = sha
+    return refs
+
+
+def _parse_ref(text: str) -> str:
+    return text.strip()
+
+
+@dataclass(frozen=True)
+class GitRepo:
+    """Repository files read without running git"""
+
+    # work tree root
+    root: str
+    # .git directory of the work tree
+    git_dir: str
+    # directory shared by all work trees (refs, packed-refs, objects)
+    common_dir: str
+
+    def _read_ref(self, name: str) -> Optional[str]:
+        # HEAD and other pseudo refs are per work tree
+        base_dir = self.git_dir if "/" not in name else self.common_dir
+        value = _read_cached(os.path.join(base_dir, name), _parse_ref)
+        if value is None:
+            packed = _read_cached(
+                os.path.join(self.common_dir, "packed-refs"), _parse_packed_refs
+            )
+            value = packed.get(name) if packed else None
+        return value
+
+    def _resolve_ref(self, name: str) -> Optional[str]:
+        # follows symbolic refs ("ref: refs/heads/main")
+        for _ in range(5):
+            value = self._read_ref(name)
+            if value is None:
+                return None
+            if not value.startswith("ref: "):
+                return value if _SHA_RE.match(value) else None
+            name = value[5:]
+        return None
+
+    def resolve(self, rev: str) -> Optional[str]:
+        """Resolves a full object name, HEAD or a ref name to an object name
+
+        None is returned for anything else (abbreviated names, `HEAD~1`, ...)
+        so the caller can ask git.
+        """
+
+        if _SHA_RE.match(rev):
+            return rev
+        if not re.match(r"^[\w./-]+$", rev) or ".." in rev:
+            return None
+
+        # same order as git rev-parse
+        for name in [
+            rev,
+            f"refs/{rev}",
+            f"refs/tags/{rev}",
+            f"refs/heads/{rev}",
+            f"refs/remotes/{rev}",
+            f"refs/remotes/{rev}/HEAD",
+        ]:
+            sha = self._resolve_ref(name)
+            if sha is not None:
+                return sha
+        return None
+
+
+def _read_gitdir_file(path: str) -> Optional[str]:
+    """Returns the directory of a `gitdir: <path>` file of a work tree"""
+
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            line = f.readline().strip()
+    except (OSError, UnicodeDecodeError):
+        return None
+    if not line.startswith("gitdir: "):
+        return None
+    return os.path.normpath(os.path.join(os.path.dirname(path), line[8:]))
+
+
+def find_git_repo(start_dir: str) -> Optional[GitRepo]:
+    """Finds the repository containing `start_dir` by walking up to `.git`
+
+    A `.git` file of a linked work tree or a submodule (`gitdir: <path>`) is
+    followed. None is returned if no repository is found.
+    """
+
+    dir_path = os.path.abspath(start_dir)
+    while True:
+        dot_git = os.path.join(dir_path, ".git")
+        git_dir = None
+        if os.path.isdir(dot_git):
+            git_dir = dot_git
+        elif os.path.isfile(dot_git):
+            git_dir = _read_gitdir_file(dot_git)
+
+        if git_dir is not None and os.path.isfile(os.path.join(git_dir, "HEAD")):
+            common_dir = git_dir
+            commondir = _read_cached(os.path.join(git_dir, "commondir"), _parse_ref)
+            if commondir:
+                common_dir = os.path.normpath(os.path.join(git_dir, commondir))
+            return GitRepo(dir_path, git_dir, common_dir)
+
+        parent = os.path.dirname(dir_path)
+        if parent == dir_path:
+            return None
+        dir_path = parent
+
+
+def resolve_rev(rev: str, git_root_path: Optional[str] = None) -> str:
+    """Returns the object name `rev` points to, `rev` itself if it is unknown"""
+
+    repo = find_git_repo(git_root_path or os.getcwd())
+    sha = repo.resolve(rev) if repo is not None else None
+    if sha is not None:
+        return sha
+
+    # HEAD~1 and others
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--verify", "--quiet", f"{rev}^{{commit}}"],
+            cwd=git_root_path,
+            stderr=subprocess.DEVNULL,
+            text=True,
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return rev
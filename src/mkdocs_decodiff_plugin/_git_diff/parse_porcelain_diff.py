@@ -1,6 +1,6 @@
 import re
 import sys
-from typing import List
+from typing import Iterable, Iterator, List
 
 from .git_diff import FileDiff, LineDiff
 
@@ -8,7 +8,15 @@ from .git_diff import FileDiff, LineDiff
 def parse_porcelain_diff(diff_text: str) -> List[FileDiff]:
     """Parses a porcelain diff text."""
 
-    changed: List[FileDiff] = []
+    return list(iter_porcelain_diff(diff_text.splitlines()))
+
+
+def iter_porcelain_diff(lines: Iterable[str]) -> Iterator[FileDiff]:
+    """Parses porcelain diff lines and yields each file as soon as it ends
+
+    `lines` can be read lazily from the output of git diff.
+    """
+
     anchor_no = 0
 
     is_completed = False
@@ -23,7 +31,8 @@ def parse_porcelain_diff(diff_text: str) -> List[FileDiff]:
     hunk_scanned_line_count = 0
     hunk_col_pos = 0
 
-    for i, line in enumerate(diff_text.splitlines()):
+    for i, line in enumerate(lines):
+        line = line.rstrip("\n")
         # in hunk
         if hunk_start < i and hunk_scanned_line_count < hunk_line_count:
             if line == "~":
@@ -58,7 +67,7 @@ def parse_porcelain_diff(diff_text: str) -> List[FileDiff]:
         if line.startswith("diff --git "):
             if from_file is not None or to_file is not None:
                 # previous file end
-                changed.append(FileDiff(from_file, to_file, line_info_list))
+                yield FileDiff(from_file, to_file, line_info_list)
             # reset
             is_completed = False
             from_file = None
@@ -106,7 +115,7 @@ def parse_porcelain_diff(diff_text: str) -> List[FileDiff]:
         # file is deleted or added
         if from_file is None or to_file is None:
             is_completed = True
-            changed.append(FileDiff(from_file, to_file, []))
+            yield FileDiff(from_file, to_file, [])
             continue
 
         # hunk
@@ -129,7 +138,4 @@ def parse_porcelain_diff(diff_text: str) -> List[FileDiff]:
 
     if from_file is not None or to_file is not None:
         # previous file end
-        changed.append(FileDiff(from_file, to_file, line_info_list))
-
-    # remove empty entries
-    return changed
+        yield FileDiff(from_file, to_file, line_info_list)
@@ -1,6 +1,6 @@
 import re
 import sys
-from typing import List
+from typing import Iterable, Iterator, List
 
 from .git_diff import FileDiff, LineDiff
 
@@ -8,7 +8,15 @@ from .git_diff import FileDiff, LineDiff
 def parse_unified_diff(diff_text: str) -> List[FileDiff]:
     """Parses unified diff (git diff --word-diff=none) text"""
 
-    diffs: List[FileDiff] = []
+    return list(iter_unified_diff(diff_text.splitlines()))
+
+
+def iter_unified_diff(lines: Iterable[str]) -> Iterator[FileDiff]:
+    """Parses unified diff lines and yields each file as soon as it ends
+
+    `lines` can be read lazily from the output of git diff.
+    """
+
     diff_lines: List[LineDiff] = []
     is_not_markdown = False
     is_removed_or_added_file = False
@@ -19,7 +27,8 @@ def parse_unified_diff(diff_text: str) -> List[FileDiff]:
     hunk_start_index = 0
     hunk_end_index = 0
     hunk_scanned_line_count = 0
-    for i, line in enumerate(diff_text.splitlines()):
+    for i, line in enumerate(lines):
+        line = line.rstrip("\n")
         # in hunk
         if hunk_start_index < i and i <= hunk_end_index:
             if is_removed_or_added_file:
@@ -52,7 +61,7 @@ def parse_unified_diff(diff_text: str) -> List[FileDiff]:
         if line.startswith("diff --git "):
             if not is_not_markdown and (from_file is not None or to_file is not None):
                 # save previouse file
-                diffs.append(FileDiff(from_file, to_file, diff_lines))
+                yield FileDiff(from_file, to_file, diff_lines)
 
             # reset
             diff_lines = []
@@ -129,11 +138,5 @@ def parse_unified_diff(diff_text: str) -> List[FileDiff]:
             continue
 
     # save last file
-    if (
-        not is_not_markdown
-        and (from_file is not None or to_file is not None)
-        and len(diff_lines) > 0
-    ):
-        diffs.append(FileDiff(from_file, to_file, diff_lines))
-
-    return diffs
+    if not is_not_markdown and (from_file is not None or to_file is not None):
+        yield FileDiff(from_file, to_file, diff_lines)
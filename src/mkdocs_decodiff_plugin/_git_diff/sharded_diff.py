@@ -0,0 +1,91 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+
+from .git_diff import (
+    FileDiff,
+    GitBudget,
+    WordDiff,
+    run_git_diff,
+    run_git_diff_paths,
+)
+from .parse_porcelain_diff import parse_porcelain_diff
+from .parse_unified_diff import parse_unified_diff
+
+# keeps command lines of a shard well under the OS limits
+_MAX_SHARD_CHARS = 30000
+
+
+def _make_shards(changes: List[List[str]], jobs: int) -> List[List[str]]:
+    """Splits the sorted paths of changes into contiguous shards
+
+    The paths of a change, e.g. both paths of a rename, are in one shard.
+    """
+
+    if not changes:
+        return []
+
+    size = -(-len(changes) // jobs)
+    shards: List[List[str]] = []
+    for i in range(0, len(changes), size):
+        shard: List[str] = []
+        chars = 0
+        for paths in changes[i : i + size]:
+            change_chars = sum(len(path) + 1 for path in paths)
+            if shard and chars + change_chars > _MAX_SHARD_CHARS:
+                shards.append(shard)
+                shard = []
+                chars = 0
+            shard.extend(paths)
+            chars += change_chars
+        shards.append(shard)
+
+    return shards
+
+
+def _renumber_anchors(file_diffs: List[FileDiff]):
+    anchor_no = 0
+    for file_diff in file_diffs:
+        for line_diff in file_diff.line_diffs:
+            line_diff.anchor_no = anchor_no
+            anchor_no += 1
+
+
+def run_sharded_git_diff(
+    base: str,
+    word_diff: WordDiff,
+    target_dir: Optional[str],
+    jobs: int,
+    target: Optional[str] = None,
+    budget: Optional[GitBudget] = None,
+) -> List[FileDiff]:
+    """Runs git diff split into `jobs` concurrent processes by path
+
+    The changed Markdown files are listed first, then diffed in contiguous
+    shards. The old and new paths of a renamed file are diffed in the same
+    shard, so the merged result is the same as a single git diff, with
+    anchors numbered the same way. If `budget` is given, it is shared by all
+    shards.
+    """
+
+    jobs = max(jobs, 1)
+    changes = [
+        [f":(top,literal){p}" for p in paths]
+        for paths in run_git_diff_paths(base, target_dir, target)
+        if any(p.endswith((".md", ".markdown")) for p in paths)
+    ]
+
+    if word_diff == WordDiff.PORCELAIN:
+        parse = parse_porcelain_diff
+    else:
+        parse = parse_unified_diff
+
+    def diff_shard(shard: List[str]) -> List[FileDiff]:
+        return parse(run_git_diff(base, word_diff, target_dir, shard, target, budget))
+
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        results = list(executor.map(diff_shard, _make_shards(changes, jobs)))
+
+    file_diffs = [file_diff for result in results for file_diff in result]
+    _renumber_anchors(file_diffs)
+
+    return file_diffs
@@ -0,0 +1,330 @@
+"""
+SQLite store of the file changes between two revisions.
+
+    python -m mkdocs_decodiff_plugin.change_store changes.sqlite v3.2 v3.4
+
+Each build writes its changes under the commits `base` and `target` point to,
+replacing the changes of the previous build of the same commits, so the
+changed pages of a range can be queried after the build. Paths are relative
+to the repository root. Line changes can be spilled to the store, then they
+are read from it with a cursor when they are used.
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+from collections.abc import Sequence
+from dataclasses import dataclass
+from typing import Iterable, Iterator, List, Optional
+
+from ._git_diff.git_repo import resolve_rev
+from .decodiff import FileChange, LineChange
+from .page_index import ChangeSummary, summarize_changes
+
+# file changes written in one transaction
+_BATCH_FILES = 100
+
+# stores of another schema version are recreated
+_SCHEMA_VERSION = 2
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS file_changes (
+    id INTEGER PRIMARY KEY,
+    base TEXT NOT NULL,
+    target TEXT NOT NULL,
+    base_sha TEXT NOT NULL,
+    target_sha TEXT NOT NULL,
+    path TEXT NOT NULL,
+    is_removed INTEGER NOT NULL,
+    is_added INTEGER NOT NULL,
+    is_modified INTEGER NOT NULL,
+    head_line_count INTEGER,
+    line_change_count INTEGER NOT NULL,
+    changed_lines INTEGER NOT NULL,
+    line_offset INTEGER NOT NULL,
+    fingerprint TEXT NOT NULL,
+    is_sorted INTEGER NOT NULL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS file_changes_range
+    ON file_changes (base_sha, target_sha, path);
+CREATE TABLE IF NOT EXISTS line_changes (
+    file_id INTEGER NOT NULL,
+    line_no INTEGER NOT NULL,
+    line_count INTEGER NOT NULL,
+    line TEXT NOT NULL,
+    tagged_line TEXT NOT NULL,
+    anchor TEXT NOT NULL,
+    text TEXT NOT NULL,
+    attrs TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS line_changes_file ON line_changes (file_id);
+"""
+
+
+@dataclass
+class ChangedPage:
+    """Summary of a changed file"""
+
+    # relative to the repository root
+    path: str
+    is_removed: bool
+    is_added: bool
+    is_modified: bool
+    # number of line changes and source lines they cover
+    line_change_count: int
+    changed_lines: int
+
+
+class StoredLineChanges(Sequence):
+    """Line changes of a file read from the store each time they are iterated
+
+    `summary` is computed when the changes are written, so the page index
+    does not read them.
+    """
+
+    def __init__(
+        self, store: "ChangeStore", file_id: int, count: int, summary: ChangeSummary
+    ):
+        self._store = store
+        self._file_id = file_id
+        self._count = count
+        self.summary = summary
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __iter__(self) -> Iterator[LineChange]:
+        return self._store._iter_line_changes(self._file_id)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return list(self)[i]
+        if i < 0:
+            i += self._count
+        if not 0 <= i < self._count:
+            raise IndexError("line change index out of range")
+        return next(self._store._iter_line_changes(self._file_id, i))
+
+
+class ChangeStore:
+    """Changes between `base` and `target` (the working tree if None)
+
+    The revisions are resolved to commits in the repository at
+    `git_root_path`, the current directory if it is None.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        base: str,
+        target: Optional[str] = None,
+        git_root_path: Optional[str] = None,
+    ):
+        dir_path = os.path.dirname(path)
+        if dir_path:
+            os.makedirs(dir_path, exist_ok=True)
+        self.git_root_path = os.path.abspath(git_root_path or os.getcwd())
+        self.base = base
+        self.target = target or ""
+        self.base_sha = resolve_rev(base, self.git_root_path)
+        self.target_sha = resolve_rev(target, self.git_root_path) if target else ""
+        self._conn = sqlite3.connect(path)
+        self._migrate()
+
+    def _migrate(self):
+        (version,) = self._conn.execute("PRAGMA user_version").fetchone()
+        if version != _SCHEMA_VERSION:
+            with self._conn:
+                self._conn.execute("DROP TABLE IF EXISTS file_changes")
+                self._conn.execute("DROP TABLE IF EXISTS line_changes")
+        self._conn.executescript(_SCHEMA)
+        self._conn.execute(f"PRAGMA user_version = {_SCHEMA_VERSION}")
+
+    def close(self):
+        self._conn.close()
+
+    def _relpath(self, file_path: str) -> str:
+        return os.path.relpath(file_path, self.git_root_path).replace(os.sep, "/")
+
+    def clear(self):
+        """Removes the stored changes of the range"""
+
+        with self._conn:
+            self._conn.execute(
+                "DELETE FROM line_changes WHERE file_id IN (SELECT id FROM"
+                " file_changes WHERE base_sha = ? AND target_sha = ?)",
+                (self.base_sha, self.target_sha),
+            )
+            self._conn.execute(
+                "DELETE FROM file_changes WHERE base_sha = ? AND target_sha = ?",
+                (self.base_sha, self.target_sha),
+            )
+
+    def write(
+        self, file_changes: Iterable[FileChange], spill: bool = False
+    ) -> List[FileChange]:
+        """Writes the file changes of the range
+
+        Changes are written in batches, one transaction each, as they are
+        made. A stored change of the same file is replaced. If `spill` is
+        True, the returned file changes read their line changes from the store
+        instead of holding them.
+        """
+
+        written = []
+        batch = []
+        for file_change in file_changes:
+            batch.append(file_change)
+            if len(batch) >= _BATCH_FILES:
+                written += self._write_batch(batch, spill)
+                batch = []
+        written += self._write_batch(batch, spill)
+        return written
+
+    def _write_batch(
+        self, file_changes: List[FileChange], spill: bool
+    ) -> List[FileChange]:
+        written = []
+        with self._conn:
+            for file_change in file_changes:
+                line_changes = file_change.line_changes
+                summary = summarize_changes(file_change)
+                path = self._relpath(file_change.file_path)
+                self._conn.execute(
+                    "DELETE FROM line_changes WHERE file_id IN (SELECT id FROM"
+                    " file_changes WHERE base_sha = ? AND target_sha = ?"
+                    " AND path = ?)",
+                    (self.base_sha, self.target_sha, path),
+                )
+                cur = self._conn.execute(
+                    "INSERT OR REPLACE INTO file_changes (base, target, base_sha,"
+                    " target_sha, path, is_removed, is_added, is_modified,"
+                    " head_line_count, line_change_count, changed_lines,"
+                    " line_offset, fingerprint, is_sorted)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        self.base,
+                        self.target,
+                        self.base_sha,
+                        self.target_sha,
+                        path,
+                        file_change.is_removed,
+                        file_change.is_added,
+                        file_change.is_modified,
+                        file_change.head_line_count,
+                        len(line_changes),
+                        summary.changed_lines,
+                        summary.offset,
+                        summary.fingerprint,
+                        summary.is_sorted,
+                    ),
+                )
+                file_id = cur.lastrowid
+                self._conn.executemany(
+                    "INSERT INTO line_changes VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    [
+                        (
+                            file_id,
+                            c.line_no,
+                            c.line_count,
+                            c.line,
+                            c.tagged_line,
+                            c.anchor,
+                            c.text,
+                            json.dumps(c.attrs),
+                        )
+                        for c in line_changes
+                    ],
+                )
+
+                if spill:
+                    file_change = FileChange(
+                        file_change.file_path,
+                        is_removed=file_change.is_removed,
+                        is_added=file_change.is_added,
+                        is_modified=file_change.is_modified,
+                        line_changes=StoredLineChanges(
+                            self, file_id, len(line_changes), summary
+                        ),
+                        head_line_count=file_change.head_line_count,
+                    )
+                written.append(file_change)
+        return written
+
+    def _iter_line_changes(self, file_id: int, offset: int = 0) -> Iterator[LineChange]:
+        cur = self._conn.execute(
+            "SELECT line_no, line, tagged_line, anchor, line_count, text, attrs"
+            " FROM line_changes WHERE file_id = ? ORDER BY rowid LIMIT -1 OFFSET ?",
+            (file_id, offset),
+        )
+        for line_no, line, tagged_line, anchor, line_count, text, attrs in cur:
+            yield LineChange(
+                line_no, line, tagged_line, anchor, line_count, text, json.loads(attrs)
+            )
+
+    def iter_file_changes(self) -> Iterator[FileChange]:
+        """Yields the stored file changes, their line changes read on use
+
+        The file paths are absolute in the repository of the store.
+        """
+
+        cur = self._conn.execute(
+            "SELECT id, path, is_removed, is_added, is_modified, head_line_count,"
+            " line_change_count, changed_lines, line_offset, fingerprint, is_sorted"
+            " FROM file_changes WHERE base_sha = ? AND target_sha = ? ORDER BY id",
+            (self.base_sha, self.target_sha),
+        )
+        for row in cur:
+            file_id, path, removed, added, modified, head, count = row[:7]
+            summary = ChangeSummary(row[8], row[9], row[7], bool(row[10]))
+            yield FileChange(
+                os.path.join(self.git_root_path, path),
+                is_removed=bool(removed),
+                is_added=bool(added),
+                is_modified=bool(modified),
+                line_changes=StoredLineChanges(self, file_id, count, summary),
+                head_line_count=head,
+            )
+
+    def changed_pages(self) -> List[ChangedPage]:
+        """Returns the changed files of the range sorted by path"""
+
+        cur = self._conn.execute(
+            "SELECT path, is_removed, is_added, is_modified, line_change_count,"
+            " changed_lines FROM file_changes"
+            " WHERE base_sha = ? AND target_sha = ? ORDER BY path",
+            (self.base_sha, self.target_sha),
+        )
+        return [
+            ChangedPage(path, bool(removed), bool(added), bool(modified), count, lines)
+            for path, removed, added, modified, count, lines in cur
+        ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="decodiff change store")
+    parser.add_argument("store", help="SQLite file")
+    parser.add_argument("base", help="base of the range")
+    parser.add_argument("target", nargs="?", help="target of the range")
+    parser.add_argument("--repo", default=".", help="git repository path")
+    args = parser.parse_args()
+
+    store = ChangeStore(args.store, args.base, args.target, args.repo)
+    try:
+        for page in store.changed_pages():
+            if page.is_removed:
+                status = "removed"
+            elif page.is_added:
+                status = "new"
+            elif page.is_modified:
+                status = "changed"
+            else:
+                status = f"{page.line_change_count} changes, {page.changed_lines} lines"
+            print(f"{page.path}: {status}")
+    finally:
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
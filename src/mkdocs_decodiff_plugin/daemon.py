@@ -0,0 +1,503 @@
+"""
+Daemon serving file changes of a repository to concurrent builds.
+
+    python -m mkdocs_decodiff_plugin.daemon --socket /tmp/decodiff.sock --repo .
+
+The daemon runs git diff, marks and tags the changed files once per request
+options and keeps the result until `base` or `target` point to other commits,
+or the index or the files of the diffed directory change. Builds configured
+with `daemon_socket` ask it for the changes over the Unix domain socket
+instead of running git themselves. A request names the repository of the
+build, and is rejected if the daemon serves another one.
+
+Protocol: each message is a 4-byte big-endian length followed by the
+payload. A request is a set of options, a response is a status byte followed
+by an error message or the encoded file changes.
+"""
+
+import argparse
+import hashlib
+import os
+import socket
+import socketserver
+import stat
+import struct
+import subprocess
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from ._git_diff.git_diff import (
+    GitBudget,
+    GitBudgetExceeded,
+    WordDiff,
+    run_git_diff,
+    run_git_diff_name_status,
+)
+from ._git_diff.git_repo import find_git_repo
+from ._git_diff.parse_porcelain_diff import parse_porcelain_diff
+from ._git_diff.parse_unified_diff import parse_unified_diff
+from ._git_diff.sharded_diff import run_sharded_git_diff
+from .decodiff import (
+    FileChange,
+    LineChange,
+    make_file_changes,
+    make_file_level_changes,
+)
+
+_STATUS_OK = 0
+_STATUS_ERROR = 1
+
+# FileChange flags
+_REMOVED = 1 << 0
+_ADDED = 1 << 1
+_MODIFIED = 1 << 2
+
+_U8 = struct.Struct(">B")
+_U16 = struct.Struct(">H")
+_U32 = struct.Struct(">I")
+_I32 = struct.Struct(">i")
+_LINE_CHANGE = struct.Struct(">II")
+
+# option sets whose results are kept
+_MAX_RESULTS = 32
+# size of a request at most, requests are a few options
+_MAX_REQUEST_BYTES = 64 * 1024
+# seconds a walk of the diffed directory is reused for
+_WALK_TTL = 1.0
+
+
+class _Writer:
+    def __init__(self):
+        self.parts: List[bytes] = []
+
+    def u8(self, v: int):
+        self.parts.append(_U8.pack(v))
+
+    def u32(self, v: int):
+        self.parts.append(_U32.pack(v))
+
+    def string(self, v: Optional[str]):
+        # None is encoded as 0xffffffff
+        if v is None:
+            self.parts.append(_U32.pack(0xFFFFFFFF))
+            return
+        b = v.encode("utf-8")
+        self.parts.append(_U32.pack(len(b)))
+        self.parts.append(b)
+
+    def getvalue(self) -> bytes:
+        return b"".join(self.parts)
+
+
+class _Reader:
+    def __init__(self, data: bytes):
+        self.data = data
+        self.pos = 0
+
+    def _unpack(self, s: struct.Struct) -> tuple:
+        v = s.unpack_from(self.data, self.pos)
+        self.pos += s.size
+        return v
+
+    def u8(self) -> int:
+        return self._unpack(_U8)[0]
+
+    def u16(self) -> int:
+        return self._unpack(_U16)[0]
+
+    def u32(self) -> int:
+        return self._unpack(_U32)[0]
+
+    def string(self) -> Optional[str]:
+        n = self.u32()
+        if n == 0xFFFFFFFF:
+            return None
+        if self.pos + n > len(self.data):
+            raise ValueError("truncated message")
+        v = self.data[self.pos : self.pos + n].decode("utf-8")
+        self.pos += n
+        return v
+
+
+def encode_request(options: Dict[str, object]) -> bytes:
+    """Encodes the request options (string, int and bool values)"""
+
+    w = _Writer()
+    w.u32(len(options))
+    for k, v in sorted(options.items()):
+        w.string(k)
+        w.string(None if v is None else str(v))
+    return w.getvalue()
+
+
+def decode_request(data: bytes) -> Dict[str, Optional[str]]:
+    r = _Reader(data)
+    return {r.string(): r.string() for _ in range(r.u32())}
+
+
+def encode_file_changes(file_changes: List[FileChange]) -> bytes:
+    w = _Writer()
+    w.u32(len(file_changes))
+    for file_change in file_changes:
+        w.string(file_change.file_path)
+        w.u8(
+            (_REMOVED if file_change.is_removed else 0)
+            | (_ADDED if file_change.is_added else 0)
+            | (_MODIFIED if file_change.is_modified else 0)
+        )
+        head = file_change.head_line_count
+        w.parts.append(_I32.pack(-1 if head is None else head))
+        w.u32(len(file_change.line_changes))
+        for c in file_change.line_changes:
+            w.parts.append(_LINE_CHANGE.pack(c.line_no, c.line_count))
+            w.string(c.line)
+            w.string(c.tagged_line)
+            w.string(c.anchor)
+            w.string(c.text)
+            w.parts.append(_U16.pack(len(c.attrs)))
+            for k, v in c.attrs.items():
+                w.string(k)
+                w.string(v)
+    return w.getvalue()
+
+
+def decode_file_changes(data: bytes) -> List[FileChange]:
+    r = _Reader(data)
+    file_changes = []
+    for _ in range(r.u32()):
+        file_path = r.string()
+        flags = r.u8()
+        (head,) = r._unpack(_I32)
+        line_changes = []
+        for _ in range(r.u32()):
+            line_no, line_count = r._unpack(_LINE_CHANGE)
+            line = r.string()
+            tagged_line = r.string()
+            anchor = r.string()
+            text = r.string()
+            attrs = {r.string(): r.string() for _ in range(r.u16())}
+            line_changes.append(
+                LineChange(line_no, line, tagged_line, anchor, line_count, text, attrs)
+            )
+        file_change = FileChange(
+            file_path,
+            is_removed=bool(flags & _REMOVED),
+            is_added=bool(flags & _ADDED),
+            is_modified=bool(flags & _MODIFIED),
+            line_changes=line_changes,
+            head_line_count=None if head < 0 else head,
+        )
+        file_change.build_index()
+        file_changes.append(file_change)
+    return file_changes
+
+
+def _send(sock: socket.socket, payload: bytes):
+    sock.sendall(_U32.pack(len(payload)) + payload)
+
+
+def _recv_exact(sock: socket.socket, n: int) -> bytes:
+    chunks = []
+    while n > 0:
+        chunk = sock.recv(min(n, 1 << 20))
+        if not chunk:
+            raise ConnectionError("connection closed")
+        chunks.append(chunk)
+        n -= len(chunk)
+    return b"".join(chunks)
+
+
+def _recv(sock: socket.socket, max_bytes: Optional[int] = None) -> bytes:
+    """Receives a message, ValueError is raised if it exceeds `max_bytes`"""
+
+    (n,) = _U32.unpack(_recv_exact(sock, _U32.size))
+    if max_bytes is not None and n > max_bytes:
+        raise ValueError(f"message of {n} bytes exceeds {max_bytes} bytes")
+    return _recv_exact(sock, n)
+
+
+def query_daemon(
+    socket_path: str, options: Dict[str, object], timeout: Optional[float] = None
+) -> List[FileChange]:
+    """Asks the daemon for the file changes
+
+    OSError is raised if the daemon is not reachable and RuntimeError if it
+    failed to make the changes.
+    """
+
+    if not hasattr(socket, "AF_UNIX"):
+        raise OSError("Unix domain sockets are not supported")
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(socket_path)
+        _send(sock, encode_request(options))
+        response = _recv(sock)
+
+    r = _Reader(response)
+    if r.u8() != _STATUS_OK:
+        raise RuntimeError(f"decodiff daemon: {r.string()}")
+    return decode_file_changes(response[r.pos :])
+
+
+def _git_dirs(repo_path: str) -> Tuple[str, str]:
+    """Returns the work tree root and the .git directory"""
+
+    root, git_dir = subprocess.check_output(
+        ["git", "rev-parse", "--show-toplevel", "--absolute-git-dir"],
+        cwd=repo_path,
+        text=True,
+    ).splitlines()
+    return root, git_dir
+
+
+def _int_option(options: Dict[str, Optional[str]], name: str) -> Optional[int]:
+    value = options.get(name)
+    return None if value is None else int(value)
+
+
+def _stat_key(path: str) -> Tuple[int, int]:
+    try:
+        st = os.stat(path)
+        return st.st_mtime_ns, st.st_size
+    except OSError:
+        return 0, 0
+
+
+class _Daemon:
+    """Diff, mark and cache pipeline of a repository"""
+
+    def __init__(self, repo_path: str, walk_ttl: float = _WALK_TTL):
+        root, self.git_dir = _git_dirs(repo_path)
+        self.repo_path = os.path.realpath(root)
+        self.walk_ttl = walk_ttl
+        self._repo = find_git_repo(self.repo_path)
+        self._lock = threading.Lock()
+        # request key -> (fingerprint, encoded file changes), least recent first
+        self._results: "OrderedDict[tuple, Tuple[str, bytes]]" = OrderedDict()
+        self._key_locks: Dict[tuple, threading.Lock] = {}
+        # directory -> (time, hash of the walk)
+        self._walks: Dict[str, Tuple[float, str]] = {}
+
+    def _walk(self, top: str) -> str:
+        """Returns a hash of the stat of the files under `top`
+
+        A walk is reused for `walk_ttl` seconds, so a burst of requests walks
+        the directory once.
+        """
+
+        with self._lock:
+            cached = self._walks.get(top)
+        if cached is not None and time.monotonic() - cached[0] < self.walk_ttl:
+            return cached[1]
+
+        h = hashlib.sha256()
+        for dir_path, dir_names, file_names in os.walk(top):
+            dir_names[:] = sorted(d for d in dir_names if d != ".git")
+            for file_name in sorted(file_names):
+                path = os.path.join(dir_path, file_name)
+                h.update(f"{path}\0{_stat_key(path)}\0".encode("utf-8"))
+        with self._lock:
+            self._walks[top] = (time.monotonic(), h.hexdigest())
+        return h.hexdigest()
+
+    def _resolve(self, rev: str) -> str:
+        sha = self._repo.resolve(rev) if self._repo is not None else None
+        if sha is not None:
+            return sha
+
+        # HEAD~1 and others, every ref can move them
+        h = hashlib.sha256(rev.encode("utf-8"))
+        for name in ["HEAD", "packed-refs"]:
+            h.update(repr(_stat_key(os.path.join(self.git_dir, name))).encode())
+        h.update(self._walk(os.path.join(self.git_dir, "refs")).encode())
+        return h.hexdigest()
+
+    def fingerprint(self, options: Dict[str, Optional[str]]) -> str:
+        """Returns a hash of the commits and, without `target`, the work tree
+
+        `base` and `target` are resolved to commits. A diff with the work tree
+        also depends on the index and the files of the diffed directory.
+        """
+
+        h = hashlib.sha256(self._resolve(options.get("base") or "").encode())
+        target = options.get("target")
+        if target:
+            h.update(self._resolve(target).encode())
+        else:
+            h.update(repr(_stat_key(os.path.join(self.git_dir, "index"))).encode())
+            top = os.path.join(self.repo_path, options.get("dir") or "")
+            h.update(self._walk(top).encode())
+        return h.hexdigest()
+
+    def check_repo(self, options: Dict[str, Optional[str]]):
+        """Raises RuntimeError if the request is for another repository"""
+
+        repo = options.get("repo")
+        if not repo:
+            raise RuntimeError("the repository of the build is not given")
+        if os.path.realpath(repo) != self.repo_path:
+            raise RuntimeError(f"serving {self.repo_path}, not {repo}")
+
+    def _make(self, options: Dict[str, Optional[str]]) -> Tuple[List[FileChange], bool]:
+        """Returns the file changes, and False if the budget was exceeded"""
+
+        word_diff = WordDiff.NONE
+        if options.get("word_diff") == "True":
+            word_diff = WordDiff.PORCELAIN
+        base = options["base"]
+        target_dir = options.get("dir")
+        target = options.get("target")
+        jobs = int(options.get("jobs") or 1)
+        timeout = _int_option(options, "timeout")
+        max_diff_bytes = _int_option(options, "max_diff_bytes")
+
+        try:
+            with GitBudget(timeout, max_diff_bytes) as budget:
+                if jobs > 1:
+                    file_diffs = run_sharded_git_diff(
+                        base, word_diff, target_dir, jobs, target, budget
+                    )
+                else:
+                    gitdiff = run_git_diff(
+                        base, word_diff, target_dir, target=target, budget=budget
+                    )
+                    if word_diff == WordDiff.PORCELAIN:
+                        file_diffs = parse_porcelain_diff(gitdiff)
+                    else:
+                        file_diffs = parse_unified_diff(gitdiff)
+        except GitBudgetExceeded as e:
+            print(
+                f"decodiff daemon: {e}: changed files without changed lines",
+                file=sys.stderr,
+            )
+            name_status = run_git_diff_name_status(base, target_dir, target)
+            return make_file_level_changes(self.repo_path, name_status), False
+
+        file_changes = make_file_changes(
+            self.repo_path, file_diffs, options.get("coalesce") == "True", target
+        )
+        return file_changes, True
+
+    def handle(self, options: Dict[str, Optional[str]]) -> bytes:
+        self.check_repo(options)
+
+        key = tuple(sorted(options.items()))
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+
+        # concurrent requests with the same options wait for one result
+        try:
+            with key_lock:
+                fingerprint = self.fingerprint(options)
+                with self._lock:
+                    cached = self._results.get(key)
+                    if cached is not None and cached[0] == fingerprint:
+                        self._results.move_to_end(key)
+                        return cached[1]
+
+                file_changes, is_complete = self._make(options)
+                data = encode_file_changes(file_changes)
+                # changes over the budget are made again next time
+                if is_complete:
+                    self._store(key, fingerprint, data)
+                return data
+        finally:
+            with self._lock:
+                if key not in self._results and not key_lock.locked():
+                    self._key_locks.pop(key, None)
+
+    def _store(self, key: tuple, fingerprint: str, data: bytes):
+        with self._lock:
+            self._results[key] = (fingerprint, data)
+            self._results.move_to_end(key)
+            while len(self._results) > _MAX_RESULTS:
+                old_key, _ = self._results.popitem(last=False)
+                old_lock = self._key_locks.get(old_key)
+                if old_lock is not None and not old_lock.locked():
+                    del self._key_locks[old_key]
+
+
+class _Handler(socketserver.BaseRequestHandler):
+    def handle(self):
+        try:
+            options = decode_request(_recv(self.request, _MAX_REQUEST_BYTES))
+        except (OSError, ValueError, struct.error):
+            return
+
+        try:
+            data = self.server.pipeline.handle(options)
+            _send(self.request, _U8.pack(_STATUS_OK) + data)
+        except (KeyError, OSError, RuntimeError, ValueError) as e:
+            w = _Writer()
+            w.u8(_STATUS_ERROR)
+            w.string(str(e) or type(e).__name__)
+            try:
+                _send(self.request, w.getvalue())
+            except OSError:
+                pass
+
+
+def _remove_stale_socket(socket_path: str):
+    """Removes the socket left by a previous daemon
+
+    RuntimeError is raised if another kind of file is at the path.
+    """
+
+    try:
+        mode = os.lstat(socket_path).st_mode
+    except FileNotFoundError:
+        return
+    if not stat.S_ISSOCK(mode):
+        raise RuntimeError(f"{socket_path} exists and is not a socket")
+    os.remove(socket_path)
+
+
+def serve(socket_path: str, repo_path: str, walk_ttl: float = _WALK_TTL):
+    """Serves the file changes of the repository until interrupted"""
+
+    daemon = _Daemon(repo_path, walk_ttl)
+    # git diff runs in the current directory
+    os.chdir(daemon.repo_path)
+
+    _remove_stale_socket(socket_path)
+    with socketserver.ThreadingUnixStreamServer(socket_path, _Handler) as server:
+        server.pipeline = daemon
+        server.daemon_threads = True
+        print(f"decodiff daemon: serving {daemon.repo_path} on {socket_path}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            os.remove(socket_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="decodiff daemon")
+    parser.add_argument("--socket", required=True, help="Unix domain socket path")
+    parser.add_argument("--repo", default=".", help="git repository path")
+    parser.add_argument(
+        "--walk-ttl",
+        type=float,
+        default=_WALK_TTL,
+        help="seconds a scan of the work tree is reused for",
+    )
+    args = parser.parse_args()
+
+    if not hasattr(socket, "AF_UNIX"):
+        print("Unix domain sockets are not supported", file=sys.stderr)
+        sys.exit(1)
+
+    try:
+        serve(os.path.abspath(args.socket), args.repo, args.walk_ttl)
+    except RuntimeError as e:
+        print(e, file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,43 @@
+import asyncio
+import html
+import io
+import multiprocessing
 import os
-import re
+from bisect import bisect_left, bisect_right
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from dataclasses import dataclass, field
-from typing import List, Optional
+from functools import partial
+from itertools import repeat
+from typing import (
+    TYPE_CHECKING,
+    AsyncIterator,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+)
 
-from ._git_diff.git_diff import FileDiff, LineDiff
-from .markdown_marker import MdLine, mark_markdown
+from ._git_diff.git_diff import (
+    FileDiff,
+    GitBlobReader,
+    LineDiff,
+    WordDiff,
+    read_git_blobs,
+    stream_git_diff,
+)
+from ._git_diff.parse_porcelain_diff import iter_porcelain_diff
+from ._git_diff.parse_unified_diff import iter_unified_diff
+from .markdown_marker import (
+    MdLine,
+    close_marked_lines,
+    mark_markdown,
+    mark_markdown_lines,
+)
+
+if TYPE_CHECKING:
+    from .change_store import ChangeStore
 
 
 @dataclass
@@ -13,6 +46,46 @@ class LineChange:
     line: str
     tagged_line: str
     anchor: str
+    # number of source lines covered by `line` and `tagged_line`
+    line_count: int = 1
+    # changed text enclosed by the tag
+    text: str = ""
+    # extra attributes of the tag
+    attrs: Dict[str, str] = field(default_factory=dict)
+
+
+class LineChangeIndex:
+    """Sorted interval index over the line changes of a file
+
+    Each change covers the lines [line_no, line_no + line_count). Changes of a
+    file do not contain each other, so sorting by start also sorts the ends and
+    both bounds of a range query are found with bisect.
+    """
+
+    def __init__(self, line_changes: List[LineChange]):
+        self._line_changes = sorted(line_changes, key=lambda c: c.line_no)
+        self._starts = [c.line_no for c in self._line_changes]
+        self._ends: List[int] = []
+        for c in self._line_changes:
+            end = c.line_no + c.line_count
+            self._ends.append(max(end, self._ends[-1]) if self._ends else end)
+
+    def _bounds(self, start: int, end: int) -> Tuple[int, int]:
+        lo = bisect_right(self._ends, start)
+        hi = bisect_left(self._starts, end)
+        return lo, max(lo, hi)
+
+    def changes_in_range(self, start: int, end: int) -> List[LineChange]:
+        """Returns the changes overlapping the lines [start, end)"""
+
+        lo, hi = self._bounds(start, end)
+        return self._line_changes[lo:hi]
+
+    def count_in_range(self, start: int, end: int) -> int:
+        """Returns the number of changes overlapping the lines [start, end)"""
+
+        lo, hi = self._bounds(start, end)
+        return hi - lo
 
 
 @dataclass
@@ -20,13 +93,51 @@ class FileChange:
     file_path: str
     is_removed: bool = False
     is_added: bool = False
+    # changed, but the changed lines are not known
+    is_modified: bool = False
     line_changes: List[LineChange] = field(default_factory=list)
+    # leading front matter and empty lines, MkDocs removes them from pages
+    head_line_count: Optional[int] = None
+    index: Optional[LineChangeIndex] = field(default=None, repr=False, compare=False)
 
+    def build_index(self):
+        self.index = LineChangeIndex(self.line_changes)
 
-def _embed_decodiff_tag_line(
-    marked_line: MdLine, line_diff: LineDiff
-) -> Optional[LineChange]:
-    if (
+    def changes_in_range(self, start: int, end: int) -> List[LineChange]:
+        """Returns the changes overlapping the lines [start, end)"""
+
+        if self.index is None:
+            self.build_index()
+        return self.index.changes_in_range(start, end)
+
+    def count_in_range(self, start: int, end: int) -> int:
+        """Returns the number of changes overlapping the lines [start, end)"""
+
+        if self.index is None:
+            self.build_index()
+        return self.index.count_in_range(start, end)
+
+
+def count_head_lines(marked_lines: List[MdLine]) -> int:
+    """Returns the number of lines MkDocs removes before the page markdown
+
+    These are the front matter and the empty lines after it. Without front
+    matter, no lines are removed.
+    """
+
+    count = 0
+    for marked_line in marked_lines:
+        if marked_line.is_meta():
+            count += 1
+        elif count > 0 and marked_line.line == "":
+            count += 1
+        else:
+            break
+    return count
+
+
+def _is_taggable(marked_line: MdLine) -> bool:
+    return not (
         marked_line.is_meta()
         or marked_line.is_empty()
         or marked_line.is_code_block()
@@ -34,72 +145,405 @@ def _embed_decodiff_tag_line(
         or marked_line.is_table()
         or marked_line.is_html()
         or marked_line.is_html_comment()
-    ):
-        return None
+    )
+
+
+def _content_start(marked_line: MdLine, line_diff: LineDiff) -> int:
+    """Returns the start column of the tag, skipping leading markup"""
 
-    col_offset = 0
     if line_diff.col_start == 0:
-        # heading
-        if m := re.search(r"^#+ ", marked_line.line):
-            col_offset = m.end()
-        # list
-        elif m := re.search(r"^\s*[*\-+] (\[[ xX]\] )?", marked_line.line):
-            col_offset = m.end()
-        # numbered list
-        elif m := re.search(r"^\s*\d+[.)] ", marked_line.line):
-            col_offset = m.end()
-        # quote
-        elif m := re.search(r"^> ", marked_line.line):
-            col_offset = m.end()
-
-    start = line_diff.col_start + col_offset
+        return marked_line.content_col
+    return line_diff.col_start
+
+
+def _start_tag(anchor: str, attrs: Dict[str, str]) -> str:
+    classes = " ".join(["decodiff", *attrs.get("class", "").split()])
+    extra = "".join(
+        f' {k}="{html.escape(v)}"' for k, v in attrs.items() if k != "class"
+    )
+    return f'<span id="{anchor}" class="{classes}"{extra}>'
+
+
+def _embed_decodiff_tag_line(
+    marked_line: MdLine,
+    line_diff: LineDiff,
+    attrs: Optional[Dict[str, str]] = None,
+    embed_tags: bool = True,
+) -> Optional[LineChange]:
+    if not _is_taggable(marked_line):
+        return None
+
+    attrs = attrs or {}
+    start = _content_start(marked_line, line_diff)
     end = line_diff.col_end
     anchor = f"decodiff-anchor-{line_diff.anchor_no}"
-    new_line = (
-        marked_line.line[:start]
-        + f'<span id="{anchor}" class="decodiff">'
-        + marked_line.line[start:end]
-        + "</span>"
-        + marked_line.line[end:]
+    new_line = marked_line.line
+    if embed_tags:
+        new_line = (
+            marked_line.line[:start]
+            + _start_tag(anchor, attrs)
+            + marked_line.line[start:end]
+            + "</span>"
+            + marked_line.line[end:]
+        )
+
+    return LineChange(
+        line_diff.line_no,
+        marked_line.line,
+        new_line,
+        anchor,
+        text=marked_line.line[start:end],
+        attrs=attrs,
+    )
+
+
+def _embed_decodiff_tag_block(
+    marked_lines: List[MdLine],
+    line_diffs: List[LineDiff],
+    attrs: Optional[Dict[str, str]] = None,
+    embed_tags: bool = True,
+) -> LineChange:
+    """Embeds one tag spanning adjacent line diffs of the same block"""
+
+    first = line_diffs[0]
+    last = line_diffs[-1]
+    lines = [m.line for m in marked_lines[first.line_no - 1 : last.line_no]]
+    start = _content_start(marked_lines[first.line_no - 1], first)
+    end = last.col_end
+    anchor = f"decodiff-anchor-{first.anchor_no}"
+    attrs = attrs or {}
+    tag = _start_tag(anchor, attrs)
+    if not embed_tags:
+        tagged_lines = lines
+    elif len(lines) == 1:
+        tagged_lines = [
+            lines[0][:start] + tag + lines[0][start:end] + "</span>" + lines[0][end:]
+        ]
+    else:
+        tagged_lines = [
+            lines[0][:start] + tag + lines[0][start:],
+            *lines[1:-1],
+            lines[-1][:end] + "</span>" + lines[-1][end:],
+        ]
+
+    source = "\n".join(lines)
+    return LineChange(
+        first.line_no,
+        source,
+        "\n".join(tagged_lines),
+        anchor,
+        len(lines),
+        source[start : len(source) - len(lines[-1]) + end],
+        attrs,
     )
 
-    return LineChange(line_diff.line_no, marked_line.line, new_line, anchor)
+
+def _group_line_diffs(
+    marked_lines: List[MdLine],
+    line_diffs: List[LineDiff],
+    line_attrs: Callable[[int], Dict[str, str]],
+) -> List[List[LineDiff]]:
+    """Groups taggable line diffs on the same or adjacent lines of a block
+
+    Line diffs with different attributes are not grouped.
+    """
+
+    groups: List[List[LineDiff]] = []
+    for line_diff in line_diffs:
+        marked_line = marked_lines[line_diff.line_no - 1]
+        if not _is_taggable(marked_line):
+            continue
+
+        if groups:
+            prev = groups[-1][-1]
+            if (
+                line_diff.line_no - prev.line_no <= 1
+                and marked_lines[prev.line_no - 1].block_id == marked_line.block_id
+                and line_attrs(prev.line_no) == line_attrs(line_diff.line_no)
+            ):
+                groups[-1].append(line_diff)
+                continue
+
+        groups.append([line_diff])
+
+    return groups
+
+
+def _no_attrs(line_no: int) -> Dict[str, str]:
+    return {}
 
 
 def embed_decodiff_tags(
-    marked_lines: List[MdLine], file_diff: FileDiff
+    marked_lines: List[MdLine],
+    file_diff: FileDiff,
+    coalesce: bool = False,
+    line_attrs: Optional[Callable[[int], Dict[str, str]]] = None,
+    embed_tags: bool = True,
 ) -> List[LineChange]:
+    """Embeds decodiff tags into the changed lines
+
+    If `coalesce` is True, adjacent changes in the same block are merged into
+    one tag, so they share one anchor and one change list entry.
+    `line_attrs` returns extra attributes of the tag for a line number.
+    If `embed_tags` is False, the changes are located without building the
+    tagged lines, which are the source lines then.
+    """
+
+    if line_attrs is None:
+        line_attrs = _no_attrs
+
     changes: List[LineChange] = []
+    if coalesce:
+        groups = _group_line_diffs(marked_lines, file_diff.line_diffs, line_attrs)
+        for line_diffs in groups:
+            attrs = line_attrs(line_diffs[0].line_no)
+            changes.append(
+                _embed_decodiff_tag_block(marked_lines, line_diffs, attrs, embed_tags)
+            )
+        return changes
+
     for line_diff in file_diff.line_diffs:
         marked_line = marked_lines[line_diff.line_no - 1]
-        changd_line = _embed_decodiff_tag_line(marked_line, line_diff)
+        attrs = line_attrs(line_diff.line_no)
+        changd_line = _embed_decodiff_tag_line(
+            marked_line, line_diff, attrs, embed_tags
+        )
         if changd_line is not None:
             changes.append(changd_line)
 
     return changes
 
 
+def _decode_lines(blob: bytes) -> List[str]:
+    # same newline handling as reading the file in text mode
+    with io.TextIOWrapper(io.BytesIO(blob), encoding="utf-8") as f:
+        return [line.rstrip("\n") for line in f]
+
+
+def _make_file_change(
+    git_root_path: str,
+    file_diff: FileDiff,
+    coalesce: bool,
+    blob: Optional[bytes],
+    line_attrs: Optional[Callable[[str, int], Dict[str, str]]],
+    embed_tags: bool = True,
+) -> FileChange:
+    """Makes the change of a file, read from `blob` if it is not None"""
+
+    # removed file
+    if file_diff.to_file is None:
+        file_path = os.path.join(git_root_path, file_diff.from_file)
+        return FileChange(file_path, is_removed=True)
+
+    file_path = os.path.join(git_root_path, file_diff.to_file)
+
+    # added file
+    if file_diff.from_file is None:
+        return FileChange(file_path, is_added=True)
+
+    # changed file
+    # lines after the last change are not needed
+    last_line_no = max((d.line_no for d in file_diff.line_diffs), default=0)
+    if blob is not None:
+        marked_lines = mark_markdown_lines(_decode_lines(blob), last_line_no)
+    else:
+        marked_lines = mark_markdown(file_path, last_line_no)
+    file_line_attrs = None
+    if line_attrs is not None:
+        file_line_attrs = partial(line_attrs, file_diff.to_file)
+    try:
+        line_changes = embed_decodiff_tags(
+            marked_lines, file_diff, coalesce, file_line_attrs, embed_tags
+        )
+        head_line_count = count_head_lines(marked_lines)
+    finally:
+        close_marked_lines(marked_lines)
+    file_change = FileChange(
+        file_path, line_changes=line_changes, head_line_count=head_line_count
+    )
+    file_change.build_index()
+    return file_change
+
+
+def _is_changed(file_diff: FileDiff) -> bool:
+    """Returns True for a file that is neither added nor removed"""
+
+    return file_diff.from_file is not None and bool(file_diff.to_file)
+
+
+def _target_blob(
+    blobs: Dict[str, bytes], file_diff: FileDiff, target: str
+) -> Optional[bytes]:
+    if not _is_changed(file_diff):
+        return None
+    blob = blobs.get(file_diff.to_file)
+    if blob is None:
+        raise RuntimeError(f"{file_diff.to_file} is not found in {target}")
+    return blob
+
+
 def make_file_changes(
-    git_root_path: str, file_diffs: List[FileDiff]
+    git_root_path: str,
+    file_diffs: List[FileDiff],
+    coalesce: bool = False,
+    target: Optional[str] = None,
+    line_attrs: Optional[Callable[[str, int], Dict[str, str]]] = None,
+    processes: int = 1,
+    store: Optional["ChangeStore"] = None,
+    spill: bool = False,
+    embed_tags: bool = True,
 ) -> List[FileChange]:
-    file_changes: List[FileChange] = []
-    for file_diff in file_diffs:
-        # removed file
-        if file_diff.to_file is None:
-            file_path = os.path.join(git_root_path, file_diff.from_file)
-            file_changes.append(FileChange(file_path, is_removed=True))
-            continue
+    """Makes file changes from the diffs
 
-        file_path = os.path.join(git_root_path, file_diff.to_file)
+    The changed files are read from the working tree, or from the git objects
+    of `target` if it is given. `line_attrs` returns extra attributes of the
+    tag for a file path (relative to the git root) and a line number.
+    If `processes` is greater than 1, files are marked in a process pool and
+    `line_attrs` must be picklable.
+    If `store` is given, the changes are written to it as they are made, and
+    with `spill` the line changes are read back from it instead of being held.
+    With `embed_tags` False, the tagged lines are not built, see
+    `embed_decodiff_tags`.
+    """
 
-        # added file
-        if file_diff.from_file is None:
-            file_changes.append(FileChange(file_path, is_added=True))
+    blobs = {}
+    if target:
+        changed_files = [d.to_file for d in file_diffs if _is_changed(d)]
+        blobs = read_git_blobs(target, changed_files)
+
+    file_blobs = [
+        _target_blob(blobs, file_diff, target) if target else None
+        for file_diff in file_diffs
+    ]
+    args = (
+        repeat(git_root_path),
+        file_diffs,
+        repeat(coalesce),
+        file_blobs,
+        repeat(line_attrs),
+        repeat(embed_tags),
+    )
+    if processes > 1 and len(file_diffs) > 1:
+        chunksize = max(len(file_diffs) // (processes * 4), 1)
+        # workers are spawned, a forked worker would inherit the locks and
+        # threads of the build
+        with ProcessPoolExecutor(
+            max_workers=processes, mp_context=multiprocessing.get_context("spawn")
+        ) as executor:
+            file_changes = executor.map(_make_file_change, *args, chunksize=chunksize)
+            return _collect_file_changes(file_changes, store, spill)
+
+    return _collect_file_changes(map(_make_file_change, *args), store, spill)
+
+
+def _collect_file_changes(
+    file_changes: Iterator[FileChange], store: Optional["ChangeStore"], spill: bool
+) -> List[FileChange]:
+    if store is not None:
+        return store.write(file_changes, spill)
+    return list(file_changes)
+
+
+def make_file_level_changes(
+    git_root_path: str, name_status: List[Tuple[str, str]]
+) -> List[FileChange]:
+    """Makes file changes without line changes from git diff --name-status
+
+    Used when the line diff is too expensive. Only Markdown files are kept.
+    """
+
+    file_changes: List[FileChange] = []
+    for status, path in name_status:
+        if not path.endswith((".md", ".markdown")):
             continue
 
-        # changed file
-        marked_lines = mark_markdown(file_path)
-        line_changes = embed_decodiff_tags(marked_lines, file_diff)
-        file_changes.append(FileChange(file_path, line_changes=line_changes))
+        file_path = os.path.join(git_root_path, path)
+        if status == "A":
+            file_changes.append(FileChange(file_path, is_added=True))
+        elif status == "D":
+            file_changes.append(FileChange(file_path, is_removed=True))
+        else:
+            file_changes.append(FileChange(file_path, is_modified=True))
 
     return file_changes
+
+
+def iter_file_changes(
+    git_root_path: str,
+    base: str,
+    target_dir: Optional[str] = None,
+    word_diff: bool = False,
+    coalesce: bool = False,
+    target: Optional[str] = None,
+    line_attrs: Optional[Callable[[str, int], Dict[str, str]]] = None,
+) -> Iterator[FileChange]:
+    """Yields the file changes from `base` one file at a time
+
+    git diff runs in `git_root_path` and `target_dir` is relative to it. Each
+    file is marked and tagged when the consumer asks for it, so only one file
+    is held at a time. Closing the generator early stops git diff.
+    """
+
+    lines = stream_git_diff(
+        git_root_path,
+        base,
+        WordDiff.PORCELAIN if word_diff else WordDiff.NONE,
+        target_dir,
+        target,
+    )
+    if word_diff:
+        file_diffs = iter_porcelain_diff(lines)
+    else:
+        file_diffs = iter_unified_diff(lines)
+
+    # one git cat-file process for all files
+    reader = GitBlobReader(target, git_root_path) if target else None
+    try:
+        for file_diff in file_diffs:
+            blob = None
+            if reader is not None and _is_changed(file_diff):
+                blob = reader.read(file_diff.to_file)
+                if blob is None:
+                    raise RuntimeError(f"{file_diff.to_file} is not found in {target}")
+            yield _make_file_change(
+                git_root_path, file_diff, coalesce, blob, line_attrs
+            )
+    finally:
+        lines.close()
+        if reader is not None:
+            reader.close()
+
+
+async def aiter_file_changes(
+    git_root_path: str,
+    base: str,
+    target_dir: Optional[str] = None,
+    word_diff: bool = False,
+    coalesce: bool = False,
+    target: Optional[str] = None,
+    line_attrs: Optional[Callable[[str, int], Dict[str, str]]] = None,
+) -> AsyncIterator[FileChange]:
+    """Async variant of `iter_file_changes`
+
+    Each file is produced in a worker thread, so the event loop is not blocked
+    by git or by marking. git diff is stopped when the generator is closed
+    with `aclose()` (e.g. `contextlib.aclosing`) or the consuming task is
+    cancelled. Leaving `async for` alone does not close it.
+    """
+
+    file_changes = iter_file_changes(
+        git_root_path, base, target_dir, word_diff, coalesce, target, line_attrs
+    )
+    # one thread, so closing waits for the file being made
+    executor = ThreadPoolExecutor(max_workers=1)
+    loop = asyncio.get_running_loop()
+    try:
+        while True:
+            file_change = await loop.run_in_executor(executor, next, file_changes, None)
+            if file_change is None:
+                break
+            yield file_change
+    finally:
+        closing = loop.run_in_executor(executor, file_changes.close)
+        executor.shutdown(wait=False)
+        await closing
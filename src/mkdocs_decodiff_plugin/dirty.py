@@ -0,0 +1,43 @@
+import os
+from typing import Dict, Optional, Set
+
+from ._cache import DiskCache
+
+_CACHE_KEY = "dirty-pages"
+
+
+def load_fingerprints(cache: DiskCache, state: str) -> Optional[Dict[str, str]]:
+    """Returns the page fingerprints of the previous build
+
+    None is returned if there is no previous build with the same `state`
+    (plugin version and options affecting the output).
+    """
+
+    saved = cache.get_json(_CACHE_KEY)
+    if not isinstance(saved, dict) or saved.get("state") != state:
+        return None
+    return saved.get("pages", {})
+
+
+def save_fingerprints(cache: DiskCache, state: str, fingerprints: Dict[str, str]):
+    cache.put_json(_CACHE_KEY, {"state": state, "pages": fingerprints})
+
+
+def stale_pages(old: Dict[str, str], new: Dict[str, str]) -> Set[str]:
+    """Returns the pages whose annotations differ between two builds
+
+    Pages highlighted in only one of the builds are included.
+    """
+
+    return {p for p in old.keys() | new.keys() if old.get(p) != new.get(p)}
+
+
+def mark_for_rebuild(abs_src_path: str, abs_dest_path: str):
+    """Makes the built page older than its source, so --dirty rebuilds it"""
+
+    try:
+        mtime = os.path.getmtime(abs_src_path) - 1
+        if os.path.isfile(abs_dest_path):
+            os.utime(abs_dest_path, (mtime, mtime))
+    except OSError:
+        pass
@@ -0,0 +1,319 @@
+import os
+import re
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from ._cache import DiskCache
+from ._git_diff.git_diff import read_git_blobs
+from .decodiff import FileChange, LineChange, _decode_lines
+
+# --8<-- "file.md" (pymdownx.snippets)
+_SNIPPET_RE = re.compile(r"""^(\s*)-+8<-+\s+(["'])([^"']+)\2\s*$""")
+# {% include-markdown "file.md" %} (mkdocs-include-markdown-plugin)
+_INCLUDE_MARKDOWN_RE = re.compile(
+    r"""^(\s*)\{%\s*include(?:-markdown)?\s+(["'])([^"']+)\2\s*%\}\s*$"""
+)
+
+# Markdown links, images and link reference definitions
+_LINK_RE = re.compile(r"(!?\[[^\]]*\]\(\s*<?)([^)\s>]+)")
+_LINK_DEF_RE = re.compile(r"^(\s{0,3}\[[^\]]+\]:\s*<?)([^\s>]+)")
+# URLs with a scheme, absolute paths and fragments are not rewritten
+_ABS_URL_RE = re.compile(r"^(?:[a-zA-Z][\w+.-]*:|/|#)")
+# anchors of the tags of the included file, suffixed if it includes files too
+_ANCHOR_ID_RE = re.compile(r'"(decodiff-anchor-\d+(?:-include-\d+)*)"')
+
+SNIPPET = "snippet"
+INCLUDE_MARKDOWN = "include-markdown"
+
+_CACHE_KEY = "includes-index-2"
+
+# nested includes propagated, deeper ones (or cycles) are ignored
+_MAX_INCLUDE_DEPTH = 8
+
+
+@dataclass(frozen=True)
+class Include:
+    """Whole-file include directive"""
+
+    # directive line in the including file
+    line_no: int
+    indent: str
+    # real path of the included file
+    file_path: str
+    # SNIPPET or INCLUDE_MARKDOWN
+    kind: str = SNIPPET
+
+
+def _find_includes(file_path: str, base_dirs: List[str]) -> List[list]:
+    """Returns [line_no, indent, real path of the included file, kind]
+
+    Snippets are resolved from the `base_path` directories only, as
+    pymdownx.snippets does. include-markdown resolves a path from the
+    directory of the including file.
+    """
+
+    includes = []
+    with open(file_path, "r", encoding="utf-8") as f:
+        for line_no, line in enumerate(f, start=1):
+            if "8<" not in line and "{%" not in line:
+                continue
+
+            kind = SNIPPET
+            m = _SNIPPET_RE.match(line)
+            if not m:
+                kind = INCLUDE_MARKDOWN
+                m = _INCLUDE_MARKDOWN_RE.match(line)
+            if not m:
+                continue
+
+            # line ranges and sections (file.md:1:3) are not whole-file
+            name = m.group(3)
+            if re.search(r":[^/\\]*$", name) and not os.path.isabs(name):
+                continue
+
+            if kind == SNIPPET:
+                search_dirs = base_dirs
+            else:
+                search_dirs = [os.path.dirname(file_path)]
+            for base_dir in search_dirs:
+                path = os.path.join(base_dir, name)
+                if os.path.isfile(path):
+                    includes.append([line_no, m.group(1), os.path.realpath(path), kind])
+                    break
+
+    return includes
+
+
+class IncludeIndex:
+    """Reverse dependency index from included files to including pages
+
+    The docs tree is scanned once. Scan results are cached by file mtime and
+    size, so only modified pages are read again on the next build.
+    """
+
+    def __init__(
+        self,
+        docs_dir: str,
+        base_dirs: List[str],
+        cache: Optional[DiskCache] = None,
+    ):
+        self.docs_dir = os.path.normpath(docs_dir)
+        self.base_dirs = [os.path.normpath(d) for d in base_dirs]
+        self.cache = cache
+        self._includers: Dict[str, List[Tuple[str, Include]]] = {}
+
+    def build(self):
+        cached = {}
+        if self.cache is not None:
+            cached = self.cache.get_json(_CACHE_KEY) or {}
+            if cached.get("base_dirs") != self.base_dirs:
+                cached = {}
+        cached_files = cached.get("files", {})
+
+        files = {}
+        for dir_path, _, file_names in os.walk(self.docs_dir):
+            for file_name in file_names:
+                if not file_name.endswith((".md", ".markdown")):
+                    continue
+
+                path = os.path.join(dir_path, file_name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+
+                entry = cached_files.get(path)
+                if entry is None or entry[:2] != [st.st_mtime_ns, st.st_size]:
+                    try:
+                        includes = _find_includes(path, self.base_dirs)
+                    except (OSError, UnicodeDecodeError):
+                        continue
+                    entry = [st.st_mtime_ns, st.st_size, includes]
+                files[path] = entry
+
+        if self.cache is not None and files != cached_files:
+            self.cache.put_json(
+                _CACHE_KEY, {"base_dirs": self.base_dirs, "files": files}
+            )
+
+        self._includers = {}
+        for path, (_, _, includes) in files.items():
+            for line_no, indent, included_path, kind in includes:
+                self._includers.setdefault(included_path, []).append(
+                    (path, Include(line_no, indent, included_path, kind))
+                )
+
+    def includers(self, file_path: str) -> List[Tuple[str, Include]]:
+        """Returns the pages including the file and their include directives"""
+
+        return self._includers.get(os.path.realpath(file_path), [])
+
+
+def _make_tagged_lines(file_change: FileChange, blob: Optional[bytes]) -> List[str]:
+    """Returns all lines of the changed file with the tags embedded
+
+    The file is read from `blob` if it is not None.
+    """
+
+    if blob is not None:
+        lines = _decode_lines(blob)
+    else:
+        with open(file_change.file_path, "r", encoding="utf-8") as f:
+            lines = [line.rstrip("\n") for line in f]
+
+    # from the bottom, a tagged line can contain several lines
+    for line_change in reversed(file_change.line_changes):
+        i = line_change.line_no - 1
+        lines[i : i + line_change.line_count] = line_change.tagged_line.split("\n")
+
+    return lines
+
+
+def _rewrite_url(url: str, from_dir: str, to_dir: str) -> str:
+    if _ABS_URL_RE.match(url):
+        return url
+    # query and fragment are kept
+    path, rest = re.match(r"([^?#]*)(.*)$", url).groups()
+    if not path:
+        return url
+    path = os.path.relpath(os.path.join(from_dir, path), to_dir)
+    return path.replace(os.sep, "/") + rest
+
+
+def rewrite_relative_urls(line: str, from_dir: str, to_dir: str) -> str:
+    """Rewrites relative link and image URLs of a line in `from_dir` to `to_dir`
+
+    Same as include-markdown does for the included content.
+    """
+
+    def rewrite(m: re.Match) -> str:
+        return m.group(1) + _rewrite_url(m.group(2), from_dir, to_dir)
+
+    line = _LINK_DEF_RE.sub(rewrite, line)
+    return _LINK_RE.sub(rewrite, line)
+
+
+def _read_line(file_path: str, line_no: int) -> Optional[str]:
+    with open(file_path, "r", encoding="utf-8") as f:
+        for i, line in enumerate(f, start=1):
+            if i == line_no:
+                return line.rstrip("\n")
+    return None
+
+
+def _git_path(file_path: str, git_root_path: str) -> str:
+    return os.path.relpath(file_path, git_root_path).replace(os.sep, "/")
+
+
+def propagate_includes(
+    file_changes: List[FileChange],
+    index: IncludeIndex,
+    git_root_path: Optional[str] = None,
+    target: Optional[str] = None,
+) -> List[FileChange]:
+    """Propagates changes of included files to the including pages
+
+    The include directive of a page is replaced with the tagged content of the
+    changed file, so the highlights appear where the content is included.
+    The anchors get the line of the directive as a suffix, unique on the page.
+    Relative URLs of include-markdown content are rewritten to the page.
+    The included files are read from `target` if it is given, like
+    `make_file_changes` does. Nested includes are propagated up to
+    `_MAX_INCLUDE_DEPTH` levels.
+    """
+
+    result = list(file_changes)
+    by_path = {os.path.realpath(c.file_path): c for c in result}
+    changed = [
+        c for c in result if not c.is_removed and not c.is_added and c.line_changes
+    ]
+    for _ in range(_MAX_INCLUDE_DEPTH):
+        changed = _propagate_once(
+            changed, by_path, result, index, git_root_path, target
+        )
+        if not changed:
+            break
+
+    return result
+
+
+def _propagate_once(
+    changed: List[FileChange],
+    by_path: Dict[str, FileChange],
+    result: List[FileChange],
+    index: IncludeIndex,
+    git_root_path: Optional[str],
+    target: Optional[str],
+) -> List[FileChange]:
+    """Propagates the changed files to their including pages
+
+    The pages are added to `result` and `by_path` if they have no changes yet.
+    Returns the pages whose changes are updated.
+    """
+
+    included = [c for c in changed if index.includers(c.file_path)]
+
+    blobs: Dict[str, bytes] = {}
+    if target and included:
+        blobs = read_git_blobs(
+            target,
+            [_git_path(c.file_path, git_root_path) for c in included],
+            git_root_path,
+        )
+
+    new_changes: Dict[str, List[LineChange]] = {}
+    for file_change in included:
+        blob = None
+        if target:
+            blob = blobs.get(_git_path(file_change.file_path, git_root_path), b"")
+        tagged_lines = _make_tagged_lines(file_change, blob)
+        included_dir = os.path.dirname(os.path.realpath(file_change.file_path))
+        first = file_change.line_changes[0]
+        for page_path, include in index.includers(file_change.file_path):
+            directive = _read_line(page_path, include.line_no)
+            if directive is None:
+                continue
+
+            suffix = f"-include-{include.line_no}"
+            page_dir = os.path.dirname(os.path.realpath(page_path))
+            lines = []
+            for line in tagged_lines:
+                line = _ANCHOR_ID_RE.sub(rf'"\1{suffix}"', line)
+                if include.kind == INCLUDE_MARKDOWN:
+                    line = rewrite_relative_urls(line, included_dir, page_dir)
+                # included lines are indented like the directive
+                lines.append(include.indent + line if line else line)
+
+            new_changes.setdefault(page_path, []).append(
+                LineChange(
+                    include.line_no,
+                    directive,
+                    "\n".join(lines),
+                    first.anchor + suffix,
+                    text=first.text,
+                    attrs=first.attrs,
+                )
+            )
+
+    updated = []
+    for page_path, line_changes in new_changes.items():
+        real_path = os.path.realpath(page_path)
+        page_change = by_path.get(real_path)
+        if page_change is None:
+            page_change = FileChange(page_path)
+            by_path[real_path] = page_change
+            result.append(page_change)
+        elif page_change.is_added:
+            continue
+
+        # the directive line itself is not a changed line of the page
+        lines = {c.line_no for c in line_changes}
+        page_change.line_changes = sorted(
+            [c for c in page_change.line_changes if c.line_no not in lines]
+            + line_changes,
+            key=lambda c: c.line_no,
+        )
+        page_change.build_index()
+        updated.append(page_change)
+
+    return updated
@@ -0,0 +1,86 @@
+from bisect import bisect_left
+from typing import Dict, List, Tuple
+
+
+def _unique_pairs(old: List[str], new: List[str]) -> List[Tuple[int, int]]:
+    """Returns (old index, new index) of lines occurring once on both sides"""
+
+    # line -> [count in old, count in new, index in old, index in new]
+    counts: Dict[str, list] = {}
+    for i, line in enumerate(old):
+        c = counts.setdefault(line, [0, 0, i, -1])
+        c[0] += 1
+    for j, line in enumerate(new):
+        c = counts.get(line)
+        if c is not None:
+            c[1] += 1
+            c[3] = j
+
+    return sorted((c[2], c[3]) for c in counts.values() if c[0] == 1 and c[1] == 1)
+
+
+def _longest_increasing(pairs: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    """Returns the longest subsequence of pairs increasing in the new index"""
+
+    tails: List[int] = []  # new index of the last pair of each length
+    tail_pairs: List[int] = []  # pair index of the last pair of each length
+    prev = [-1] * len(pairs)
+    for k, (_, j) in enumerate(pairs):
+        n = bisect_left(tails, j)
+        if n > 0:
+            prev[k] = tail_pairs[n - 1]
+        if n == len(tails):
+            tails.append(j)
+            tail_pairs.append(k)
+        else:
+            tails[n] = j
+            tail_pairs[n] = k
+
+    result = []
+    k = tail_pairs[-1] if tail_pairs else -1
+    while k >= 0:
+        result.append(pairs[k])
+        k = prev[k]
+    result.reverse()
+    return result
+
+
+def align_lines(old: List[str], new: List[str]) -> List[int]:
+    """Maps each old line index to the same line in new, -1 if there is none
+
+    Lines unique on both sides are matched first (like patience diff), and the
+    matches are extended to the equal lines around them. Lines inserted or
+    removed by other plugins do not shift the mapping of the others.
+    """
+
+    mapping = [-1] * len(old)
+    used = [False] * len(new)
+
+    def match(i: int, j: int) -> bool:
+        if (
+            0 <= i < len(old)
+            and 0 <= j < len(new)
+            and mapping[i] < 0
+            and not used[j]
+            and old[i] == new[j]
+        ):
+            mapping[i] = j
+            used[j] = True
+            return True
+        return False
+
+    anchors = _longest_increasing(_unique_pairs(old, new))
+    for i, j in anchors:
+        match(i, j)
+
+    # extend from the anchors and from both ends of the files
+    for i, j in [(-1, -1), *anchors]:
+        k = 1
+        while match(i + k, j + k):
+            k += 1
+    for i, j in [*anchors, (len(old), len(new))]:
+        k = 1
+        while match(i - k, j - k):
+            k += 1
+
+    return mapping
@@ -1,7 +1,16 @@
+import mmap
+import os
 import re
-from dataclasses import dataclass, field
+from array import array
+from collections.abc import Sequence
+from dataclasses import dataclass, field, replace
 from enum import Enum
-from typing import List
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+# files of this size or larger are marked from a memory map
+_MMAP_MIN_SIZE = 4 * 1024 * 1024
+# line ends of text mode (universal newlines)
+_LINE_END_RE = re.compile(rb"\r\n|\r|\n")
 
 
 class MdLineType(Enum):
@@ -23,10 +32,20 @@ class MdLineType(Enum):
 
 @dataclass(frozen=True)
 class MdLine:
-    """Markdown line"""
+    """Markdown line
+
+    ``block_id`` identifies the block (paragraph, list item, quote, ...) the
+    line belongs to. Lines sharing a ``block_id`` are rendered together.
+    ``content_col`` is the column after the leading markup (``# ``, ``* ``,
+    ``1. ``, ``> ``) and ``depth`` is the heading level, the list nesting
+    level or the number of quote markers.
+    """
 
     line: str
     line_type: int
+    block_id: int = 0
+    content_col: int = 0
+    depth: int = 0
 
     def is_empty(self) -> bool:
         return self.line_type & MdLineType.EMPTY.value
@@ -109,6 +128,12 @@ class MdMarkContext:
     html_start_tag = None
     html_tag_count = 0
 
+    block_id = 0
+    # indents of the enclosing list items
+    list_indents: tuple = ()
+    # depth of the last line
+    depth = 0
+
     def set(
         self,
         in_quote=False,
@@ -130,10 +155,21 @@ class MdMarkContext:
         self.in_meta = in_meta
 
 
+def _list_depth(ctx: MdMarkContext, indent: int) -> int:
+    """Returns the nesting level of a list item and updates the indent stack"""
+
+    ctx.list_indents = (*(i for i in ctx.list_indents if i < indent), indent)
+    return len(ctx.list_indents)
+
+
 def _mark_markdown_line(ctx: MdMarkContext, line_no: int, line: str):
     """Mark a single line"""
 
     line_type = 0
+    new_block = False
+    content_col = 0
+    depth = 0
+    is_empty_prev_line = ctx.lines and ctx.lines[-1].line_type & MdLineType.EMPTY.value
 
     if ctx.in_indent_code_block and not line.startswith("    "):
         ctx.in_indent_code_block = False
@@ -143,6 +179,7 @@ def _mark_markdown_line(ctx: MdMarkContext, line_no: int, line: str):
     if line_no == 1 and re.search(r"^---\s*$", line):
         ctx.in_meta = True
         line_type |= MdLineType.META.value
+        new_block = True
     elif ctx.in_meta:
         line_type |= MdLineType.META.value
         if re.search(r"^(---|...)\s*$", line):
@@ -158,20 +195,28 @@ def _mark_markdown_line(ctx: MdMarkContext, line_no: int, line: str):
             line_type |= MdLineType.CODE_BLOCK.value
         else:
             line_type |= MdLineType.HTML_COMMENT.value
+            new_block = True
             if "-->" not in line:
                 ctx.set(in_html_comment=True)
     # header
-    elif re.search(r"^#+ ", line):
+    elif m := re.match(r"^(#+) ", line):
+        content_col = m.end()
+        depth = len(m.group(1))
         if not ctx.in_code_block:
             line_type |= MdLineType.HEADING.value
+            new_block = True
             ctx.set()
     # blockquotes
-    elif re.search(r"^> ", line):
+    elif m := re.match(r"^> ", line):
+        content_col = m.end()
+        depth = re.match(r"^(>\s*)+", line).group().count(">")
         if not ctx.in_code_block:
             line_type |= MdLineType.QUOTE.value
+            new_block = not ctx.in_quote or is_empty_prev_line
             ctx.set(in_quote=True)
     # bulleted list
     elif m := re.match(r"^(\s*)[*\-+] (\[[ xX]\] )?", line):
+        content_col = m.end()
         if m.group(1) == "":
             line_type |= MdLineType.LIST.value
             ctx.set(in_list=True)
@@ -185,20 +230,29 @@ def _mark_markdown_line(ctx: MdMarkContext, line_no: int, line: str):
         if not ctx.in_code_block:
             if m.group(1) == "":
                 line_type |= MdLineType.LIST.value
+                new_block = True
                 ctx.set(in_list=True)
+                depth = _list_depth(ctx, 0)
             elif ctx.in_list:
                 line_type |= MdLineType.LIST.value
+                new_block = True
                 ctx.set(in_list=True)
+                depth = _list_depth(ctx, len(m.group(1)))
 
     # numbered list
     elif m := re.match(r"^(\s*)\d+[.)] ", line):
+        content_col = m.end()
         if not ctx.in_code_block:
             if m.group(1) == "":
                 line_type |= MdLineType.LIST.value
+                new_block = True
                 ctx.set(in_list=True)
+                depth = _list_depth(ctx, 0)
             elif ctx.in_list:
                 line_type |= MdLineType.LIST.value
+                new_block = True
                 ctx.set(in_list=True)
+                depth = _list_depth(ctx, len(m.group(1)))
 
     # fenced code block
     elif re.search(r"^\s*```", line):
@@ -206,14 +260,13 @@ def _mark_markdown_line(ctx: MdMarkContext, line_no: int, line: str):
         ctx.in_code_block = not ctx.in_code_block
 
         if ctx.in_code_block:
+            new_block = True
             ctx.set(in_code_block=ctx.in_code_block)
     # indent code block
     elif re.search(r"^    .*", line):
-        is_empty_prev_line = (
-            ctx.lines and ctx.lines[-1].line_type & MdLineType.EMPTY.value
-        )
         if is_empty_prev_line:
             line_type |= MdLineType.CODE_BLOCK.value
+            new_block = not ctx.in_code_block
             ctx.set(in_code_block=True, in_indent_code_block=True)
         elif ctx.in_list:
             line_type |= MdLineType.LIST.value
@@ -223,23 +276,29 @@ def _mark_markdown_line(ctx: MdMarkContext, line_no: int, line: str):
             line_type |= MdLineType.HTML.value
         else:
             line_type |= MdLineType.CODE_BLOCK.value
+            new_block = not ctx.in_code_block
             ctx.set(in_code_block=True, in_indent_code_block=True)
     # horizontal rule
     elif re.search(r"^([\*\-_]\s*){3,}$", line):
         if not ctx.in_code_block:
             line_type |= MdLineType.H_RULE.value
+            new_block = True
             ctx.set()
     # table
     elif re.search(r"^(\|[ \t\-:|]*|[-:][-:| ]*)$", line):
         if not ctx.in_code_block:
             line_type |= MdLineType.TABLE.value
+            new_block = True
             ctx.set(in_table=True)
 
             if ctx.lines:
                 prev_line = ctx.lines[-1]
                 if re.search(r"^(\|)?.*\|.*", prev_line.line):
-                    ctx.lines[-1] = MdLine(
-                        prev_line.line, prev_line.line_type | MdLineType.TABLE.value
+                    # the header row belongs to the table block
+                    new_block = False
+                    ctx.lines[-1] = replace(
+                        prev_line,
+                        line_type=prev_line.line_type | MdLineType.TABLE.value,
                     )
     # table row
     elif re.search(r"^(\|)?.*\|.*", line):
@@ -254,6 +313,7 @@ def _mark_markdown_line(ctx: MdMarkContext, line_no: int, line: str):
             tags = re.findall(r"<(.*?)[ >]", line)
 
             if not ctx.in_html:
+                new_block = True
                 ctx.set(in_html=True)
 
             for tag in tags:
@@ -277,9 +337,6 @@ def _mark_markdown_line(ctx: MdMarkContext, line_no: int, line: str):
         line_type |= MdLineType.EMPTY.value
     # paragraph
     elif re.search(r"^[^\s]", line):
-        is_empty_prev_line = (
-            ctx.lines and ctx.lines[-1].line_type & MdLineType.EMPTY.value
-        )
         if ctx.in_code_block and not is_empty_prev_line:
             line_type |= MdLineType.CODE_BLOCK.value
         elif ctx.in_list and not is_empty_prev_line:
@@ -292,6 +349,7 @@ def _mark_markdown_line(ctx: MdMarkContext, line_no: int, line: str):
             if is_empty_prev_line:
                 ctx.set()
             line_type |= MdLineType.PARAGRAPH.value
+            new_block = not (ctx.lines and ctx.lines[-1].is_paragraph())
     # indented text
     elif re.search(r"^\s+[^\s]", line):
         if ctx.in_code_block:
@@ -303,27 +361,194 @@ def _mark_markdown_line(ctx: MdMarkContext, line_no: int, line: str):
         elif ctx.in_html:
             line_type |= MdLineType.HTML.value
 
-    ctx.lines.append(MdLine(line, line_type))
+    if new_block:
+        ctx.block_id += 1
+
+    # continuation lines are nested like the item or quote they belong to
+    if depth == 0 and line_type & (MdLineType.LIST.value | MdLineType.QUOTE.value):
+        depth = ctx.depth
+    ctx.depth = depth
+
+    ctx.lines.append(MdLine(line, line_type, ctx.block_id, content_col, depth))
+
+
+class MappedMdLines(Sequence):
+    """Marked lines backed by a memory-mapped file
+
+    Only the byte offsets and the structural metadata of the lines are kept
+    in arrays. The text of a line is decoded from the buffer when it is
+    accessed, and the offsets are indexed as far as the lines are read.
+    Lines end as in text mode. The lines are readable until `close`.
+    """
+
+    def __init__(self, buf):
+        self._buf = buf
+        # start offset of each indexed line, then the end of the last one
+        self._offsets = array("q", [0])
+        self._line_ends = _LINE_END_RE.finditer(buf)
+        self._is_indexed = len(buf) == 0
+        self._line_types = array("H")
+        self._block_ids = array("I")
+        self._content_cols = array("I")
+        self._depths = array("H")
+
+    def close(self):
+        if isinstance(self._buf, mmap.mmap):
+            self._buf.close()
+
+    def __enter__(self) -> "MappedMdLines":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _index_lines(self, count: int) -> bool:
+        """Indexes the first `count` lines, returns False if there are fewer"""
+
+        while len(self._offsets) <= count and not self._is_indexed:
+            m = next(self._line_ends, None)
+            if m is not None:
+                self._offsets.append(m.end())
+                continue
+            # last line without a line end
+            if self._offsets[-1] < len(self._buf):
+                self._offsets.append(len(self._buf))
+            self._is_indexed = True
+        return len(self._offsets) > count
+
+    @property
+    def line_count(self) -> int:
+        """Number of lines in the buffer"""
+
+        self._index_lines(len(self._buf) + 1)
+        return len(self._offsets) - 1
+
+    def text(self, index: int) -> str:
+        """Decodes the line at `index` from the buffer"""
+
+        if not self._index_lines(index + 1):
+            raise IndexError("line index out of range")
+        line = self._buf[self._offsets[index] : self._offsets[index + 1]]
+        return line.decode("utf-8").rstrip("\r\n")
+
+    def iter_text(self) -> Iterator[str]:
+        i = 0
+        while self._index_lines(i + 1):
+            yield self.text(i)
+            i += 1
+
+    def append(self, md_line: MdLine):
+        self._line_types.append(md_line.line_type)
+        self._block_ids.append(md_line.block_id)
+        self._content_cols.append(md_line.content_col)
+        self._depths.append(md_line.depth)
+
+    def __len__(self) -> int:
+        return len(self._line_types)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("line index out of range")
+        return MdLine(
+            self.text(index),
+            self._line_types[index],
+            self._block_ids[index],
+            self._content_cols[index],
+            self._depths[index],
+        )
 
+    def __setitem__(self, index: int, md_line: MdLine):
+        self._line_types[index] = md_line.line_type
+        self._block_ids[index] = md_line.block_id
+        self._content_cols[index] = md_line.content_col
+        self._depths[index] = md_line.depth
 
-def mark_markdown_lines(lines: List[str]) -> List[MdLine]:
-    """Mark markdown lines"""
 
-    ctx = MdMarkContext()
-    for line_no, line in enumerate(lines, start=1):
+def _mark_lines(
+    ctx: MdMarkContext,
+    numbered_lines: Iterable[Tuple[int, str]],
+    last_line_no: Optional[int],
+):
+    for line_no, line in numbered_lines:
         _mark_markdown_line(ctx, line_no, line)
 
+        # A table header is marked when the next line is read
+        if last_line_no is not None and line_no > last_line_no:
+            break
+
+
+def mark_markdown_lines(
+    lines: List[str],
+    last_line_no: Optional[int] = None,
+) -> List[MdLine]:
+    """Mark markdown lines
+
+    Marking stops soon after `last_line_no` if it is given.
+    """
+
+    ctx = MdMarkContext()
+    _mark_lines(ctx, enumerate(lines, start=1), last_line_no)
+
+    return ctx.lines
+
+
+def mark_markdown_mmap(
+    file_path: str,
+    last_line_no: Optional[int] = None,
+) -> MappedMdLines:
+    """Mark markdown from a memory-mapped file
+
+    Lines are decoded one by one while marking and are not kept, so the extra
+    memory is a few bytes per line regardless of the line length. The file
+    stays mapped until the returned lines are closed.
+    """
+
+    with open(file_path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            buf = b""
+        else:
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    ctx = MdMarkContext(lines=MappedMdLines(buf))
+    numbered_lines = enumerate(ctx.lines.iter_text(), start=1)
+    try:
+        _mark_lines(ctx, numbered_lines, last_line_no)
+    except BaseException:
+        ctx.lines.close()
+        raise
+
     return ctx.lines
 
 
-def mark_markdown(file_path: str) -> List[MdLine]:
-    """Mark markdown"""
+def close_marked_lines(marked_lines: List[MdLine]):
+    """Releases the file of lines marked by `mark_markdown`, if it is mapped"""
+
+    if isinstance(marked_lines, MappedMdLines):
+        marked_lines.close()
+
+
+def mark_markdown(
+    file_path: str,
+    last_line_no: Optional[int] = None,
+) -> List[MdLine]:
+    """Mark markdown
+
+    Pass the lines to `close_marked_lines` when they are no longer used.
+    """
+
+    if os.path.getsize(file_path) >= _MMAP_MIN_SIZE:
+        return mark_markdown_mmap(file_path, last_line_no)
 
     lines: list[MdLine] = []
     with open(file_path, "r", encoding="utf-8") as f:
         ctx = MdMarkContext()
-        for line_no, line in enumerate(f, start=1):
-            _mark_markdown_line(ctx, line_no, line.rstrip("\n"))
+        numbered_lines = enumerate((line.rstrip("\n") for line in f), start=1)
+        _mark_lines(ctx, numbered_lines, last_line_no)
 
         lines = ctx.lines
     return lines
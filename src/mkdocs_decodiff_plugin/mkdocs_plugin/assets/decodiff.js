@@ -0,0 +1,126 @@
+/*
+ * Applies decodiff highlights from manifest.json (mode: manifest).
+ *
+ * Highlighting can be toggled without a rebuild:
+ *   ?decodiff=off / ?decodiff=on (remembered in localStorage)
+ */
+(function () {
+    "use strict";
+
+    const script = document.currentScript;
+    if (!script) {
+        return;
+    }
+
+    const params = new URLSearchParams(location.search);
+    if (params.has("decodiff")) {
+        localStorage.setItem("decodiff", params.get("decodiff"));
+    }
+    if (localStorage.getItem("decodiff") === "off") {
+        return;
+    }
+
+    const manifestUrl = new URL("manifest.json", script.src);
+    const siteRoot = new URL("../../", script.src);
+
+    function normalize(text) {
+        return text.replace(/\s+/g, " ").trim();
+    }
+
+    function pageKeys() {
+        let path = decodeURI(location.pathname);
+        const root = decodeURI(siteRoot.pathname);
+        if (path.startsWith(root)) {
+            path = path.substring(root.length);
+        }
+        return [path, path.replace(/index\.html$/, "")];
+    }
+
+    function findBlock(text) {
+        const blocks = document.querySelectorAll(
+            "h1, h2, h3, h4, h5, h6, p, li, dt, dd"
+        );
+        let found = null;
+        for (const block of blocks) {
+            if (normalize(block.textContent).includes(text)) {
+                // prefer the innermost block, e.g. a nested list item
+                found = block;
+            }
+        }
+        return found;
+    }
+
+    // attributes of the tag, e.g. the classes of `age` and the commit of
+    // `history`
+    function setAttrs(element, attrs) {
+        for (const [name, value] of Object.entries(attrs || {})) {
+            if (name === "class") {
+                element.classList.add(...value.split(/\s+/).filter(Boolean));
+            } else {
+                element.setAttribute(name, value);
+            }
+        }
+    }
+
+    function wrapText(block, text, anchor, attrs) {
+        const walker = document.createTreeWalker(block, NodeFilter.SHOW_TEXT);
+        while (walker.nextNode()) {
+            const node = walker.currentNode;
+            const start = node.data.indexOf(text);
+            if (start < 0) {
+                continue;
+            }
+            const target = node.splitText(start);
+            target.splitText(text.length);
+            const span = document.createElement("span");
+            span.id = anchor;
+            span.className = "decodiff";
+            setAttrs(span, attrs);
+            target.parentNode.replaceChild(span, target);
+            span.appendChild(target);
+            return true;
+        }
+        return false;
+    }
+
+    function apply(changes) {
+        for (const change of changes) {
+            const text = normalize(change.text);
+            if (!text) {
+                continue;
+            }
+            const block = findBlock(text);
+            if (block === null) {
+                continue;
+            }
+            // the text spans inline elements, highlight the whole block
+            if (!wrapText(block, text, change.anchor, change.attrs)) {
+                block.id = block.id || change.anchor;
+                block.classList.add("decodiff");
+                setAttrs(block, change.attrs);
+            }
+        }
+
+        if (location.hash) {
+            const target = document.getElementById(location.hash.substring(1));
+            if (target) {
+                target.scrollIntoView();
+            }
+        }
+    }
+
+    fetch(manifestUrl)
+        .then((res) => (res.ok ? res.json() : null))
+        .then((manifest) => {
+            if (!manifest) {
+                return;
+            }
+            for (const key of pageKeys()) {
+                if (key in manifest.pages) {
+                    apply(manifest.pages[key]);
+                    break;
+                }
+            }
+        })
+        .catch(() => {});
+})();
@@ -12,27 +12,61 @@ plugins:
 
 from __future__ import annotations
 
+import hashlib
+import json
 import os
 import re
 import subprocess
 import sys
+import time
 from dataclasses import dataclass, field
-from typing import List, Optional
+from typing import Dict, List, Optional, Tuple
 
 try:
     import mkdocs
     from mkdocs.structure.pages import Page
+    from mkdocs.utils import get_relative_url
 except Exception:
     BasePlugin = object
 
-from .._git_diff.git_diff import FileDiff, WordDiff, run_git_diff
-from .._git_diff.parse_porcelain_diff import parse_porcelain_diff
-from .._git_diff.parse_unified_diff import parse_unified_diff
+from .. import __version__
+from .._cache import DiskCache
+from .._git_diff.git_blame import read_line_times
+from .._git_diff.git_diff import (
+    FileDiff,
+    GitBudget,
+    GitBudgetExceeded,
+    WordDiff,
+    file_diffs_from_json,
+    file_diffs_to_json,
+    run_git_diff,
+    run_git_diff_name_status,
+    stream_git_diff,
+)
+from .._git_diff.git_log import UNCOMMITTED, LineHistory, read_line_history
+from .._git_diff.git_repo import find_git_repo
+from .._git_diff.parse_porcelain_diff import iter_porcelain_diff, parse_porcelain_diff
+from .._git_diff.parse_unified_diff import iter_unified_diff, parse_unified_diff
+from .._git_diff.sharded_diff import run_sharded_git_diff
+from ..change_store import ChangeStore
+from ..daemon import query_daemon
 from ..decodiff import (
     FileChange,
     LineChange,
     make_file_changes,
+    make_file_level_changes,
+)
+from ..dirty import (
+    load_fingerprints,
+    mark_for_rebuild,
+    save_fingerprints,
+    stale_pages,
 )
+from ..includes import IncludeIndex, propagate_includes
+from ..line_align import align_lines
+from ..nav_rollup import NavChanges, page_changes, rollup_nav
+from ..page_index import PageIndex, page_cache_key
+from ..planner import BuildStats, Plan, load_stats, make_plan, save_stats
 
 
 @dataclass
@@ -45,6 +79,13 @@ class ChangeListItem:
 _DECODIFF_CHANGE_LIST_START = "<!-- decodiff: Written by decodiff from here -->"
 _DECODIFF_CHANGE_LIST_END = "<!-- decodiff: end -->"
 
+# size limit of the cached diffs between two commits
+_DIFF_CACHE_MAX_BYTES = 64 * 1024 * 1024
+# seconds to wait for the daemon without `timeout`
+_DAEMON_TIMEOUT = 600
+# seconds the daemon may take to mark the files after git diff
+_DAEMON_MARK_TIMEOUT = 60
+
 
 def _make_change_list_md(
     change_list_file_path: str, file_changes: List[FileChange]
@@ -66,17 +107,150 @@ def _make_change_list_md(
             md += "* New\n"
             continue
 
+        # changed file without line changes
+        if file_change.is_modified:
+            md += "* Changed\n"
+            continue
+
         # changed file
-        for line_change in file_change.line_changes:
-            text = line_change.line.strip()
-            text = f"{text[:40]}{'...' if len(text) > 40 else ''}"
+        md += _make_line_change_list_md(relpath, file_change.line_changes)
+
+    return md
+
 
-            md += f"* [{text}]({relpath}#{line_change.anchor})\n"
+def _make_line_change_list_md(relpath: str, line_changes: List[LineChange]) -> str:
+    md = ""
+    for line_change in line_changes:
+        # the line of an included change is the include directive
+        text = (line_change.text or line_change.line).partition("\n")[0].strip()
+        text = f"{text[:40]}{'...' if len(text) > 40 else ''}"
+
+        md += f"* [{text}]({relpath}#{line_change.anchor})\n"
 
     return md
 
 
+def _make_history_change_list_md(
+    change_list_file_path: str, file_changes: List[FileChange], history: LineHistory
+) -> str:
+    """Makes the change list grouped by the commit of each change"""
+
+    # sections: uncommitted changes, commits from newest, then the rest
+    sections = {"uncommitted": f"## {UNCOMMITTED.subject}\n\n"}
+    for commit in reversed(history.commits):
+        sections[commit.sha] = f"## {commit.subject} (`{commit.short_sha}`)\n\n"
+    sections[""] = "## Other changes\n\n"
+
+    mds = dict.fromkeys(sections, "")
+    new_files_md = ""
+    change_list_file_dir = os.path.dirname(change_list_file_path)
+    for file_change in file_changes:
+        # ignore removed file
+        if file_change.is_removed:
+            continue
+
+        relpath = os.path.relpath(file_change.file_path, change_list_file_dir)
+
+        # added file
+        if file_change.is_added:
+            new_files_md += f"* [{relpath}]({relpath})\n"
+            continue
+
+        # changed file without line changes
+        if file_change.is_modified:
+            mds[""] += f"### [{relpath}]({relpath})\n\n* Changed\n\n"
+            continue
+
+        # changed file
+        by_commit: Dict[str, List[LineChange]] = {}
+        for line_change in file_change.line_changes:
+            sha = line_change.attrs.get("data-decodiff-commit", "")
+            by_commit.setdefault(sha if sha in mds else "", []).append(line_change)
+        for sha, line_changes in by_commit.items():
+            mds[sha] += f"### [{relpath}]({relpath})\n\n"
+            mds[sha] += _make_line_change_list_md(relpath, line_changes) + "\n"
+
+    md = ""
+    if new_files_md:
+        md += f"## New files\n\n{new_files_md}\n"
+    for sha, section_md in mds.items():
+        if section_md:
+            md += sections[sha] + section_md
+
+    return "\n" + md if md else md
+
+
+def _plain_text(md: str) -> str:
+    """Strips common inline markup to match the rendered text"""
+
+    # links and images
+    text = re.sub(r"!?\[([^\]]*)\]\([^)]*\)", r"\1", md)
+    # inline HTML
+    text = re.sub(r"<[^>]+>", "", text)
+    # emphasis, code and strikethrough
+    text = re.sub(r"\*{1,3}|_{2,3}|`+|~~", "", text)
+    return text
+
+
+def _make_manifest_entries(file_change: FileChange) -> List[dict]:
+    return [
+        {
+            "anchor": line_change.anchor,
+            "line_no": line_change.line_no,
+            "line_count": line_change.line_count,
+            "text": _plain_text(line_change.text),
+            "attrs": line_change.attrs,
+        }
+        for line_change in file_change.line_changes
+    ]
+
+
+def _manifest_key(url: str) -> str:
+    """Returns the manifest key of a page URL, relative to the site root
+
+    The URL of the home page is "./" with directory URLs.
+    """
+
+    return url[2:] if url.startswith("./") else url
+
+
+def _locate_line_changes(
+    line_changes: List[LineChange], md_lines: List[str], raw_md: str, offset: int
+) -> List[Tuple[int, LineChange]]:
+    """Returns the indexes in `md_lines` of the changed lines
+
+    The lines are expected `offset` lines above their line numbers in the file.
+    If other plugins have inserted or removed lines, the lines are realigned
+    with the file, and changes whose lines are not found are dropped.
+    """
+
+    def matches(i: int, line_change: LineChange) -> bool:
+        lines = md_lines[i : i + line_change.line_count]
+        return lines == line_change.line.split("\n")
+
+    located = [(c.line_no - offset - 1, c) for c in line_changes]
+    if all(i >= 0 and matches(i, c) for i, c in located):
+        return located
+
+    mapping = align_lines(raw_md.splitlines(), md_lines)
+    located = []
+    for line_change in line_changes:
+        if line_change.line_no > len(mapping):
+            continue
+        i = mapping[line_change.line_no - 1]
+        if i >= 0 and matches(i, line_change):
+            located.append((i, line_change))
+
+    return located
+
+
 def _get_git_root_dir() -> Optional[str]:
+    # without running git, unless git is configured by the environment
+    if "GIT_DIR" not in os.environ and "GIT_WORK_TREE" not in os.environ:
+        repo = find_git_repo(os.getcwd())
+        if repo is not None:
+            return repo.root
+
     try:
         root = subprocess.check_output(
             ["git", "rev-parse", "--show-toplevel"], text=True
@@ -88,9 +262,41 @@ def _get_git_root_dir() -> Optional[str]:
 
 class DecodiffPluginConfig(mkdocs.config.base.Config):
     base = mkdocs.config.config_options.Type(str, default="main")
+    target = mkdocs.config.config_options.Optional(
+        mkdocs.config.config_options.Type(str)
+    )
     dir = mkdocs.config.config_options.Type(str, default="docs")
     change_list_file = mkdocs.config.config_options.Type(str, default="docs/changes.md")
     word_diff = mkdocs.config.config_options.Type(bool, default=False)
+    history = mkdocs.config.config_options.Type(bool, default=False)
+    age = mkdocs.config.config_options.Type(bool, default=False)
+    age_buckets = mkdocs.config.config_options.Type(list, default=[1, 7, 30, 90, 365])
+    blame_jobs = mkdocs.config.config_options.Type(int, default=4)
+    cache_dir = mkdocs.config.config_options.Type(str, default=".cache/decodiff")
+    includes = mkdocs.config.config_options.Type(bool, default=False)
+    coalesce = mkdocs.config.config_options.Type(bool, default=False)
+    jobs = mkdocs.config.config_options.Type(int, default=1)
+    daemon_socket = mkdocs.config.config_options.Optional(
+        mkdocs.config.config_options.Type(str)
+    )
+    page_cache = mkdocs.config.config_options.Type(bool, default=False)
+    page_cache_max_bytes = mkdocs.config.config_options.Type(
+        int, default=64 * 1024 * 1024
+    )
+    timeout = mkdocs.config.config_options.Optional(
+        mkdocs.config.config_options.Type(int)
+    )
+    max_diff_bytes = mkdocs.config.config_options.Optional(
+        mkdocs.config.config_options.Type(int)
+    )
+    planner = mkdocs.config.config_options.Type(bool, default=False)
+    change_store = mkdocs.config.config_options.Optional(
+        mkdocs.config.config_options.Type(str)
+    )
+    change_store_spill = mkdocs.config.config_options.Type(bool, default=False)
+    mode = mkdocs.config.config_options.Choice(
+        ("markdown", "manifest"), default="markdown"
+    )
 
 
 class DecodiffPlugin(mkdocs.plugins.BasePlugin[DecodiffPluginConfig]):
@@ -99,30 +305,83 @@ class DecodiffPlugin(mkdocs.plugins.BasePlugin[DecodiffPluginConfig]):
     _file_diffs: List[FileDiff] = []
     _change_list_file_path: str = None
     _change_list_md: str = None
+    _manifest_pages: dict = {}
+    _line_history: Optional[LineHistory] = None
+    _line_times: Dict[str, List[int]] = {}
+    _cache_dir: str = None
+    _page_index: Optional[PageIndex] = None
+    _page_cache: Optional[DiskCache] = None
+    _dirty: bool = False
+    _page_fingerprints: Dict[str, str] = {}
+    _plan: Optional[Plan] = None
+    _build_stats: Optional[BuildStats] = None
+    _change_store: Optional[ChangeStore] = None
+
+    def on_startup(self, *, command, dirty):
+        self._dirty = dirty
 
     def on_pre_build(self, config):
+        self._manifest_pages = {}
+        self._page_index = None
+        self._page_cache = None
+
         # git root
         self._git_root_dir = _get_git_root_dir()
         if self._git_root_dir is None:
             # Here is not a git folder
             return
 
-        # get diff
-        file_diffs: List[FileDiff] = []
-        if self.config["word_diff"]:
-            gitdiff = run_git_diff(
-                self.config["base"], WordDiff.PORCELAIN, self.config["dir"]
+        self._cache_dir = os.path.join(
+            os.path.dirname(config.config_file_path), self.config["cache_dir"]
+        )
+
+        # changes kept after the build
+        self._close_change_store()
+        if self.config["change_store"]:
+            self._change_store = ChangeStore(
+                os.path.join(
+                    os.path.dirname(config.config_file_path),
+                    self.config["change_store"],
+                ),
+                self.config["base"],
+                self.config["target"],
+                self._git_root_dir,
             )
-            file_diffs = parse_porcelain_diff(gitdiff)
-        else:
-            gitdiff = run_git_diff(
-                self.config["base"], WordDiff.NONE, self.config["dir"]
+            self._change_store.clear()
+
+        # changes made by the daemon
+        file_changes = None
+        if self.config["daemon_socket"]:
+            file_changes = self._query_daemon()
+            if file_changes is not None:
+                file_changes = self._store_file_changes(file_changes)
+        if file_changes is None:
+            file_changes = self._make_file_changes()
+        self._file_changes = file_changes
+        if self.config["target"]:
+            self._warn_worktree_differs()
+
+        # changes of included files
+        if self.config["includes"]:
+            self._warn_include_markdown_order(config)
+            self._file_changes = propagate_includes(
+                self._file_changes,
+                self._build_include_index(config),
+                self._git_root_dir,
+                self.config["target"],
             )
-            file_diffs = parse_unified_diff(gitdiff)
-        self._file_diffs = file_diffs
 
-        # make file changes
-        self._file_changes = make_file_changes(self._git_root_dir, self._file_diffs)
+        # pages to changes
+        self._page_index = PageIndex(config.docs_dir)
+        self._page_index.build(self._file_changes)
+
+        # annotated pages of the previous builds
+        self._page_cache = None
+        if self.config["page_cache"]:
+            self._page_cache = DiskCache(
+                os.path.join(self._cache_dir, "pages"),
+                self.config["page_cache_max_bytes"],
+            )
 
         # change list
         change_list_file_path = self.config["change_list_file"]
@@ -139,29 +398,475 @@ class DecodiffPlugin(mkdocs.plugins.BasePlugin[DecodiffPluginConfig]):
                     f"Change list file is not found: {self.config['change_list_file']}",
                     file=sys.stderr,
                 )
+            elif self._line_history is not None:
+                self._change_list_md = _make_history_change_list_md(
+                    self._change_list_file_path, self._file_changes, self._line_history
+                )
             else:
                 self._change_list_md = _make_change_list_md(
                     self._change_list_file_path, self._file_changes
                 )
 
+    def _make_file_changes(self) -> List[FileChange]:
+        # execution plan from the statistics of the previous builds
+        self._plan = None
+        self._build_stats = None
+        stats: List[BuildStats] = []
+        if self.config["planner"]:
+            stats = load_stats(DiskCache(self._cache_dir))
+            self._plan = make_plan(stats)
+            self._build_stats = BuildStats()
+            print(f"decodiff plan: {self._plan}", file=sys.stderr)
+
+        # get diff
+        file_level_changes: List[FileChange] = []
+        try:
+            file_diffs = self._run_git_diff()
+        except GitBudgetExceeded as e:
+            print(
+                f"{e}: falling back to changed files without changed lines",
+                file=sys.stderr,
+            )
+            file_diffs = []
+            file_level_changes = self._store_file_changes(
+                make_file_level_changes(
+                    self._git_root_dir,
+                    run_git_diff_name_status(
+                        self.config["base"], self.config["dir"], self.config["target"]
+                    ),
+                )
+            )
+        self._file_diffs = file_diffs
+
+        # commit history of the changed lines
+        self._line_history = None
+        if self.config["history"]:
+            try:
+                with GitBudget(
+                    self.config["timeout"], self.config["max_diff_bytes"]
+                ) as budget:
+                    self._line_history = read_line_history(
+                        self.config["base"],
+                        self.config["dir"],
+                        self.config["target"],
+                        budget,
+                    )
+            except GitBudgetExceeded as e:
+                print(f"{e}: changes are not attributed to commits", file=sys.stderr)
+
+        # age of the changed lines
+        self._line_times = {}
+        if self.config["age"]:
+            self._line_times = read_line_times(
+                self._git_root_dir,
+                [d.to_file for d in file_diffs if d.from_file and d.to_file],
+                DiskCache(os.path.join(self._cache_dir, "blame")),
+                self.config["blame_jobs"],
+                self.config["target"],
+            )
+
+        line_attrs = None
+        if self._line_history is not None or self.config["age"]:
+            line_attrs = self._get_line_attrs
+
+        # make file changes
+        # (the line attributes are bound to the plugin, so no process pool)
+        processes = 1
+        if self._plan is not None and line_attrs is None:
+            processes = self._plan.mark_processes
+        mark_start = time.perf_counter()
+        file_changes = make_file_changes(
+            self._git_root_dir,
+            self._file_diffs,
+            self.config["coalesce"],
+            self.config["target"],
+            line_attrs,
+            processes,
+            self._change_store,
+            self.config["change_store_spill"],
+            # in manifest mode, the tags are added by decodiff.js
+            embed_tags=self.config["mode"] != "manifest",
+        )
+
+        if self._build_stats is not None:
+            build = self._build_stats
+            build.files = len(file_diffs)
+            build.line_diffs = sum(len(d.line_diffs) for d in file_diffs)
+            build.mark_seconds = time.perf_counter() - mark_start
+            build.mark_processes = processes
+            save_stats(DiskCache(self._cache_dir), stats + [build])
+
+        return file_changes + file_level_changes
+
+    def _warn_include_markdown_order(self, config):
+        """Warns if include-markdown replaces the directives before decodiff
+
+        The propagated changes are located on the include directives, which
+        are already replaced if include-markdown runs first.
+        """
+
+        for name, plugin in config["plugins"].items():
+            if plugin is self:
+                return
+            # the same plugin used twice is named "include-markdown #2"
+            if name.split(" #")[0] == "include-markdown":
+                print(
+                    "decodiff: include-markdown is before decodiff in plugins, "
+                    "changes of files included by it are not highlighted",
+                    file=sys.stderr,
+                )
+                return
+
+    def _warn_worktree_differs(self):
+        """Reports highlighted pages whose working tree differs from `target`
+
+        Pages are built from the working tree, their highlights from `target`.
+        """
+
+        differing = {
+            os.path.normpath(os.path.join(self._git_root_dir, path))
+            for _, path in run_git_diff_name_status(
+                self.config["target"], self.config["dir"]
+            )
+        }
+        for file_change in self._file_changes:
+            file_path = os.path.normpath(file_change.file_path)
+            if file_change.line_changes and file_path in differing:
+                relpath = os.path.relpath(file_path, self._git_root_dir)
+                print(
+                    f"{relpath} differs from {self.config['target']} in the working"
+                    " tree: the page is built from the working tree and its"
+                    f" highlights from {self.config['target']}",
+                    file=sys.stderr,
+                )
+
+    def _store_file_changes(self, file_changes: List[FileChange]) -> List[FileChange]:
+        if self._change_store is None:
+            return file_changes
+        return self._change_store.write(file_changes, self.config["change_store_spill"])
+
+    def _close_change_store(self):
+        if self._change_store is not None:
+            self._change_store.close()
+            self._change_store = None
+
+    def _query_daemon(self) -> Optional[List[FileChange]]:
+        """Returns the changes made by the daemon, None if it is not used"""
+
+        # line attributes are made in process
+        if self.config["history"] or self.config["age"]:
+            return None
+
+        timeout = _DAEMON_TIMEOUT
+        if self.config["timeout"] is not None:
+            timeout = self.config["timeout"] + _DAEMON_MARK_TIMEOUT
+
+        try:
+            return query_daemon(
+                self.config["daemon_socket"],
+                {
+                    # rejected by a daemon serving another checkout
+                    "repo": os.path.realpath(self._git_root_dir),
+                    "base": self.config["base"],
+                    "target": self.config["target"],
+                    # the daemon runs git at the root
+                    "dir": os.path.relpath(
+                        os.path.abspath(self.config["dir"]), self._git_root_dir
+                    ),
+                    "word_diff": self.config["word_diff"],
+                    "coalesce": self.config["coalesce"],
+                    "jobs": self.config["jobs"],
+                    "timeout": self.config["timeout"],
+                    "max_diff_bytes": self.config["max_diff_bytes"],
+                },
+                timeout,
+            )
+        except (OSError, RuntimeError, ValueError) as e:
+            print(f"decodiff daemon is not used: {e}", file=sys.stderr)
+            return None
+
+    def _run_git_diff(self) -> List[FileDiff]:
+        # a diff between two commits never changes
+        key = self._get_diff_cache_key()
+        cache = DiskCache(os.path.join(self._cache_dir, "diffs"), _DIFF_CACHE_MAX_BYTES)
+        if key is not None:
+            cached = cache.get_json(key)
+            if cached is not None:
+                return file_diffs_from_json(cached)
+
+        file_diffs = self._run_git_diff_process()
+        if key is not None:
+            cache.put_json(key, file_diffs_to_json(file_diffs))
+        return file_diffs
+
+    def _get_diff_cache_key(self) -> Optional[str]:
+        """Returns the key of the diff if `base` and `target` are commits"""
+
+        if not self.config["target"] or "GIT_DIR" in os.environ:
+            return None
+        repo = find_git_repo(os.getcwd())
+        if repo is None:
+            return None
+        base = repo.resolve(self.config["base"])
+        target = repo.resolve(self.config["target"])
+        if base is None or target is None:
+            return None
+
+        target_dir = os.path.relpath(os.path.abspath(self.config["dir"]), repo.root)
+        options = [
+            __version__,
+            base,
+            target,
+            target_dir,
+            self.config["word_diff"],
+        ]
+        return hashlib.sha256(repr(options).encode("utf-8")).hexdigest()
+
+    def _run_git_diff_process(self) -> List[FileDiff]:
+        word_diff = WordDiff.PORCELAIN if self.config["word_diff"] else WordDiff.NONE
+        diff_start = time.perf_counter()
+        with GitBudget(self.config["timeout"], self.config["max_diff_bytes"]) as budget:
+            if self.config["jobs"] > 1:
+                return run_sharded_git_diff(
+                    self.config["base"],
+                    word_diff,
+                    self.config["dir"],
+                    self.config["jobs"],
+                    self.config["target"],
+                    budget,
+                )
+
+            if self._should_stream_diff():
+                file_diffs = self._stream_git_diff(word_diff)
+                self._measure_diff(diff_start)
+                return file_diffs
+
+            gitdiff = run_git_diff(
+                self.config["base"],
+                word_diff,
+                self.config["dir"],
+                target=self.config["target"],
+                budget=budget,
+            )
+        if word_diff == WordDiff.PORCELAIN:
+            file_diffs = parse_porcelain_diff(gitdiff)
+        else:
+            file_diffs = parse_unified_diff(gitdiff)
+        if self._build_stats is not None:
+            self._build_stats.diff_bytes = len(gitdiff)
+        self._measure_diff(diff_start)
+        return file_diffs
+
+    def _measure_diff(self, diff_start: float):
+        # only a diff read from git diff is planned from
+        if self._build_stats is not None:
+            self._build_stats.diff_seconds = time.perf_counter() - diff_start
+            self._build_stats.diff_measured = True
+
+    def _should_stream_diff(self) -> bool:
+        # the budgets are enforced on the whole output only
+        return (
+            self._plan is not None
+            and self._plan.stream_diff
+            and self.config["timeout"] is None
+            and self.config["max_diff_bytes"] is None
+        )
+
+    def _stream_git_diff(self, word_diff: WordDiff) -> List[FileDiff]:
+        """Parses the git diff output as it is read"""
+
+        lines = stream_git_diff(
+            self._git_root_dir,
+            self.config["base"],
+            word_diff,
+            os.path.relpath(os.path.abspath(self.config["dir"]), self._git_root_dir),
+            self.config["target"],
+        )
+        lines = self._build_stats.count_lines(lines)
+        self._build_stats.stream_diff = True
+        if word_diff == WordDiff.PORCELAIN:
+            return list(iter_porcelain_diff(lines))
+        return list(iter_unified_diff(lines))
+
+    def _build_include_index(self, config) -> IncludeIndex:
+        config_dir = os.path.dirname(config.config_file_path)
+
+        # snippets are resolved from base_path of pymdownx.snippets
+        base_paths = config.mdx_configs.get("pymdownx.snippets", {}).get(
+            "base_path", ["."]
+        )
+        if isinstance(base_paths, str):
+            base_paths = [base_paths]
+        base_dirs = [os.path.join(config_dir, p) for p in base_paths]
+
+        index = IncludeIndex(config.docs_dir, base_dirs, DiskCache(self._cache_dir))
+        index.build()
+        return index
+
+    def _get_line_attrs(self, file_path: str, line_no: int) -> Dict[str, str]:
+        attrs = {}
+
+        if self._line_history is not None:
+            commit = self._line_history.owner(file_path, line_no)
+            if commit is not None:
+                attrs["data-decodiff-commit"] = commit.sha or "uncommitted"
+
+        times = self._line_times.get(file_path, [])
+        if 0 < line_no <= len(times):
+            days = (time.time() - times[line_no - 1]) / 86400
+            buckets = self.config["age_buckets"]
+            age = next((i for i, b in enumerate(buckets) if days <= b), len(buckets))
+            attrs["class"] = f"decodiff-age-{age}"
+
+        return attrs
+
     def on_config(self, config):
         config.extra_css.insert(0, "assets/decodiff/decodiff.css")
-
         return config
 
     def on_files(self, files, config):
         # register assets
-        files.append(
-            mkdocs.structure.files.File(
-                path="decodiff.css",
-                src_dir=os.path.join(os.path.dirname(__file__), "assets"),
-                dest_dir=f"{config.site_dir}/assets/decodiff",
-                use_directory_urls=False,
+        assets = ["decodiff.css"]
+        if self.config["mode"] == "manifest":
+            assets.append("decodiff.js")
+        for asset in assets:
+            files.append(
+                mkdocs.structure.files.File(
+                    path=asset,
+                    src_dir=os.path.join(os.path.dirname(__file__), "assets"),
+                    dest_dir=f"{config.site_dir}/assets/decodiff",
+                    use_directory_urls=False,
+                )
             )
-        )
+
+        if self._page_index is not None:
+            self._prepare_pages(files, config)
 
         return files
 
+    def _prepare_pages(self, files, config):
+        """Records the fingerprints of the annotated pages
+
+        Fingerprints are keyed by the real paths of the pages, see
+        `PageIndex.page_key`. The fingerprints of index pages get the nav
+        counts in on_nav.
+        In manifest mode, the manifest entries are recorded here, so pages
+        skipped by --dirty are in the manifest too.
+        """
+
+        fingerprints = {}
+        for file in files.documentation_pages():
+            plan = self._page_index.lookup(file.src_path, file.abs_src_path)
+            if plan is None:
+                continue
+            key = self._page_index.page_key(file.src_path, file.abs_src_path)
+            if self.config["mode"] == "manifest":
+                entries = _make_manifest_entries(plan.file_change)
+                self._manifest_pages[_manifest_key(file.url)] = entries
+                # only changed pages load decodiff.js
+                if entries:
+                    fingerprints[key] = "manifest"
+            elif plan.line_changes:
+                fingerprints[key] = plan.fingerprint
+
+        if self._change_list_md is not None:
+            key = self._page_index.page_key(
+                os.path.relpath(self._change_list_file_path, config.docs_dir),
+                self._change_list_file_path,
+            )
+            fingerprints[key] = hashlib.sha256(
+                self._change_list_md.encode("utf-8")
+            ).hexdigest()
+        self._page_fingerprints = fingerprints
+
+    def on_nav(self, nav, config, files):
+        """Sums the change counts of the pages over the nav sections
+
+        Nav items get a `decodiff` attribute for templates, e.g.
+        `nav_item.decodiff.pages`. `nav.decodiff` has the site total.
+        """
+
+        if self._page_index is None:
+            return nav
+
+        nav.decodiff = rollup_nav(nav.items, self._get_page_changes)
+        self._fingerprint_index_pages(nav)
+
+        # pages whose annotations or counts differ from the previous build
+        if self._dirty:
+            old = load_fingerprints(DiskCache(self._cache_dir), __version__) or {}
+            stale = stale_pages(old, self._page_fingerprints)
+            for file in files.documentation_pages():
+                key = self._page_index.page_key(file.src_path, file.abs_src_path)
+                if key in stale:
+                    mark_for_rebuild(file.abs_src_path, file.abs_dest_path)
+
+        return nav
+
+    def _fingerprint_index_pages(self, nav):
+        """Adds the section and site counts to the fingerprints of index pages"""
+
+        for page in nav.pages:
+            if not page.is_index:
+                continue
+            # index pages of the same file chain their counts
+            key = self._page_index.page_key(page.file.src_path, page.file.abs_src_path)
+            section = getattr(page.parent, "decodiff", None)
+            counts = [
+                self._page_fingerprints.get(key),
+                section.to_dict() if section is not None else None,
+                nav.decodiff.to_dict(),
+            ]
+            self._page_fingerprints[key] = hashlib.sha256(
+                json.dumps(counts).encode("utf-8")
+            ).hexdigest()
+
+    def _get_page_changes(self, page: Page) -> NavChanges:
+        return page_changes(
+            self._page_index.lookup(page.file.src_path, page.file.abs_src_path)
+        )
+
+    def on_post_build(self, config):
+        # spilled line changes are read until the pages are built
+        self._close_change_store()
+
+        # only --dirty builds read the fingerprints back
+        if self._page_index is not None and self._dirty:
+            save_fingerprints(
+                DiskCache(self._cache_dir), __version__, self._page_fingerprints
+            )
+
+        if self.config["mode"] != "manifest":
+            return
+
+        # site-wide manifest applied by decodiff.js
+        manifest_path = os.path.join(
+            config.site_dir, "assets", "decodiff", "manifest.json"
+        )
+        os.makedirs(os.path.dirname(manifest_path), exist_ok=True)
+        with open(manifest_path, "w", encoding="utf-8") as f:
+            json.dump(
+                {"pages": self._manifest_pages},
+                f,
+                ensure_ascii=False,
+                separators=(",", ":"),
+            )
+
+    def on_post_page(self, output: str, page: Page, config):
+        """Loads decodiff.js on the changed pages in manifest mode"""
+
+        if self.config["mode"] != "manifest" or not self._manifest_pages.get(
+            _manifest_key(page.file.url)
+        ):
+            return output
+
+        src = get_relative_url("assets/decodiff/decodiff.js", page.url)
+        script = f'<script src="{src}"></script>\n'
+        i = output.rfind("</body>")
+        if i < 0:
+            return output + script
+        return output[:i] + script + output[i:]
+
     def on_page_markdown(self, markdown: str, page: Page, config, files):
         file_path = os.path.join(page.file.src_dir, page.file.src_path)
 
@@ -185,32 +890,48 @@ class DecodiffPlugin(mkdocs.plugins.BasePlugin[DecodiffPluginConfig]):
                 # if the decodiff comment is not found, add to the tail
                 md += "\n" + change_list_md
 
+        # change counts, of the section for an index page
+        if self._page_index is not None:
+            changes = getattr(page, "decodiff", None)
+            if changes is None:
+                # not in the nav
+                changes = self._get_page_changes(page)
+            page.meta["decodiff"] = changes.to_dict()
+            parent_changes = getattr(page.parent, "decodiff", None)
+            if page.is_index and parent_changes is not None:
+                page.meta["decodiff"]["section"] = parent_changes.to_dict()
+
         # chagned file
-        for file_change in self._file_changes:
-            # checks whether the markdown file has changes
-            if file_path == file_change.file_path:
-                # Leading empty lines and metadata lines have been removed.
-                # Count how many lines were removed before the current first line appears
-                first_line = markdown.partition("\n")[0]
-                raw_md = page.file.content_string
-                offset = 0
-                while True:
-                    # read 1 line
-                    line, _, raw_md = raw_md.partition("\n")
-                    if line == first_line:
-                        break
-                    elif raw_md == "":
-                        # file is end
-                        break
-                    else:
-                        # It is removed line from raw content
-                        # It is metadata or empty lines at head
-                        offset += 1
-
-                # replave changed lines
-                md_lines = markdown.splitlines()
-                for line_change in file_change.line_changes:
-                    md_lines[line_change.line_no - offset - 1] = line_change.tagged_line
-                md = "\n".join(md_lines)
+        # in manifest mode, highlights are applied by decodiff.js
+        if self._page_index is None or self.config["mode"] == "manifest":
+            return md
+        plan = self._page_index.lookup(page.file.src_path, page.file.abs_src_path)
+        if plan is None:
+            return md
+
+        # added pages are not tagged
+        if not plan.line_changes:
+            return md
+
+        key = None
+        if self._page_cache is not None:
+            key = page_cache_key(plan, md, __version__)
+            cached = self._page_cache.get(key)
+            if cached is not None:
+                return cached.decode("utf-8")
+
+        # replave changed lines, of the markdown with the change list
+        md_lines = md.splitlines()
+        located = _locate_line_changes(
+            plan.line_changes, md_lines, page.file.content_string, plan.offset
+        )
+        # from the bottom, a tagged line can contain several lines
+        for i, line_change in reversed(located):
+            tagged_lines = line_change.tagged_line.split("\n")
+            md_lines[i : i + line_change.line_count] = tagged_lines
+        md = "\n".join(md_lines)
+
+        if key is not None:
+            self._page_cache.put(key, md.encode("utf-8"))
 
         return md
@@ -0,0 +1,81 @@
+from dataclasses import asdict, dataclass
+from typing import Callable, Dict, Iterable, Optional
+
+from .page_index import PagePlan
+
+
+@dataclass
+class NavChanges:
+    """Change counts of a page, or of all pages under a nav section"""
+
+    # changed pages, new pages included
+    pages: int = 0
+    new_pages: int = 0
+    # tags and the source lines they cover
+    changes: int = 0
+    lines: int = 0
+
+    def add(self, other: "NavChanges"):
+        self.pages += other.pages
+        self.new_pages += other.new_pages
+        self.changes += other.changes
+        self.lines += other.lines
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+def page_changes(plan: Optional[PagePlan]) -> NavChanges:
+    """Returns the change counts of a page from its prepared changes"""
+
+    if plan is None or plan.file_change.is_removed:
+        return NavChanges()
+
+    file_change = plan.file_change
+    if file_change.is_added:
+        return NavChanges(pages=1, new_pages=1)
+    if file_change.is_modified or plan.line_changes:
+        return NavChanges(
+            pages=1, changes=len(plan.line_changes), lines=plan.changed_lines
+        )
+    return NavChanges()
+
+
+def rollup_nav(
+    items: Iterable, changes_of: Callable[[object], NavChanges]
+) -> NavChanges:
+    """Sums the change counts over the nav tree bottom-up
+
+    Each item gets a `decodiff` attribute with its counts, a section the sum
+    of its children. `changes_of` returns the counts of a page. The sum of
+    `items` is returned. A page listed several times is counted once in each
+    sum, pages are told apart by their source file.
+    """
+
+    return _sum_pages(_rollup(items, changes_of))
+
+
+def _rollup(
+    items: Iterable, changes_of: Callable[[object], NavChanges]
+) -> Dict[str, NavChanges]:
+    # counts of the pages under `items` by source path
+    pages = {}
+    for item in items:
+        if item.is_section:
+            section_pages = _rollup(item.children, changes_of)
+            changes = _sum_pages(section_pages)
+            pages.update(section_pages)
+        elif item.is_page:
+            changes = changes_of(item)
+            pages[item.file.src_path] = changes
+        else:
+            changes = NavChanges()
+        item.decodiff = changes
+    return pages
+
+
+def _sum_pages(pages: Dict[str, NavChanges]) -> NavChanges:
+    total = NavChanges()
+    for changes in pages.values():
+        total.add(changes)
+    return total
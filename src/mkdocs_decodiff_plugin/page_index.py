@@ -0,0 +1,157 @@
+import hashlib
+import os
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from .decodiff import FileChange, LineChange, count_head_lines
+from .markdown_marker import close_marked_lines, mark_markdown
+
+
+@dataclass
+class PagePlan:
+    """Changes of a page prepared before the pages are rendered"""
+
+    file_change: FileChange
+    # lines MkDocs removes before the page markdown (front matter, empty lines)
+    offset: int = 0
+    # line changes sorted by line number
+    line_changes: List[LineChange] = field(default_factory=list)
+    # hash of the offset and the line changes
+    fingerprint: str = ""
+    # source lines covered by the line changes
+    changed_lines: int = 0
+
+
+def change_fingerprint(offset: int, line_changes: List[LineChange]) -> str:
+    """Returns a hash identifying how the changes are applied to a page"""
+
+    h = hashlib.sha256(f"{offset}\0".encode("utf-8"))
+    for c in line_changes:
+        h.update(
+            f"{c.line_no}\0{c.line_count}\0{c.line}\0{c.tagged_line}\0".encode("utf-8")
+        )
+    return h.hexdigest()
+
+
+def page_cache_key(plan: PagePlan, markdown: str, state: str) -> str:
+    """Returns the key of the highlighted markdown of a page
+
+    The key changes with the markdown MkDocs passes to the page, the changes
+    of the page and `state` (the plugin version).
+    """
+
+    h = hashlib.sha256(f"{state}\0{plan.fingerprint}\0".encode("utf-8"))
+    h.update(markdown.encode("utf-8"))
+    return h.hexdigest()
+
+
+def _head_line_count(file_change: FileChange) -> int:
+    if file_change.head_line_count is not None:
+        return file_change.head_line_count
+
+    # changes made without marking the file, e.g. of including pages
+    last_line_no = min((c.line_no for c in file_change.line_changes), default=1)
+    try:
+        marked_lines = mark_markdown(file_change.file_path, last_line_no)
+    except (OSError, UnicodeDecodeError):
+        return 0
+    try:
+        return count_head_lines(marked_lines)
+    finally:
+        close_marked_lines(marked_lines)
+
+
+@dataclass
+class ChangeSummary:
+    """Values of a page plan computed from all line changes of a file"""
+
+    offset: int
+    fingerprint: str
+    changed_lines: int
+    # the line changes are sorted by line number
+    is_sorted: bool
+
+
+def summarize_changes(file_change: FileChange) -> ChangeSummary:
+    line_changes = file_change.line_changes
+    offset = _head_line_count(file_change) if line_changes else 0
+    line_nos = [c.line_no for c in line_changes]
+    is_sorted = all(a <= b for a, b in zip(line_nos, line_nos[1:]))
+    if not is_sorted:
+        line_changes = sorted(line_changes, key=lambda c: c.line_no)
+    return ChangeSummary(
+        offset,
+        change_fingerprint(offset, line_changes),
+        sum(c.line_count for c in line_changes),
+        is_sorted,
+    )
+
+
+class PageIndex:
+    """Index from page source paths to the prepared changes of the pages
+
+    Pages are keyed by their real path relative to the docs directory, so a
+    page reached through a symlinked file or directory finds the changes of
+    the file it points to.
+    """
+
+    def __init__(self, docs_dir: str):
+        self.docs_dir = os.path.realpath(docs_dir)
+        self._plans: Dict[str, PagePlan] = {}
+        # real paths of the directories of src paths
+        self._real_dirs: Dict[str, str] = {}
+
+    def _key(self, realpath: str) -> str:
+        try:
+            src_path = os.path.relpath(realpath, self.docs_dir)
+        except ValueError:
+            # on another drive
+            return realpath
+        if src_path == os.pardir or src_path.startswith(os.pardir + os.sep):
+            return realpath
+        return src_path.replace(os.sep, "/")
+
+    def page_key(self, src_path: str, abs_src_path: str) -> str:
+        """Returns the real path of a page relative to the docs directory
+
+        The absolute real path is returned for a file outside the docs
+        directory. Directories are resolved once.
+        """
+
+        src_dir = os.path.dirname(src_path)
+        real_dir = self._real_dirs.get(src_dir)
+        if real_dir is None:
+            real_dir = os.path.realpath(os.path.dirname(abs_src_path))
+            self._real_dirs[src_dir] = real_dir
+        if real_dir == os.path.normpath(os.path.join(self.docs_dir, src_dir)):
+            if not os.path.islink(abs_src_path):
+                return src_path.replace(os.sep, "/")
+        return self._key(os.path.realpath(abs_src_path))
+
+    def build(self, file_changes: List[FileChange]):
+        self._plans = {}
+        for file_change in file_changes:
+            if file_change.is_removed:
+                continue
+
+            # line changes spilled to a change store carry their summary, so
+            # they are not read here
+            line_changes = file_change.line_changes
+            summary = getattr(line_changes, "summary", None)
+            if summary is None:
+                summary = summarize_changes(file_change)
+            if not summary.is_sorted:
+                line_changes = sorted(line_changes, key=lambda c: c.line_no)
+            plan = PagePlan(
+                file_change,
+                summary.offset,
+                line_changes,
+                summary.fingerprint,
+                summary.changed_lines,
+            )
+            self._plans[self._key(os.path.realpath(file_change.file_path))] = plan
+
+    def lookup(self, src_path: str, abs_src_path: str) -> Optional[PagePlan]:
+        """Returns the plan of a page, None if the page has no changes"""
+
+        return self._plans.get(self.page_key(src_path, abs_src_path))
@@ -0,0 +1,130 @@
+import os
+import statistics
+from dataclasses import asdict, dataclass, fields
+from typing import Iterable, Iterator, List, Optional
+
+from ._cache import DiskCache
+
+_CACHE_KEY = "build-stats"
+# number of builds kept in the statistics
+_MAX_BUILDS = 20
+# number of recent builds a plan is made from
+_RECENT_BUILDS = 5
+# diff output streamed instead of held as one string from this size
+_STREAM_MIN_BYTES = 64 * 1024 * 1024
+# serial marking time worth trying a process pool for
+_POOL_MIN_SECONDS = 2.0
+
+
+@dataclass
+class BuildStats:
+    """Metrics of a build"""
+
+    diff_bytes: int = 0
+    # files in the diff and changed lines
+    files: int = 0
+    line_diffs: int = 0
+    # seconds of each phase
+    diff_seconds: float = 0.0
+    mark_seconds: float = 0.0
+    # plan of the build
+    stream_diff: bool = False
+    # the diff metrics were measured on git diff output, not on a cached,
+    # sharded or file level diff
+    diff_measured: bool = False
+    mark_processes: int = 1
+
+    def count_lines(self, lines: Iterable[str]) -> Iterator[str]:
+        """Passes the diff lines through, counting their size"""
+
+        for line in lines:
+            self.diff_bytes += len(line)
+            yield line
+
+
+@dataclass
+class Plan:
+    """Execution strategy of a build
+
+    Only strategies producing the same output are planned.
+    """
+
+    # stream and parse git diff output instead of reading it at once
+    stream_diff: bool = False
+    # processes marking the changed files
+    mark_processes: int = 1
+    reason: str = "no recorded builds"
+
+    def __str__(self) -> str:
+        diff = "streamed diff" if self.stream_diff else "whole diff"
+        return f"{diff}, {self.mark_processes} marking processes ({self.reason})"
+
+
+def load_stats(cache: DiskCache) -> List[BuildStats]:
+    saved = cache.get_json(_CACHE_KEY)
+    if not isinstance(saved, list):
+        return []
+
+    names = {f.name for f in fields(BuildStats)}
+    stats = []
+    for entry in saved:
+        if isinstance(entry, dict):
+            stats.append(BuildStats(**{k: v for k, v in entry.items() if k in names}))
+    return stats
+
+
+def save_stats(cache: DiskCache, stats: List[BuildStats]):
+    cache.put_json(_CACHE_KEY, [asdict(s) for s in stats[-_MAX_BUILDS:]])
+
+
+def _mark_seconds_per_line(stats: List[BuildStats]) -> Optional[float]:
+    values = [s.mark_seconds / s.line_diffs for s in stats if s.line_diffs > 0]
+    return statistics.median(values) if values else None
+
+
+def make_plan(stats: List[BuildStats], cpu_count: Optional[int] = None) -> Plan:
+    """Plans the next build from the statistics of the previous builds
+
+    The diff is streamed when the recent measured diffs are large, builds
+    whose diff was not read from git diff are ignored. A process pool marks
+    the files when it was faster per changed line than serial marking in the
+    recorded builds, and is tried once when serial marking became slow.
+    """
+
+    if not stats:
+        return Plan()
+
+    recent = stats[-_RECENT_BUILDS:]
+    plan = Plan(reason="")
+    reasons = []
+
+    measured = [s for s in stats if s.diff_measured][-_RECENT_BUILDS:]
+    if measured:
+        diff_bytes = statistics.median(s.diff_bytes for s in measured)
+        plan.stream_diff = diff_bytes >= _STREAM_MIN_BYTES
+        reasons.append(f"median diff {diff_bytes / 1024 / 1024:.1f} MiB")
+    else:
+        reasons.append("no measured diffs")
+
+    cpu_count = cpu_count or os.cpu_count() or 1
+    pool_size = min(cpu_count, 8)
+    line_diffs = statistics.median(s.line_diffs for s in recent)
+    serial = _mark_seconds_per_line([s for s in stats if s.mark_processes == 1])
+    pooled = _mark_seconds_per_line([s for s in stats if s.mark_processes > 1])
+    if pool_size > 1 and serial is not None:
+        if pooled is not None:
+            # learned from both strategies
+            if pooled < serial:
+                plan.mark_processes = pool_size
+            reasons.append(
+                f"marking {serial * 1000:.3f} ms/line serial,"
+                f" {pooled * 1000:.3f} ms/line pooled"
+            )
+        elif serial * line_diffs >= _POOL_MIN_SECONDS:
+            plan.mark_processes = pool_size
+            reasons.append(f"serial marking takes {serial * line_diffs:.1f}s")
+        else:
+            reasons.append(f"serial marking takes {serial * line_diffs:.1f}s")
+
+    plan.reason = ", ".join(reasons)
+    return plan
@@ -0,0 +1,280 @@
+"""
+Scale harness building large synthetic MkDocs sites with and without decodiff.
+
+A temporary git repository is generated for each site size. The base commit
+is tagged, then commits edit a fraction of the pages (churn). mkdocs build
+runs with and without the plugin, and the added wall time and peak memory
+are reported.
+
+Usage:
+
+    python tests/e2e-scale/harness.py --pages 1000,10000 --churn 0.01,0.1
+
+Requires mkdocs and the plugin installed in the running Python. Peak memory
+is read with the resource module, so it runs on Unix only.
+"""
+
+import argparse
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import asdict, dataclass
+from typing import List
+
+_PAGES_PER_DIR = 100
+_WORDS = (
+    "alpha beta gamma delta epsilon zeta eta theta iota kappa lambda mu nu xi"
+    " omicron pi rho sigma tau upsilon phi chi psi omega"
+).split()
+
+
+@dataclass
+class Result:
+    pages: int
+    churn: float
+    changed_pages: int
+    changed_lines: int
+    base_seconds: float
+    decodiff_seconds: float
+    base_max_rss_kib: int
+    decodiff_max_rss_kib: int
+
+    @property
+    def added_seconds(self) -> float:
+        return self.decodiff_seconds - self.base_seconds
+
+    @property
+    def added_max_rss_kib(self) -> int:
+        return self.decodiff_max_rss_kib - self.base_max_rss_kib
+
+
+def _git(repo_dir: str, *args: str):
+    subprocess.run(["git", *args], cwd=repo_dir, check=True, capture_output=True)
+
+
+def _sentence(rnd: random.Random) -> str:
+    return " ".join(rnd.choice(_WORDS) for _ in range(rnd.randint(6, 16))) + "."
+
+
+def _make_page(rnd: random.Random, title: str) -> List[str]:
+    lines = [f"# {title}", ""]
+    for section in range(rnd.randint(2, 5)):
+        lines += [f"## Section {section + 1}", ""]
+        lines += [_sentence(rnd) for _ in range(rnd.randint(1, 4))]
+        lines.append("")
+        if rnd.random() < 0.5:
+            lines += [f"* {_sentence(rnd)}" for _ in range(rnd.randint(2, 6))]
+            lines.append("")
+    return lines
+
+
+def _page_path(docs_dir: str, i: int) -> str:
+    return os.path.join(docs_dir, f"d{i // _PAGES_PER_DIR:04d}", f"page{i:06d}.md")
+
+
+def _write_lines(path: str, lines: List[str]):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+
+
+def _write_config(repo_dir: str, name: str, plugin: bool):
+    config = [
+        "site_name: Scale",
+        "use_directory_urls: false",
+    ]
+    if plugin:
+        config += [
+            "plugins:",
+            "  - decodiff:",
+            "      base: base",
+            "      dir: docs",
+            "      change_list_file: docs/changes.md",
+        ]
+    with open(os.path.join(repo_dir, name), "w", encoding="utf-8") as f:
+        f.write("\n".join(config) + "\n")
+
+
+def generate_site(repo_dir: str, pages: int, churn: float, commits: int, seed: int):
+    """Generates the repository and returns (changed pages, changed lines)"""
+
+    rnd = random.Random(seed)
+    docs_dir = os.path.join(repo_dir, "docs")
+    os.makedirs(docs_dir)
+    _git(repo_dir, "init", "-q")
+    _git(repo_dir, "config", "user.email", "scale@example.com")
+    _git(repo_dir, "config", "user.name", "scale")
+
+    _write_lines(
+        os.path.join(docs_dir, "changes.md"),
+        [
+            "# Changes",
+            "",
+            "<!-- decodiff: Written by decodiff from here -->",
+            "<!-- decodiff: end -->",
+        ],
+    )
+    contents = []
+    for i in range(pages):
+        contents.append(_make_page(rnd, f"Page {i}"))
+        _write_lines(_page_path(docs_dir, i), contents[i])
+    _write_config(repo_dir, "mkdocs.yml", plugin=True)
+    _write_config(repo_dir, "mkdocs-base.yml", plugin=False)
+    _git(repo_dir, "add", "-A")
+    _git(repo_dir, "commit", "-q", "-m", "base")
+    _git(repo_dir, "tag", "base")
+
+    # each commit edits its share of the churned pages
+    changed_pages = set()
+    changed_lines = 0
+    per_commit = max(int(pages * churn) // max(commits, 1), 1)
+    for c in range(commits):
+        for i in rnd.sample(range(pages), min(per_commit, pages)):
+            lines = contents[i]
+            for _ in range(rnd.randint(1, 3)):
+                pos = rnd.randrange(2, len(lines))
+                lines.insert(pos, _sentence(rnd))
+                lines.insert(pos, "")
+                changed_lines += 1
+            _write_lines(_page_path(docs_dir, i), lines)
+            changed_pages.add(i)
+        _git(repo_dir, "commit", "-q", "-am", f"change {c + 1}")
+
+    return len(changed_pages), changed_lines
+
+
+def _measure(args: List[str], cwd: str) -> dict:
+    """Runs the command in a child process and returns its time and memory"""
+
+    # a fresh process, so RUSAGE_CHILDREN only covers this command
+    code = (
+        "import json, resource, subprocess, sys, time\n"
+        "start = time.perf_counter()\n"
+        "subprocess.run(sys.argv[1:], check=True, capture_output=True)\n"
+        "seconds = time.perf_counter() - start\n"
+        "rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss\n"
+        "print(json.dumps({'seconds': seconds, 'max_rss': rss}))\n"
+    )
+    r = subprocess.run(
+        [sys.executable, "-c", code, *args],
+        cwd=cwd,
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+    result = json.loads(r.stdout)
+    # ru_maxrss is in bytes on macOS and in KiB elsewhere
+    if sys.platform == "darwin":
+        result["max_rss"] //= 1024
+    return result
+
+
+def _build(repo_dir: str, config_file: str, repeat: int) -> dict:
+    args = [sys.executable, "-m", "mkdocs", "build", "-q", "-f", config_file]
+    args += ["-d", os.path.join(repo_dir, "site")]
+    results = [_measure(args, repo_dir) for _ in range(repeat)]
+    return {
+        "seconds": min(r["seconds"] for r in results),
+        "max_rss": max(r["max_rss"] for r in results),
+    }
+
+
+def run(
+    pages: int,
+    churn: float,
+    commits: int,
+    repeat: int,
+    seed: int,
+    work_dir: str,
+    keep: bool,
+) -> Result:
+    repo_dir = tempfile.mkdtemp(prefix=f"decodiff-scale-{pages}-", dir=work_dir)
+    try:
+        changed_pages, changed_lines = generate_site(
+            repo_dir, pages, churn, commits, seed
+        )
+        base = _build(repo_dir, "mkdocs-base.yml", repeat)
+        decodiff = _build(repo_dir, "mkdocs.yml", repeat)
+    finally:
+        if keep:
+            print(f"kept: {repo_dir}", file=sys.stderr)
+        else:
+            shutil.rmtree(repo_dir, ignore_errors=True)
+
+    return Result(
+        pages,
+        churn,
+        changed_pages,
+        changed_lines,
+        base["seconds"],
+        decodiff["seconds"],
+        base["max_rss"],
+        decodiff["max_rss"],
+    )
+
+
+def _print_table(results: List[Result]):
+    header = (
+        f"{'pages':>7} {'churn':>6} {'changed':>8} {'lines':>7}"
+        f" {'base s':>8} {'added s':>8} {'base MiB':>9} {'added MiB':>10}"
+    )
+    print(header)
+    for r in results:
+        print(
+            f"{r.pages:>7} {r.churn:>6.3f} {r.changed_pages:>8} {r.changed_lines:>7}"
+            f" {r.base_seconds:>8.2f} {r.added_seconds:>8.2f}"
+            f" {r.base_max_rss_kib / 1024:>9.1f} {r.added_max_rss_kib / 1024:>10.1f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--pages", default="1000,10000", help="site sizes")
+    parser.add_argument("--churn", default="0.01,0.1", help="changed page ratios")
+    parser.add_argument("--commits", type=int, default=5)
+    parser.add_argument("--repeat", type=int, default=1, help="builds per config")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--work-dir", default=None, help="parent of the repos")
+    parser.add_argument("--keep", action="store_true", help="keep the repos")
+    parser.add_argument("--json", action="store_true", help="print JSON lines")
+    args = parser.parse_args()
+
+    results = []
+    for pages in [int(p) for p in args.pages.split(",")]:
+        for churn in [float(c) for c in args.churn.split(",")]:
+            print(f"pages={pages} churn={churn}", file=sys.stderr)
+            result = run(
+                pages,
+                churn,
+                args.commits,
+                args.repeat,
+                args.seed,
+                args.work_dir,
+                args.keep,
+            )
+            results.append(result)
+            if args.json:
+                print(
+                    json.dumps(
+                        {
+                            **asdict(result),
+                            "added_seconds": result.added_seconds,
+                            "added_max_rss_kib": result.added_max_rss_kib,
+                        }
+                    ),
+                    flush=True,
+                )
+
+    if not args.json:
+        _print_table(results)
+
+
+if __name__ == "__main__":
+    start = time.perf_counter()
+    main()
+    print(f"total: {time.perf_counter() - start:.1f}s", file=sys.stderr)
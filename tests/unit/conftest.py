@@ -0,0 +1,27 @@
+import subprocess
+
+import pytest
+
+
+def _git(*args, cwd=None) -> str:
+    return subprocess.run(
+        ["git", *args], cwd=cwd, check=True, capture_output=True, text=True
+    ).stdout.strip()
+
+
+@pytest.fixture
+def git():
+    """Runs git and returns its output without the trailing newline"""
+
+    return _git
+
+
+@pytest.fixture
+def git_repo(tmp_path, monkeypatch):
+    """Empty git repository in `tmp_path`, the current directory of the test"""
+
+    monkeypatch.chdir(tmp_path)
+    _git("init", "-q", "-b", "main")
+    _git("config", "user.email", "test@example.com")
+    _git("config", "user.name", "test")
+    return tmp_path
@@ -0,0 +1,31 @@
+import os
+
+from mkdocs_decodiff_plugin._cache import DiskCache
+
+
+def test_disk_cache_evict(tmp_path):
+    cache = DiskCache(str(tmp_path), max_bytes=25)
+
+    cache.put("aa01", b"0123456789")
+    cache.put("aa02", b"0123456789")
+    os.utime(cache._path("aa01"), (100, 100))
+    os.utime(cache._path("aa02"), (100, 100))
+    # aa01 is used recently
+    cache.get("aa01")
+    cache.put("aa03", b"0123456789")
+
+    assert cache.get("aa01") == b"0123456789"
+    assert cache.get("aa02") is None
+    assert cache.get("aa03") == b"0123456789"
+
+
+def test_disk_cache_overwrite(tmp_path):
+    cache = DiskCache(str(tmp_path), max_bytes=25)
+
+    cache.put("aa01", b"0123456789")
+    for _ in range(5):
+        cache.put("aa02", b"0123456789")
+
+    # overwriting does not add to the size
+    assert cache._total_bytes == 20
+    assert cache.get("aa01") == b"0123456789"
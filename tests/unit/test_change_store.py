@@ -0,0 +1,155 @@
+from mkdocs_decodiff_plugin._git_diff.git_diff import FileDiff, LineDiff
+from mkdocs_decodiff_plugin.change_store import ChangedPage, ChangeStore
+from mkdocs_decodiff_plugin.decodiff import FileChange, LineChange, make_file_changes
+from mkdocs_decodiff_plugin.page_index import PageIndex
+
+
+def _file_changes(root):
+    return [
+        FileChange(
+            str(root / "docs" / "a.md"),
+            line_changes=[
+                LineChange(3, "a", "<span>a</span>", "decodiff-anchor-1"),
+                LineChange(
+                    5,
+                    "b\nc",
+                    "<span>b\nc</span>",
+                    "decodiff-anchor-2",
+                    2,
+                    "b c",
+                    {"data-decodiff-commit": "abc"},
+                ),
+            ],
+            head_line_count=0,
+        ),
+        FileChange(str(root / "docs" / "b.md"), is_added=True),
+    ]
+
+
+def _open(tmp_path, base, target=None):
+    return ChangeStore(str(tmp_path / "changes.sqlite"), base, target, str(tmp_path))
+
+
+def test_write_and_read(tmp_path):
+    store = _open(tmp_path, "v1", "v2")
+    file_changes = _file_changes(tmp_path)
+    store.write(file_changes)
+
+    stored = list(store.iter_file_changes())
+    assert [f.file_path for f in stored] == [f.file_path for f in file_changes]
+    assert list(stored[0].line_changes) == file_changes[0].line_changes
+    assert stored[1].is_added
+    assert len(stored[1].line_changes) == 0
+
+    # relative to the repository root
+    assert store.changed_pages() == [
+        ChangedPage("docs/a.md", False, False, False, 2, 3),
+        ChangedPage("docs/b.md", False, True, False, 0, 0),
+    ]
+    store.close()
+
+
+def test_ranges(tmp_path):
+    store = _open(tmp_path, "v1", "v2")
+    store.write(_file_changes(tmp_path))
+    store.close()
+
+    # other range
+    other = _open(tmp_path, "v2")
+    assert other.changed_pages() == []
+    other.write(_file_changes(tmp_path)[1:])
+    other.close()
+
+    # persisted
+    store = _open(tmp_path, "v1", "v2")
+    assert len(store.changed_pages()) == 2
+    store.clear()
+    assert store.changed_pages() == []
+    store.close()
+
+    other = _open(tmp_path, "v2")
+    assert len(other.changed_pages()) == 1
+    other.close()
+
+
+def test_ranges_by_commit(tmp_path, git_repo, git):
+    git("commit", "-q", "--allow-empty", "-m", "v1")
+    git("tag", "v1")
+    git("commit", "-q", "--allow-empty", "-m", "v2")
+
+    store = _open(tmp_path, "v1", "HEAD")
+    store.write(_file_changes(tmp_path))
+    store.close()
+
+    # HEAD moved, the stored range is kept
+    git("commit", "-q", "--allow-empty", "-m", "v3")
+    store = _open(tmp_path, "v1", "HEAD")
+    assert store.changed_pages() == []
+    store.close()
+
+    store = _open(tmp_path, "v1", "HEAD~1")
+    assert len(store.changed_pages()) == 2
+    store.close()
+
+
+def test_write_replaces_file(tmp_path):
+    store = _open(tmp_path, "v1")
+    store.write(_file_changes(tmp_path))
+    store.write([FileChange(str(tmp_path / "docs" / "a.md"), is_removed=True)])
+
+    stored = list(store.iter_file_changes())
+    assert len(stored) == 2
+    assert stored[1].file_path == str(tmp_path / "docs" / "a.md")
+    assert stored[1].is_removed
+    assert list(stored[1].line_changes) == []
+    store.close()
+
+
+def test_spill(tmp_path, monkeypatch):
+    store = _open(tmp_path, "v1")
+    file_changes = _file_changes(tmp_path)
+    spilled = store.write(file_changes, spill=True)
+
+    assert len(spilled[0].line_changes) == 2
+    assert spilled[0].line_changes[1] == file_changes[0].line_changes[1]
+    assert spilled[0].line_changes[-2] == file_changes[0].line_changes[0]
+    assert list(spilled[0].line_changes) == file_changes[0].line_changes
+    assert not spilled[1].line_changes
+
+    # the page index uses the summary written with the changes
+    reads = []
+    iter_line_changes = store._iter_line_changes
+
+    def _iter_line_changes(*args):
+        reads.append(args)
+        return iter_line_changes(*args)
+
+    monkeypatch.setattr(store, "_iter_line_changes", _iter_line_changes)
+    index = PageIndex(str(tmp_path / "docs"))
+    index.build(spilled)
+    assert reads == []
+    expected = PageIndex(str(tmp_path / "docs"))
+    expected.build(file_changes)
+    page = str(tmp_path / "docs" / "a.md")
+    plan = index.lookup("a.md", page)
+    assert plan.fingerprint == expected.lookup("a.md", page).fingerprint
+    assert plan.changed_lines == 3
+
+    # pages read the line changes from the store
+    assert list(plan.line_changes) == file_changes[0].line_changes
+    store.close()
+
+
+def test_make_file_changes_store(tmp_path):
+    (tmp_path / "page.md").write_text("# page\n\nline 3\n")
+    file_diffs = [FileDiff("page.md", "page.md", [LineDiff(3, 0, 0, 0)])]
+    store = _open(tmp_path, "main")
+
+    file_changes = make_file_changes(str(tmp_path), file_diffs, store=store)
+
+    assert len(store.changed_pages()) == 1
+    assert (
+        list(next(store.iter_file_changes()).line_changes)
+        == file_changes[0].line_changes
+    )
+    store.close()
@@ -0,0 +1,144 @@
+import os
+import socket
+import socketserver
+import threading
+
+import pytest
+
+from mkdocs_decodiff_plugin.daemon import (
+    _MAX_RESULTS,
+    _Daemon,
+    _Handler,
+    _remove_stale_socket,
+    decode_file_changes,
+    encode_file_changes,
+    query_daemon,
+)
+from mkdocs_decodiff_plugin.decodiff import FileChange, LineChange
+
+
+def test_encode_file_changes():
+    file_changes = [
+        FileChange(
+            "/repo/docs/a.md",
+            line_changes=[
+                LineChange(3, "é", "<span>é</span>", "decodiff-anchor-0"),
+                LineChange(
+                    5, "a\nb", "x\ny", "decodiff-anchor-1", 2, "a\nb", {"class": "c"}
+                ),
+            ],
+            head_line_count=2,
+        ),
+        FileChange("/repo/docs/b.md", is_added=True),
+        FileChange("/repo/docs/c.md", is_removed=True),
+        FileChange("/repo/docs/d.md", is_modified=True),
+    ]
+
+    decoded = decode_file_changes(encode_file_changes(file_changes))
+
+    assert decoded == file_changes
+    assert decoded[0].count_in_range(1, 10) == 2
+
+
+def test_daemon_results_are_bounded(git_repo, git):
+    repo = git_repo
+    (repo / "docs").mkdir()
+    (repo / "docs" / "a.md").write_text("# a\n")
+    git("add", ".")
+    git("commit", "-q", "-m", "v1")
+
+    daemon = _Daemon(str(repo))
+    for i in range(_MAX_RESULTS + 5):
+        daemon.handle({"repo": str(repo), "base": "HEAD", "dir": f"docs{i}"})
+
+    assert len(daemon._results) == _MAX_RESULTS
+    assert len(daemon._key_locks) <= _MAX_RESULTS
+
+
+def test_daemon_fingerprint(git_repo, git):
+    repo = git_repo
+    (repo / "docs").mkdir()
+    page = repo / "docs" / "a.md"
+    page.write_text("# a\n")
+    git("add", ".")
+    git("commit", "-q", "-m", "v1")
+    git("tag", "v1")
+
+    daemon = _Daemon(str(repo), walk_ttl=0)
+    between = {"base": "v1", "target": "HEAD", "dir": "docs"}
+    worktree = {"base": "v1", "dir": "docs"}
+    fingerprints = (daemon.fingerprint(between), daemon.fingerprint(worktree))
+
+    # a commit range does not depend on the work tree
+    page.write_text("# b\n")
+    os.utime(page, (1, 1))
+    assert daemon.fingerprint(between) == fingerprints[0]
+    assert daemon.fingerprint(worktree) != fingerprints[1]
+
+    git("commit", "-q", "-am", "v2")
+    assert daemon.fingerprint(between) != fingerprints[0]
+
+
+def test_query_daemon(git_repo, git, tmp_path_factory):
+    repo = git_repo
+    (repo / "docs").mkdir()
+    page = repo / "docs" / "a.md"
+    page.write_text("# a\n")
+    git("add", ".")
+    git("commit", "-q", "-m", "v1")
+    page.write_text("# a\n\nnew line\n")
+
+    other = tmp_path_factory.mktemp("other")
+    socket_path = str(other / "decodiff.sock")
+    server = socketserver.ThreadingUnixStreamServer(socket_path, _Handler)
+    server.pipeline = _Daemon(str(repo), walk_ttl=0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        options = {"repo": str(repo), "base": "HEAD", "dir": "docs"}
+        file_changes = query_daemon(socket_path, options, timeout=10)
+        assert [c.line_no for c in file_changes[0].line_changes] == [3]
+
+        # the worktree is changed
+        page.write_text("# a\n\nnew line\nnew line\n")
+        os.utime(page, (1, 1))
+        file_changes = query_daemon(socket_path, options, timeout=10)
+        assert [c.line_no for c in file_changes[0].line_changes] == [3, 4]
+
+        # a build of another checkout
+        with pytest.raises(RuntimeError, match="serving"):
+            query_daemon(socket_path, {**options, "repo": str(other)}, 10)
+
+        # over the budget
+        file_changes = query_daemon(
+            socket_path, {**options, "max_diff_bytes": 1}, timeout=10
+        )
+        assert file_changes[0].is_modified
+        assert not file_changes[0].line_changes
+
+        # a request larger than the limit is refused
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(10)
+            sock.connect(socket_path)
+            sock.sendall(b"\xff\xff\xff\xff")
+            assert sock.recv(1) == b""
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_remove_stale_socket(tmp_path):
+    path = tmp_path / "decodiff.sock"
+    _remove_stale_socket(str(path))
+
+    # a mistyped path of a user file
+    path.write_text("user data")
+    with pytest.raises(RuntimeError, match="not a socket"):
+        _remove_stale_socket(str(path))
+    assert path.read_text() == "user data"
+
+    path.unlink()
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.bind(str(path))
+    _remove_stale_socket(str(path))
+    assert not path.exists()
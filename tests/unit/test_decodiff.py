@@ -0,0 +1,121 @@
+from textwrap import dedent
+
+from mkdocs_decodiff_plugin._git_diff.git_diff import FileDiff, LineDiff
+from mkdocs_decodiff_plugin.decodiff import (
+    FileChange,
+    count_head_lines,
+    embed_decodiff_tags,
+)
+from mkdocs_decodiff_plugin.markdown_marker import mark_markdown_lines
+
+MD = dedent("""
+    # header
+
+    line 3
+    line 4
+    line 5
+
+    * list 7
+    * list 8
+    """).strip()
+
+
+def _line_diffs(*line_nos):
+    lines = MD.splitlines()
+    return [
+        LineDiff(no, 0, len(lines[no - 1]), anchor_no)
+        for anchor_no, no in enumerate(line_nos)
+    ]
+
+
+def test_embed_decodiff_tags():
+    marked_lines = mark_markdown_lines(MD.splitlines())
+    file_diff = FileDiff("a.md", "a.md", _line_diffs(1, 3, 4))
+
+    changes = embed_decodiff_tags(marked_lines, file_diff)
+
+    assert len(changes) == 3
+    assert changes[0].tagged_line == (
+        '# <span id="decodiff-anchor-0" class="decodiff">header</span>'
+    )
+    assert changes[0].text == "header"
+    assert changes[1].line_count == 1
+
+
+def test_embed_decodiff_tags_without_tags():
+    marked_lines = mark_markdown_lines(MD.splitlines())
+    file_diff = FileDiff("a.md", "a.md", _line_diffs(1, 3, 4))
+
+    for coalesce in [False, True]:
+        tagged = embed_decodiff_tags(marked_lines, file_diff, coalesce)
+        changes = embed_decodiff_tags(
+            marked_lines, file_diff, coalesce, embed_tags=False
+        )
+
+        assert [c.tagged_line for c in changes] == [c.line for c in tagged]
+        assert [(c.line_no, c.anchor, c.text) for c in changes] == [
+            (c.line_no, c.anchor, c.text) for c in tagged
+        ]
+
+
+def test_embed_decodiff_tags_coalesce():
+    marked_lines = mark_markdown_lines(MD.splitlines())
+    file_diff = FileDiff("a.md", "a.md", _line_diffs(1, 3, 4, 5, 7, 8))
+
+    changes = embed_decodiff_tags(marked_lines, file_diff, coalesce=True)
+
+    assert len(changes) == 4
+    assert changes[0].line_no == 1
+    assert changes[1].line_no == 3
+    assert changes[1].line_count == 3
+    assert changes[1].anchor == "decodiff-anchor-1"
+    assert changes[1].tagged_line.splitlines() == [
+        '<span id="decodiff-anchor-1" class="decodiff">line 3',
+        "line 4",
+        "line 5</span>",
+    ]
+    assert changes[1].text == "line 3\nline 4\nline 5"
+    assert changes[2].tagged_line == (
+        '* <span id="decodiff-anchor-4" class="decodiff">list 7</span>'
+    )
+    assert changes[3].line_no == 8
+
+
+def test_embed_decodiff_tags_coalesce_words():
+    marked_lines = mark_markdown_lines(["one two three"])
+    file_diff = FileDiff("a.md", "a.md", [LineDiff(1, 0, 3, 0), LineDiff(1, 8, 13, 1)])
+
+    changes = embed_decodiff_tags(marked_lines, file_diff, coalesce=True)
+
+    assert len(changes) == 1
+    assert changes[0].tagged_line == (
+        '<span id="decodiff-anchor-0" class="decodiff">one two three</span>'
+    )
+
+
+def test_file_change_range_query():
+    marked_lines = mark_markdown_lines(MD.splitlines())
+    file_diff = FileDiff("a.md", "a.md", _line_diffs(1, 3, 4, 5, 7, 8))
+    file_change = FileChange(
+        "a.md", line_changes=embed_decodiff_tags(marked_lines, file_diff, True)
+    )
+    file_change.build_index()
+
+    # changes are on [1, 2), [3, 6), [7, 8), [8, 9)
+    assert file_change.count_in_range(1, 9) == 4
+    assert file_change.count_in_range(2, 3) == 0
+    assert file_change.count_in_range(5, 7) == 1
+    assert file_change.count_in_range(5, 8) == 2
+    assert file_change.count_in_range(9, 20) == 0
+    assert [c.line_no for c in file_change.changes_in_range(4, 8)] == [3, 7]
+
+
+def test_count_head_lines():
+    def count(md):
+        return count_head_lines(mark_markdown_lines(md.split("\n")))
+
+    assert count("---\ntitle: a\n---\n\n\n# a") == 5
+    # blank lines are kept without front matter
+    assert count("\n\n# a") == 0
+    # lines of spaces are kept after front matter
+    assert count("---\ntitle: a\n---\n  \n# a") == 3
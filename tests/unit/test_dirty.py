@@ -0,0 +1,41 @@
+import os
+
+from mkdocs_decodiff_plugin._cache import DiskCache
+from mkdocs_decodiff_plugin.dirty import (
+    load_fingerprints,
+    mark_for_rebuild,
+    save_fingerprints,
+    stale_pages,
+)
+
+
+def test_stale_pages():
+    old = {"a.md": "1", "b.md": "2", "c.md": "3"}
+    new = {"a.md": "1", "b.md": "x", "d.md": "4"}
+
+    assert stale_pages(old, new) == {"b.md", "c.md", "d.md"}
+
+
+def test_fingerprints(tmp_path):
+    cache = DiskCache(str(tmp_path))
+
+    assert load_fingerprints(cache, "1.0") is None
+    save_fingerprints(cache, "1.0", {"a.md": "1"})
+    assert load_fingerprints(cache, "1.0") == {"a.md": "1"}
+    # other version
+    assert load_fingerprints(cache, "2.0") is None
+
+
+def test_mark_for_rebuild(tmp_path):
+    src = tmp_path / "a.md"
+    dest = tmp_path / "a.html"
+    src.write_text("# a\n")
+    dest.write_text("<h1>a</h1>\n")
+    os.utime(src, (1000, 1000))
+    os.utime(dest, (2000, 2000))
+
+    mark_for_rebuild(str(src), str(dest))
+
+    assert os.path.getmtime(dest) < os.path.getmtime(src)
+    # not built yet
+    mark_for_rebuild(str(src), str(tmp_path / "missing.html"))
@@ -0,0 +1,93 @@
+from textwrap import dedent
+
+from mkdocs_decodiff_plugin._cache import DiskCache
+from mkdocs_decodiff_plugin._git_diff import git_blame
+from mkdocs_decodiff_plugin._git_diff.git_blame import (
+    blob_sha,
+    parse_blame_incremental,
+    read_last_commits,
+    read_line_times,
+)
+
+
+def test_parse_blame_incremental():
+    text = dedent("""
+        aaaa 1 1 2
+        author a
+        author-time 100
+        filename page.md
+        bbbb 3 4 1
+        author b
+        author-time 200
+        filename page.md
+        aaaa 3 3 1
+        filename page.md
+        """).strip()
+
+    assert parse_blame_incremental(text.splitlines()) == [100, 100, 100, 200]
+
+    uncommitted = []
+    text = text.replace("bbbb", git_blame.UNCOMMITTED_SHA)
+    parse_blame_incremental(text.splitlines(), uncommitted)
+    assert uncommitted == [4]
+
+
+def test_read_line_times(tmp_path, monkeypatch, git_repo, git):
+    (tmp_path / "page.md").write_text("1\n2\n")
+    git("add", ".")
+    git("commit", "-q", "-m", "v1", "--date=@1000000000 +0000")
+    assert blob_sha(b"1\n2\n") == git("rev-parse", "HEAD:page.md")
+
+    cache = DiskCache(str(tmp_path / "cache"))
+    times = read_line_times(str(tmp_path), ["page.md"], cache)
+    assert times == {"page.md": [1000000000, 1000000000]}
+
+    # cached by path, blob hash and the last commit of the file
+    def fail(*args):
+        raise AssertionError("blamed again")
+
+    git("commit", "-q", "--allow-empty", "-m", "other")
+    with monkeypatch.context() as m:
+        m.setattr(git_blame, "run_git_blame", fail)
+        assert read_line_times(str(tmp_path), ["page.md"], cache) == times
+
+    # same content in another file with its own history
+    (tmp_path / "copy.md").write_text("1\n2\n")
+    git("add", ".")
+    git("commit", "-q", "-m", "v2", "--date=@1100000000 +0000")
+    times = read_line_times(str(tmp_path), ["copy.md"], cache)
+    assert times == {"copy.md": [1100000000, 1100000000]}
+
+
+def test_read_last_commits(tmp_path, git_repo, git):
+    (tmp_path / "a.md").write_text("a\n")
+    (tmp_path / "b c.md").write_text("b\n")
+    git("add", ".")
+    git("commit", "-q", "-m", "v1")
+    v1 = git("rev-parse", "HEAD")
+    (tmp_path / "a.md").write_text("a2\n")
+    git("commit", "-q", "-am", "v2")
+    v2 = git("rev-parse", "HEAD")
+    git("commit", "-q", "--allow-empty", "-m", "v3")
+
+    paths = ["a.md", "b c.md", "new.md"]
+    assert read_last_commits(str(tmp_path), paths) == {"a.md": v2, "b c.md": v1}
+    assert read_last_commits(str(tmp_path), paths, "HEAD~2") == {
+        "a.md": v1,
+        "b c.md": v1,
+    }
+
+
+def test_read_line_times_uncommitted(tmp_path, git_repo, git):
+    (tmp_path / "page.md").write_text("1\n")
+    git("add", ".")
+    git("commit", "-q", "-m", "v1", "--date=@1000000000 +0000")
+    (tmp_path / "page.md").write_text("1\n2\n")
+
+    cache = DiskCache(str(tmp_path / "cache"))
+    times = read_line_times(str(tmp_path), ["page.md"], cache)
+    assert times["page.md"][0] == 1000000000
+    assert times["page.md"][1] > 1000000000
+
+    # the time of the uncommitted line is not kept
+    assert not list(cache._entries())
@@ -0,0 +1,99 @@
+import sys
+import time
+
+import pytest
+
+from mkdocs_decodiff_plugin._git_diff.git_diff import (
+    GitBudget,
+    GitBudgetExceeded,
+    WordDiff,
+    iter_git_output,
+    run_git_diff,
+    run_git_diff_name_status,
+)
+from mkdocs_decodiff_plugin.decodiff import make_file_level_changes
+
+
+def _make_changes(tmp_path, git):
+    docs = tmp_path / "docs"
+    docs.mkdir()
+    (docs / "changed.md").write_text("# page\n")
+    (docs / "removed.md").write_text("# page\n")
+    (docs / "image.png").write_bytes(b"png")
+    git("add", ".")
+    git("commit", "-q", "-m", "v1")
+    (docs / "changed.md").write_text("# page\n\n" + "new line\n" * 100)
+    (docs / "removed.md").unlink()
+    (docs / "added.md").write_text("# page\n")
+    (docs / "image.png").write_bytes(b"gif")
+    git("add", "-A")
+
+
+def test_run_git_diff_budget(tmp_path, git_repo, git):
+    _make_changes(tmp_path, git)
+
+    with GitBudget(timeout=60) as budget:
+        diff_text = run_git_diff("HEAD", WordDiff.NONE, "docs", budget=budget)
+    assert diff_text == run_git_diff("HEAD", WordDiff.NONE, "docs")
+    assert budget.file_count == diff_text.count("diff --git ")
+
+    with pytest.raises(GitBudgetExceeded):
+        with GitBudget(max_bytes=100) as budget:
+            run_git_diff("HEAD", WordDiff.NONE, "docs", budget=budget)
+
+
+def test_iter_git_output_timeout():
+    start = time.monotonic()
+    with pytest.raises(GitBudgetExceeded):
+        with GitBudget(timeout=0.2) as budget:
+            list(
+                iter_git_output(
+                    [sys.executable, "-c", "import time; time.sleep(10)"], budget
+                )
+            )
+
+    assert time.monotonic() - start < 5
+
+
+def test_iter_git_output_stderr():
+    # more stderr than a pipe buffer while stdout is read
+    script = (
+        "import sys; sys.stderr.write('w' * (1 << 20)); sys.stderr.flush();"
+        " print('out'); sys.exit(1)"
+    )
+    with pytest.raises(RuntimeError, match="^w+$"):
+        with GitBudget(timeout=30) as budget:
+            list(iter_git_output([sys.executable, "-c", script], budget))
+    assert budget.exceeded is None
+
+    # without a budget, as stream_git_diff reads git
+    lines = []
+    with pytest.raises(RuntimeError, match="^w+$"):
+        lines.extend(iter_git_output([sys.executable, "-c", script]))
+    assert lines == ["out\n"]
+
+
+def test_unbounded_budget(tmp_path, git_repo, git):
+    _make_changes(tmp_path, git)
+
+    with GitBudget() as budget:
+        diff_text = run_git_diff("HEAD", WordDiff.NONE, "docs", budget=budget)
+    assert diff_text == run_git_diff("HEAD", WordDiff.NONE, "docs")
+    # git ran without the bounded reader
+    assert budget.byte_count == 0
+
+
+def test_make_file_level_changes(tmp_path, git_repo, git):
+    _make_changes(tmp_path, git)
+
+    file_changes = make_file_level_changes(
+        str(tmp_path), run_git_diff_name_status("HEAD", "docs")
+    )
+
+    assert [
+        (c.file_path, c.is_added, c.is_removed, c.is_modified) for c in file_changes
+    ] == [
+        (str(tmp_path / "docs" / "added.md"), True, False, False),
+        (str(tmp_path / "docs" / "changed.md"), False, False, True),
+        (str(tmp_path / "docs" / "removed.md"), False, True, False),
+    ]
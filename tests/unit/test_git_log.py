@@ -0,0 +1,71 @@
+import pytest
+
+from mkdocs_decodiff_plugin._git_diff.git_diff import GitBudget, GitBudgetExceeded
+from mkdocs_decodiff_plugin._git_diff.git_log import (
+    UNCOMMITTED,
+    CommitInfo,
+    LineOwners,
+    read_line_history,
+)
+
+
+def test_line_owners_replace():
+    c1 = CommitInfo("1", "c1")
+    c2 = CommitInfo("2", "c2")
+    owners = LineOwners()
+
+    # insert 2 lines after line 3 (+4,2)
+    owners.replace(4, 0, c1, 2)
+    assert [owners.owner(n) for n in range(1, 8)] == (
+        [None] * 3 + [c1] * 2 + [None] * 2
+    )
+
+    # replace line 5 with 3 lines, remove line 1
+    owners.replace(5, 1, c2, 3)
+    owners.replace(1, 1, c2, 0)
+    assert [owners.owner(n) for n in range(1, 9)] == (
+        [None] * 2 + [c1] + [c2] * 3 + [None] * 2
+    )
+
+
+def test_read_line_history(tmp_path, git_repo, git):
+    page = tmp_path / "page.md"
+    page.write_text("1\n2\n3\n")
+    git("add", ".")
+    git("commit", "-q", "-m", "base")
+    git("tag", "base")
+    page.write_text("1\n2\na\nb\n3\n")
+    git("commit", "-q", "-am", "add a b")
+    page.write_text("0\n1\n2\na\nB\n3\n")
+    git("commit", "-q", "-am", "add 0 change b")
+    page.write_text("0\n1\n2\na\nB\n3\n4\n")
+
+    history = read_line_history("base", None)
+
+    assert [c.subject for c in history.commits] == ["add a b", "add 0 change b"]
+    first, second = history.commits
+    owners = [history.owner("page.md", n) for n in range(1, 8)]
+    assert owners == [second, None, None, first, second, None, UNCOMMITTED]
+
+    with GitBudget(max_bytes=10) as budget:
+        with pytest.raises(GitBudgetExceeded):
+            read_line_history("base", None, budget=budget)
+    with GitBudget(timeout=60) as budget:
+        history = read_line_history("base", None, budget=budget)
+    assert history.owner("page.md", 5) == second
+
+
+def test_line_owners_lookup():
+    c1 = CommitInfo("1", "c1")
+    owners = LineOwners()
+    for line_no in range(1, 2000, 4):
+        owners.replace(line_no, 1, c1, 2)
+    expected = [run[0] for run in owners.runs for _ in range(run[1])]
+
+    assert [owners.owner(n) for n in range(1, len(expected) + 3)] == (
+        expected + [None, None]
+    )
+    # the run starts are made again after a change
+    owners.replace(1, 0, None, 1)
+    assert owners.owner(1) is None
+    assert owners.owner(2) == expected[0]
@@ -0,0 +1,68 @@
+import os
+
+from mkdocs_decodiff_plugin._git_diff.git_repo import find_git_repo
+
+
+def _commit_history(repo_path, git):
+    (repo_path / "docs").mkdir()
+    (repo_path / "docs" / "a.md").write_text("# a\n")
+    git("add", ".")
+    git("commit", "-q", "-m", "v1")
+    git("tag", "-a", "v1", "-m", "v1")
+    git("commit", "-q", "--allow-empty", "-m", "v2")
+
+
+def test_find_git_repo(git_repo, git, tmp_path_factory):
+    _commit_history(git_repo, git)
+
+    repo = find_git_repo(str(git_repo / "docs"))
+
+    assert repo.root == str(git_repo)
+    for rev in ["HEAD", "main", "v1", "refs/heads/main"]:
+        assert repo.resolve(rev) == git("rev-parse", rev)
+    assert repo.resolve("HEAD~1") is None
+    assert repo.resolve("missing") is None
+    assert find_git_repo(str(tmp_path_factory.mktemp("other"))) is None
+
+
+def test_find_git_repo_packed_refs(git_repo, git):
+    _commit_history(git_repo, git)
+    repo = find_git_repo(str(git_repo))
+    assert repo.resolve("v1") == git("rev-parse", "v1")
+
+    git("pack-refs", "--all")
+    git("commit", "-q", "--allow-empty", "-m", "v3")
+
+    for rev in ["HEAD", "main", "v1"]:
+        assert repo.resolve(rev) == git("rev-parse", rev)
+
+
+def test_find_git_repo_worktree(git_repo, git, tmp_path_factory):
+    _commit_history(git_repo, git)
+    worktree = tmp_path_factory.mktemp("other") / "wt"
+    git("worktree", "add", "-q", "-b", "other", str(worktree), "v1")
+
+    repo = find_git_repo(str(worktree / "docs"))
+
+    assert repo.root == str(worktree)
+    assert repo.resolve("HEAD") == git("rev-parse", "v1^{commit}")
+    assert repo.resolve("main") == git("rev-parse", "main")
+
+
+def test_find_git_repo_ref_rewritten_same_mtime(git_repo, git):
+    _commit_history(git_repo, git)
+    repo = find_git_repo(str(git_repo))
+    ref = git_repo / ".git" / "refs" / "heads" / "main"
+    old = git("rev-parse", "main")
+    new = git("rev-parse", "main~1")
+    st = ref.stat()
+    os.utime(ref, ns=(st.st_atime_ns, st.st_mtime_ns - 10_000_000_000))
+    assert repo.resolve("main") == old
+
+    # git writes a lockfile and renames it over the ref
+    lock = ref.with_name("main.lock")
+    lock.write_text(new + "\n")
+    os.utime(lock, ns=(st.st_atime_ns, st.st_mtime_ns - 10_000_000_000))
+    os.replace(lock, ref)
+
+    assert repo.resolve("main") == new
@@ -0,0 +1,213 @@
+import os
+
+from mkdocs_decodiff_plugin import includes
+from mkdocs_decodiff_plugin._cache import DiskCache
+from mkdocs_decodiff_plugin.decodiff import FileChange, LineChange
+from mkdocs_decodiff_plugin.includes import IncludeIndex, propagate_includes
+
+
+def _make_docs(tmp_path):
+    docs = tmp_path / "docs"
+    (docs / "sub").mkdir(parents=True)
+    (docs / "snippet.md").write_text("snippet 1\nsnippet 2\n")
+    (docs / "index.md").write_text('# index\n\n  --8<-- "snippet.md"\n')
+    (docs / "sub" / "page.md").write_text(
+        '# page\n\n{% include-markdown "../snippet.md" %}\n--8<-- "snippet.md:1:1"\n'
+    )
+    return docs
+
+
+def test_include_index(tmp_path, monkeypatch):
+    docs = _make_docs(tmp_path)
+    cache = DiskCache(str(tmp_path / "cache"))
+
+    index = IncludeIndex(str(docs), [str(docs)], cache)
+    index.build()
+
+    includers = sorted(index.includers(str(docs / "snippet.md")))
+    assert [(path, i.line_no, i.indent) for path, i in includers] == [
+        (str(docs / "index.md"), 3, "  "),
+        (str(docs / "sub" / "page.md"), 3, ""),
+    ]
+
+    # only the modified file is scanned again
+    scanned = []
+    find_includes = includes._find_includes
+
+    def _find_includes(file_path, base_dirs):
+        scanned.append(file_path)
+        return find_includes(file_path, base_dirs)
+
+    monkeypatch.setattr(includes, "_find_includes", _find_includes)
+    (docs / "index.md").write_text("# index\n")
+    index = IncludeIndex(str(docs), [str(docs)], cache)
+    index.build()
+    assert scanned == [str(docs / "index.md")]
+    assert len(index.includers(str(docs / "snippet.md"))) == 1
+
+
+def test_propagate_includes(tmp_path):
+    docs = _make_docs(tmp_path)
+    index = IncludeIndex(str(docs), [str(docs)])
+    index.build()
+    snippet_change = FileChange(
+        str(docs / "snippet.md"),
+        line_changes=[
+            LineChange(
+                2,
+                "snippet 2",
+                '<span id="decodiff-anchor-0" class="decodiff">snippet 2</span>',
+                "decodiff-anchor-0",
+            )
+        ],
+    )
+
+    file_changes = propagate_includes([snippet_change], index)
+
+    assert len(file_changes) == 3
+    index_change = next(c for c in file_changes if c.file_path.endswith("index.md"))
+    assert len(index_change.line_changes) == 1
+    assert index_change.line_changes[0].line_no == 3
+    assert index_change.line_changes[0].line == '  --8<-- "snippet.md"'
+    assert index_change.line_changes[0].tagged_line.split("\n") == [
+        "  snippet 1",
+        '  <span id="decodiff-anchor-0-include-3" class="decodiff">snippet 2</span>',
+    ]
+    assert index_change.line_changes[0].anchor == "decodiff-anchor-0-include-3"
+    assert index_change.count_in_range(1, 10) == 1
+
+
+def test_find_includes_resolution(tmp_path):
+    docs = tmp_path / "docs"
+    (docs / "sub").mkdir(parents=True)
+    (tmp_path / "snippets").mkdir()
+    (tmp_path / "snippets" / "a.md").write_text("a\n")
+    # next to the page, but not in base_path
+    (docs / "sub" / "a.md").write_text("a\n")
+    (docs / "sub" / "b.md").write_text("b\n")
+    page = docs / "sub" / "page.md"
+    page.write_text('--8<-- "a.md"\n--8<-- "b.md"\n{% include-markdown "b.md" %}\n')
+
+    found = includes._find_includes(str(page), [str(tmp_path / "snippets")])
+
+    assert found == [
+        [1, "", str(tmp_path / "snippets" / "a.md"), includes.SNIPPET],
+        [3, "", str(docs / "sub" / "b.md"), includes.INCLUDE_MARKDOWN],
+    ]
+
+
+def test_rewrite_relative_urls():
+    line = "[a](b.md#x) ![i](../img/c.png) [e](https://e.com/d.md) [f](#top)"
+
+    assert includes.rewrite_relative_urls(line, "/docs/parts", "/docs") == (
+        "[a](parts/b.md#x) ![i](img/c.png) [e](https://e.com/d.md) [f](#top)"
+    )
+    assert includes.rewrite_relative_urls("[r]: b.md", "/docs/parts", "/docs") == (
+        "[r]: parts/b.md"
+    )
+
+
+def test_propagate_includes_markdown_urls(tmp_path):
+    docs = _make_docs(tmp_path)
+    (docs / "parts").mkdir()
+    (docs / "parts" / "part.md").write_text("see [b](b.md)\n")
+    (docs / "page.md").write_text('{% include-markdown "parts/part.md" %}\n')
+    index = IncludeIndex(str(docs), [str(docs)])
+    index.build()
+    part_change = FileChange(
+        str(docs / "parts" / "part.md"),
+        line_changes=[
+            LineChange(
+                1,
+                "see [b](b.md)",
+                '<span id="decodiff-anchor-0" class="decodiff">see [b](b.md)</span>',
+                "decodiff-anchor-0",
+            )
+        ],
+    )
+
+    file_changes = propagate_includes([part_change], index)
+
+    page_change = next(c for c in file_changes if c.file_path.endswith("page.md"))
+    assert page_change.line_changes[0].tagged_line == (
+        '<span id="decodiff-anchor-0-include-1" class="decodiff">'
+        "see [b](parts/b.md)</span>"
+    )
+
+
+def test_propagate_includes_target(tmp_path, git_repo, git):
+    docs = _make_docs(tmp_path)
+    git("add", ".")
+    git("commit", "-q", "-m", "v1")
+    # the working tree differs from the target
+    (docs / "snippet.md").write_text("other\nother\n")
+    index = IncludeIndex(str(docs), [str(docs)])
+    index.build()
+    snippet_change = FileChange(
+        str(docs / "snippet.md"),
+        line_changes=[
+            LineChange(2, "snippet 2", "<span>snippet 2</span>", "decodiff-anchor-0")
+        ],
+    )
+
+    file_changes = propagate_includes([snippet_change], index, str(tmp_path), "HEAD")
+
+    index_change = next(c for c in file_changes if c.file_path.endswith("index.md"))
+    assert index_change.line_changes[0].tagged_line == (
+        "  snippet 1\n  <span>snippet 2</span>"
+    )
+
+
+def test_propagate_includes_nested(tmp_path):
+    docs = _make_docs(tmp_path)
+    (docs / "outer.md").write_text('# outer\n--8<-- "index.md"\n')
+    index = IncludeIndex(str(docs), [str(docs)])
+    index.build()
+    snippet_change = FileChange(
+        str(docs / "snippet.md"),
+        line_changes=[
+            LineChange(
+                2,
+                "snippet 2",
+                '<span id="decodiff-anchor-0" class="decodiff">snippet 2</span>',
+                "decodiff-anchor-0",
+                text="snippet 2",
+            )
+        ],
+    )
+
+    file_changes = propagate_includes([snippet_change], index)
+
+    outer_change = next(c for c in file_changes if c.file_path.endswith("outer.md"))
+    assert len(outer_change.line_changes) == 1
+    line_change = outer_change.line_changes[0]
+    assert line_change.line == '--8<-- "index.md"'
+    assert line_change.tagged_line.split("\n") == [
+        "# index",
+        "",
+        "  snippet 1",
+        '  <span id="decodiff-anchor-0-include-3-include-2" class="decodiff">'
+        "snippet 2</span>",
+    ]
+    assert line_change.anchor == "decodiff-anchor-0-include-3-include-2"
+    assert line_change.text == "snippet 2"
+
+
+def test_propagate_includes_cycle(tmp_path):
+    docs = tmp_path / "docs"
+    docs.mkdir()
+    (docs / "a.md").write_text('a\n--8<-- "b.md"\n')
+    (docs / "b.md").write_text('b\n--8<-- "a.md"\n')
+    index = IncludeIndex(str(docs), [str(docs)])
+    index.build()
+    a_change = FileChange(
+        str(docs / "a.md"),
+        line_changes=[LineChange(1, "a", "<span>a</span>", "decodiff-anchor-0")],
+    )
+
+    file_changes = propagate_includes([a_change], index)
+
+    assert sorted(os.path.basename(c.file_path) for c in file_changes) == [
+        "a.md",
+        "b.md",
+    ]
@@ -0,0 +1,22 @@
+from mkdocs_decodiff_plugin.line_align import align_lines
+
+
+def test_align_lines_same():
+    lines = ["# title", "", "a", "", "b"]
+
+    assert align_lines(lines, list(lines)) == [0, 1, 2, 3, 4]
+
+
+def test_align_lines_inserted_and_removed():
+    old = ["---", "title: t", "---", "# title", "", "a", "", "{{ macro }}", "", "b"]
+    new = ["# title", "", "a", "", "x", "y", "", "b", ""]
+
+    assert align_lines(old, new) == [-1, -1, -1, 0, 1, 2, 3, -1, 6, 7]
+
+
+def test_align_lines_moved():
+    old = ["a", "b", "c", "d"]
+    new = ["d", "a", "b", "c"]
+
+    # the longest ordered matches are kept
+    assert align_lines(old, new) == [1, 2, 3, -1]
@@ -0,0 +1,222 @@
+import asyncio
+import threading
+from contextlib import asynccontextmanager
+
+import pytest
+
+from mkdocs_decodiff_plugin import decodiff
+from mkdocs_decodiff_plugin._git_diff.git_diff import (
+    FileDiff,
+    LineDiff,
+    WordDiff,
+    read_git_blobs,
+    run_git_diff,
+)
+from mkdocs_decodiff_plugin._git_diff.parse_unified_diff import parse_unified_diff
+from mkdocs_decodiff_plugin.decodiff import (
+    aiter_file_changes,
+    iter_file_changes,
+    make_file_changes,
+)
+
+
+def test_make_file_changes_target(tmp_path, git_repo, git):
+    (tmp_path / "docs").mkdir()
+    page = tmp_path / "docs" / "page.md"
+    page.write_text("# page\n\nline 3\n")
+    git("add", ".")
+    git("commit", "-q", "-m", "v1")
+    git("tag", "v1")
+    page.write_text("# page\n\nline 3\n\n* new item\n")
+    git("commit", "-q", "-am", "v2")
+    git("tag", "v2")
+    # the working tree differs from both refs
+    page.write_text("# other\n")
+
+    diff_text = run_git_diff("v1", WordDiff.NONE, "docs", target="v2")
+    file_diffs = parse_unified_diff(diff_text)
+    file_changes = make_file_changes(str(tmp_path), file_diffs, target="v2")
+
+    assert len(file_changes) == 1
+    assert file_changes[0].line_changes[0].line_no == 5
+    assert file_changes[0].line_changes[0].tagged_line == (
+        '* <span id="decodiff-anchor-1" class="decodiff">new item</span>'
+    )
+
+    # a path missing in the target is not marked as an empty page
+    file_diffs[0].to_file = "docs/missing.md"
+    with pytest.raises(RuntimeError, match="missing.md is not found in v2"):
+        make_file_changes(str(tmp_path), file_diffs, target="v2")
+
+
+def test_read_git_blobs(tmp_path, git_repo, git):
+    (tmp_path / "docs").mkdir()
+    (tmp_path / "docs" / "a.md").write_bytes(b"a\r\n")
+    (tmp_path / "docs" / "b.md").write_bytes(b"")
+    git("add", ".")
+    git("commit", "-q", "-m", "v1")
+
+    blobs = read_git_blobs("HEAD", ["docs/a.md", "docs/missing.md", "docs/b.md"])
+
+    assert blobs == {"docs/a.md": b"a\r\n", "docs/b.md": b""}
+
+
+def test_read_git_blobs_git_error(tmp_path, monkeypatch):
+    # git exits before reading the paths
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("GIT_CEILING_DIRECTORIES", str(tmp_path.parent))
+    paths = [f"docs/{i:04}/{'x' * 200}.md" for i in range(2000)]
+
+    with pytest.raises(RuntimeError, match="not a git repository"):
+        read_git_blobs("HEAD", paths)
+
+
+def _commit_pages(tmp_path, git):
+    (tmp_path / "docs").mkdir()
+    for name in ["a.md", "b.md", "c.md"]:
+        (tmp_path / "docs" / name).write_text("# page\n")
+    git("add", ".")
+    git("commit", "-q", "-m", "v1")
+    for name in ["a.md", "b.md", "c.md"]:
+        (tmp_path / "docs" / name).write_text("# page\n\nnew line\n")
+
+
+def test_iter_file_changes(tmp_path, monkeypatch, git_repo, git):
+    _commit_pages(tmp_path, git)
+    # git runs in the given root regardless of the current directory
+    monkeypatch.chdir(tmp_path / "docs")
+
+    file_changes = iter_file_changes(str(tmp_path), "HEAD", "docs")
+    first = next(file_changes)
+    file_changes.close()
+
+    assert first.file_path == str(tmp_path / "docs" / "a.md")
+    assert first.line_changes[0].tagged_line == (
+        '<span id="decodiff-anchor-1" class="decodiff">new line</span>'
+    )
+
+
+def test_iter_file_changes_target(tmp_path, monkeypatch, git_repo, git):
+    _commit_pages(tmp_path, git)
+    git("commit", "-q", "-am", "v2")
+    readers = []
+    reader_class = decodiff.GitBlobReader
+
+    def reader(*args):
+        readers.append(args)
+        return reader_class(*args)
+
+    monkeypatch.setattr(decodiff, "GitBlobReader", reader)
+
+    file_changes = list(
+        iter_file_changes(str(tmp_path), "HEAD~", "docs", target="HEAD")
+    )
+
+    assert len(file_changes) == 3
+    assert all(c.line_changes[0].line_no == 3 for c in file_changes)
+    # one git cat-file process for all files
+    assert len(readers) == 1
+
+
+def test_aiter_file_changes(tmp_path, git_repo, git):
+    _commit_pages(tmp_path, git)
+
+    async def collect():
+        return [c async for c in aiter_file_changes(str(tmp_path), "HEAD", "docs")]
+
+    file_changes = asyncio.run(collect())
+
+    assert [c.file_path for c in file_changes] == [
+        str(tmp_path / "docs" / name) for name in ["a.md", "b.md", "c.md"]
+    ]
+
+
+@asynccontextmanager
+async def _closing(agen):
+    try:
+        yield agen
+    finally:
+        await agen.aclose()
+
+
+def test_aiter_file_changes_aclose(tmp_path, monkeypatch, git_repo, git):
+    _commit_pages(tmp_path, git)
+    closed = []
+    iter_file_changes = decodiff.iter_file_changes
+
+    def _iter_file_changes(*args):
+        try:
+            yield from iter_file_changes(*args)
+        finally:
+            closed.append(True)
+
+    monkeypatch.setattr(decodiff, "iter_file_changes", _iter_file_changes)
+
+    async def first():
+        async with _closing(aiter_file_changes(str(tmp_path), "HEAD", "docs")) as it:
+            async for file_change in it:
+                return file_change
+
+    assert asyncio.run(first()).file_path == str(tmp_path / "docs" / "a.md")
+    assert closed == [True]
+
+
+def test_aiter_file_changes_cancel(tmp_path, monkeypatch, git_repo, git):
+    _commit_pages(tmp_path, git)
+    closed = []
+    iter_file_changes = decodiff.iter_file_changes
+
+    def _iter_file_changes(*args):
+        try:
+            yield from iter_file_changes(*args)
+        finally:
+            closed.append(True)
+
+    monkeypatch.setattr(decodiff, "iter_file_changes", _iter_file_changes)
+
+    # marking blocks until the consumer is cancelled
+    entered = threading.Event()
+    release = threading.Event()
+
+    def line_attrs(file_path, line_no):
+        entered.set()
+        release.wait(10)
+        return {}
+
+    async def consume():
+        async for _ in aiter_file_changes(
+            str(tmp_path), "HEAD", "docs", line_attrs=line_attrs
+        ):
+            pass
+
+    async def main():
+        task = asyncio.create_task(consume())
+        await asyncio.to_thread(entered.wait, 10)
+        task.cancel()
+        await asyncio.sleep(0.1)
+        release.set()
+        try:
+            await task
+        except asyncio.CancelledError:
+            return True
+        return False
+
+    assert asyncio.run(main())
+    # closed after the file being made, without "generator already executing"
+    assert closed == [True]
+
+
+def test_make_file_changes_processes(tmp_path):
+    file_diffs = []
+    for i in range(4):
+        page = tmp_path / f"page{i}.md"
+        page.write_text(f"# page {i}\n\nline 3\n")
+        file_diffs.append(
+            FileDiff(f"page{i}.md", f"page{i}.md", [LineDiff(3, 0, 0, 0)])
+        )
+
+    serial = make_file_changes(str(tmp_path), file_diffs)
+    pooled = make_file_changes(str(tmp_path), file_diffs, processes=2)
+
+    assert pooled == serial
+    assert len(pooled[0].line_changes) == 1
@@ -475,3 +475,63 @@ def test_mark_list_after_block():
     assert ctx.lines[21]._line_type_str() == "T"
     assert ctx.lines[22]._line_type_str() == "T"
     assert ctx.lines[23]._line_type_str() == "L"
+
+
+def test_mark_block_id():
+    """Block ID"""
+
+    md = dedent("""
+        # header
+        paragraph
+        paragraph
+
+        * list
+          list
+        * list
+        > quote
+        > quote
+
+        paragraph
+        """).strip()
+
+    ctx = MdMarkContext()
+    for no, line in enumerate(md.splitlines(), start=1):
+        _mark_markdown_line(ctx, no, line)
+
+    ids = [line.block_id for line in ctx.lines]
+    assert ids[0] != ids[1]
+    assert ids[1] == ids[2]
+    assert ids[4] != ids[2]
+    assert ids[4] == ids[5]
+    assert ids[6] != ids[5]
+    assert ids[7] != ids[6]
+    assert ids[7] == ids[8]
+    assert ids[10] != ids[8]
+
+
+def test_mark_content_col_and_depth():
+    """Content column and depth"""
+
+    md = dedent("""
+        ## header
+        paragraph
+
+        * list
+          list
+            * nested
+            1. numbered
+        * [x] task
+
+        > quote
+        > > nested
+        lazy
+        """).strip()
+
+    ctx = MdMarkContext()
+    for no, line in enumerate(md.splitlines(), start=1):
+        _mark_markdown_line(ctx, no, line)
+
+    cols = [line.content_col for line in ctx.lines]
+    depths = [line.depth for line in ctx.lines]
+    assert cols == [3, 0, 0, 2, 0, 6, 7, 6, 0, 2, 2, 0]
+    assert depths == [2, 0, 0, 1, 1, 2, 2, 1, 0, 1, 2, 2]
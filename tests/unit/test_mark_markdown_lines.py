@@ -0,0 +1,60 @@
+import pytest
+
+from mkdocs_decodiff_plugin.markdown_marker import (
+    mark_markdown_lines,
+    mark_markdown_mmap,
+)
+
+LINES = (
+    ["# header", "", "paragraph", "", "* list", "  list", ""]
+    + ["```", "code", "```", ""]
+    + ["|h|", "|-|", "|c|", ""]
+) * 20
+
+
+def test_mark_markdown_lines_last_line_no():
+    marked_lines = mark_markdown_lines(LINES)
+    lines = mark_markdown_lines(LINES, last_line_no=12)
+
+    # the next line of `last_line_no` decides whether it is a table header
+    assert len(lines) == 13
+    assert lines == marked_lines[:13]
+    assert lines[11].is_table()
+
+
+def test_mark_markdown_mmap(tmp_path):
+    path = tmp_path / "large.md"
+    path.write_text("\n".join(LINES) + "\n", encoding="utf-8")
+
+    lines = mark_markdown_mmap(str(path))
+
+    assert len(lines) == len(LINES)
+    assert list(lines) == mark_markdown_lines(LINES)
+    assert lines[-2] == mark_markdown_lines(LINES)[-2]
+
+
+def test_mark_markdown_mmap_last_line_no(tmp_path):
+    path = tmp_path / "large.md"
+    path.write_bytes(("\r\n".join(LINES) + "\r\n").encode("utf-8"))
+
+    lines = mark_markdown_mmap(str(path), last_line_no=12)
+
+    # indexed as far as marked
+    assert len(lines._offsets) == 14
+    assert lines.line_count == len(LINES)
+    assert lines[:] == mark_markdown_lines(LINES)[:13]
+
+
+def test_mark_markdown_mmap_line_ends(tmp_path):
+    path = tmp_path / "large.md"
+    path.write_bytes(b"# a\r\rb\r\r\nc\nd\r\n\r\ne")
+    with open(path, "r", encoding="utf-8") as f:
+        text_lines = [line.rstrip("\n") for line in f]
+
+    with mark_markdown_mmap(str(path)) as lines:
+        assert [line.line for line in lines] == text_lines
+        assert list(lines) == mark_markdown_lines(text_lines)
+
+    # closed
+    with pytest.raises(ValueError):
+        lines[0]
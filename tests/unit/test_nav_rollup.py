@@ -0,0 +1,89 @@
+from types import SimpleNamespace
+
+from mkdocs_decodiff_plugin.decodiff import FileChange, LineChange
+from mkdocs_decodiff_plugin.nav_rollup import NavChanges, page_changes, rollup_nav
+from mkdocs_decodiff_plugin.page_index import PageIndex
+
+
+def _page(name):
+    return SimpleNamespace(
+        name=name,
+        file=SimpleNamespace(src_path=f"{name}.md"),
+        is_section=False,
+        is_page=True,
+        is_link=False,
+    )
+
+
+def _section(*children):
+    return SimpleNamespace(
+        children=list(children), is_section=True, is_page=False, is_link=False
+    )
+
+
+def _link():
+    return SimpleNamespace(is_section=False, is_page=False, is_link=True)
+
+
+def test_page_changes(tmp_path):
+    index = PageIndex(str(tmp_path))
+    index.build(
+        [
+            FileChange(
+                str(tmp_path / "a.md"),
+                line_changes=[
+                    LineChange(3, "a", "<span>a</span>", "decodiff-anchor-1"),
+                    LineChange(5, "b\nc", "<span>b\nc</span>", "decodiff-anchor-2", 2),
+                ],
+                head_line_count=0,
+            ),
+            FileChange(str(tmp_path / "b.md"), is_added=True),
+            FileChange(str(tmp_path / "c.md"), is_modified=True),
+        ]
+    )
+
+    def lookup(name):
+        return index.lookup(name, str(tmp_path / name))
+
+    assert page_changes(lookup("a.md")) == NavChanges(pages=1, changes=2, lines=3)
+    assert page_changes(lookup("b.md")) == NavChanges(pages=1, new_pages=1)
+    assert page_changes(lookup("c.md")) == NavChanges(pages=1)
+    assert page_changes(lookup("d.md")) == NavChanges()
+
+
+def test_rollup_nav():
+    counts = {
+        "a": NavChanges(pages=1, changes=2, lines=3),
+        "b": NavChanges(pages=1, new_pages=1),
+        "c": NavChanges(pages=1, changes=1, lines=1),
+    }
+    a, b, c, d = _page("a"), _page("b"), _page("c"), _page("d")
+    inner = _section(c, _link())
+    outer = _section(b, inner, d)
+    items = [a, outer]
+
+    total = rollup_nav(items, lambda p: counts.get(p.name, NavChanges()))
+
+    assert total == NavChanges(pages=3, new_pages=1, changes=3, lines=4)
+    assert a.decodiff == counts["a"]
+    assert d.decodiff == NavChanges()
+    assert inner.decodiff == counts["c"]
+    assert outer.decodiff == NavChanges(pages=2, new_pages=1, changes=1, lines=1)
+    assert outer.decodiff.to_dict() == {
+        "pages": 2,
+        "new_pages": 1,
+        "changes": 1,
+        "lines": 1,
+    }
+
+
+def test_rollup_nav_duplicate_page():
+    counts = {"a": NavChanges(pages=1, changes=2, lines=3)}
+    a, b = _page("a"), _page("b")
+    section = _section(_page("a"), b)
+
+    total = rollup_nav([a, section], lambda p: counts.get(p.name, NavChanges()))
+
+    # listed twice, counted once
+    assert total == counts["a"]
+    assert section.decodiff == counts["a"]
@@ -0,0 +1,101 @@
+import os
+
+from mkdocs_decodiff_plugin._cache import DiskCache
+from mkdocs_decodiff_plugin.decodiff import FileChange, LineChange
+from mkdocs_decodiff_plugin.page_index import PageIndex, page_cache_key
+
+
+def _change(line_no):
+    return LineChange(line_no, "line", "tagged", f"decodiff-anchor-{line_no}")
+
+
+def test_page_index(tmp_path):
+    docs = tmp_path / "docs"
+    (docs / "sub").mkdir(parents=True)
+    (docs / "a.md").write_text("---\ntitle: a\n---\n\n# a\nline\n")
+    (docs / "sub" / "b.md").write_text("# b\n")
+    (tmp_path / "outside.md").write_text("# outside\n")
+    (docs / "link.md").symlink_to(tmp_path / "outside.md")
+    (docs / "other.md").write_text("# other\n")
+
+    index = PageIndex(str(docs))
+    index.build(
+        [
+            # made without marking, e.g. by propagate_includes
+            FileChange(str(docs / "a.md"), line_changes=[_change(6), _change(5)]),
+            FileChange(str(docs / "sub" / "b.md"), is_added=True),
+            FileChange(str(tmp_path / "outside.md"), line_changes=[_change(1)]),
+            FileChange(str(docs / "removed.md"), is_removed=True),
+        ]
+    )
+
+    plan = index.lookup("a.md", str(docs / "a.md"))
+    assert plan.offset == 4
+    assert [c.line_no for c in plan.line_changes] == [5, 6]
+
+    plan = index.lookup(os.path.join("sub", "b.md"), str(docs / "sub" / "b.md"))
+    assert plan.file_change.is_added
+
+    plan = index.lookup("link.md", str(docs / "link.md"))
+    assert plan.file_change.file_path == str(tmp_path / "outside.md")
+
+    assert index.lookup("other.md", str(docs / "other.md")) is None
+    assert index.lookup("removed.md", str(docs / "removed.md")) is None
+
+
+def test_page_index_symlinked_dir(tmp_path):
+    docs = tmp_path / "docs"
+    (docs / "sub").mkdir(parents=True)
+    (docs / "sub" / "a.md").write_text("# a\nline\n")
+    (docs / "alias").symlink_to(docs / "sub")
+    (tmp_path / "shared").mkdir()
+    (tmp_path / "shared" / "b.md").write_text("# b\n")
+    (docs / "shared").symlink_to(tmp_path / "shared")
+
+    index = PageIndex(str(docs))
+    index.build(
+        [
+            FileChange(str(docs / "sub" / "a.md"), line_changes=[_change(2)]),
+            FileChange(str(tmp_path / "shared" / "b.md"), is_added=True),
+        ]
+    )
+
+    alias = os.path.join("alias", "a.md")
+    assert index.page_key(alias, str(docs / alias)) == "sub/a.md"
+    assert index.lookup(alias, str(docs / alias)) is not None
+    shared = os.path.join("shared", "b.md")
+    assert index.lookup(shared, str(docs / shared)).file_change.is_added
+
+
+def test_page_index_fingerprint(tmp_path):
+    page = tmp_path / "a.md"
+    page.write_text("# a\nline\n")
+
+    def fingerprint(line_changes):
+        index = PageIndex(str(tmp_path))
+        index.build([FileChange(str(page), line_changes=line_changes)])
+        return index.lookup("a.md", str(page)).fingerprint
+
+    assert fingerprint([_change(2)]) == fingerprint([_change(2)])
+    assert fingerprint([_change(2)]) != fingerprint([_change(1)])
+    assert fingerprint([_change(2)]) != fingerprint([])
+
+
+def test_page_cache_key(tmp_path):
+    page = tmp_path / "a.md"
+    page.write_text("# a\nline\n")
+    index = PageIndex(str(tmp_path))
+    index.build([FileChange(str(page), line_changes=[_change(2)])])
+    plan = index.lookup("a.md", str(page))
+    cache = DiskCache(str(tmp_path / "cache"))
+
+    key = page_cache_key(plan, "# a\nline", "1.0")
+    cache.put(key, b"# a\ntagged")
+
+    # a hit returns the same markdown
+    hit = page_cache_key(plan, "# a\nline", "1.0")
+    assert cache.get(hit).decode("utf-8") == "# a\ntagged"
+    assert page_cache_key(plan, "# a\nline", "1.1") != key
+
+    # markdown changed by another plugin, the source is the same
+    assert page_cache_key(plan, "# a\nline\nincluded", "1.0") != key
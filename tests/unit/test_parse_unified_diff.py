@@ -1,5 +1,11 @@
 from textwrap import dedent
 
+from mkdocs_decodiff_plugin._git_diff.git_diff import (
+    FileDiff,
+    LineDiff,
+    file_diffs_from_json,
+    file_diffs_to_json,
+)
 from mkdocs_decodiff_plugin._git_diff.parse_unified_diff import parse_unified_diff
 
 
@@ -115,3 +121,12 @@ def test_parse_unified_diff_2():
     assert len(diffs[2].line_diffs) == 0
 
     assert len(diffs) == 3
+
+
+def test_file_diffs_json():
+    file_diffs = [
+        FileDiff("a.md", "a.md", [LineDiff(3, 0, 5, 0), LineDiff(4, 1, 2, 1)]),
+        FileDiff(None, "b.md", []),
+    ]
+
+    assert file_diffs_from_json(file_diffs_to_json(file_diffs)) == file_diffs
@@ -0,0 +1,70 @@
+from mkdocs_decodiff_plugin._cache import DiskCache
+from mkdocs_decodiff_plugin.planner import (
+    BuildStats,
+    load_stats,
+    make_plan,
+    save_stats,
+)
+
+
+def test_make_plan_no_stats():
+    plan = make_plan([], cpu_count=4)
+
+    assert not plan.stream_diff
+    assert plan.mark_processes == 1
+
+
+def test_make_plan_stream_diff():
+    small = BuildStats(diff_bytes=1024, line_diffs=10, diff_measured=True)
+    large = BuildStats(diff_bytes=128 * 1024 * 1024, line_diffs=10, diff_measured=True)
+
+    assert not make_plan([small, small, large], cpu_count=1).stream_diff
+    assert make_plan([small, large, large], cpu_count=1).stream_diff
+
+
+def test_make_plan_mark_processes():
+    fast = BuildStats(line_diffs=1000, mark_seconds=0.1)
+    slow = BuildStats(line_diffs=1000, mark_seconds=10.0)
+
+    # serial marking is fast enough
+    assert make_plan([fast], cpu_count=4).mark_processes == 1
+    # pool is tried
+    assert make_plan([slow], cpu_count=4).mark_processes == 4
+    # no pool on a single CPU
+    assert make_plan([slow], cpu_count=1).mark_processes == 1
+
+    # pool was slower than serial marking
+    pooled = BuildStats(line_diffs=1000, mark_seconds=20.0, mark_processes=4)
+    assert make_plan([slow, pooled], cpu_count=4).mark_processes == 1
+    pooled.mark_seconds = 3.0
+    assert make_plan([slow, pooled], cpu_count=4).mark_processes == 4
+
+
+def test_stats_round_trip(tmp_path):
+    cache = DiskCache(str(tmp_path))
+
+    assert load_stats(cache) == []
+    stats = [BuildStats(diff_bytes=i, files=1) for i in range(30)]
+    save_stats(cache, stats)
+
+    loaded = load_stats(cache)
+    assert len(loaded) == 20
+    assert loaded[-1] == stats[-1]
+
+
+def test_count_lines():
+    stats = BuildStats()
+
+    assert list(stats.count_lines(["ab\n", "c\n"])) == ["ab\n", "c\n"]
+    assert stats.diff_bytes == 5
+
+
+def test_make_plan_unmeasured_diff():
+    large = BuildStats(diff_bytes=128 * 1024 * 1024, diff_measured=True)
+    cached = BuildStats()
+
+    # cached, sharded and file level diffs are ignored
+    assert make_plan([large, cached, cached], cpu_count=1).stream_diff
+    plan = make_plan([cached], cpu_count=1)
+    assert not plan.stream_diff
+    assert "no measured diffs" in plan.reason
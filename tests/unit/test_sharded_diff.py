@@ -0,0 +1,68 @@
+from mkdocs_decodiff_plugin._git_diff.git_diff import WordDiff, run_git_diff
+from mkdocs_decodiff_plugin._git_diff.parse_porcelain_diff import parse_porcelain_diff
+from mkdocs_decodiff_plugin._git_diff.parse_unified_diff import parse_unified_diff
+from mkdocs_decodiff_plugin._git_diff.sharded_diff import (
+    _make_shards,
+    run_sharded_git_diff,
+)
+
+
+def test_make_shards():
+    paths = [f"docs/{i}.md" for i in range(10)]
+
+    shards = _make_shards([[p] for p in paths], 3)
+
+    assert shards == [paths[0:4], paths[4:8], paths[8:10]]
+    assert _make_shards([], 3) == []
+    # a rename is not split
+    changes = [["a.md"], ["old.md", "new.md"], ["z.md"]]
+    assert _make_shards(changes, 3) == [["a.md"], ["old.md", "new.md"], ["z.md"]]
+
+
+def test_run_sharded_git_diff(tmp_path, git_repo, git):
+    docs = tmp_path / "docs"
+    docs.mkdir()
+    for i in range(8):
+        (docs / f"page{i}.md").write_text(f"# page {i}\n\nline\n")
+    (docs / "image.png").write_text("png\n")
+    git("add", ".")
+    git("commit", "-q", "-m", "init")
+    for i in range(0, 8, 2):
+        (docs / f"page{i}.md").write_text(f"# page {i}\n\nline\nnew {i}\nnew\n")
+    (docs / "image.png").write_text("changed\n")
+    (docs / "new.md").write_text("# new\n")
+    git("add", "docs/new.md")
+
+    expected = parse_unified_diff(run_git_diff("HEAD", WordDiff.NONE, "docs"))
+    file_diffs = run_sharded_git_diff("HEAD", WordDiff.NONE, "docs", 3)
+
+    assert len(file_diffs) == 5
+    assert file_diffs == expected
+    assert [d.anchor_no for f in file_diffs for d in f.line_diffs] == list(range(8))
+
+
+def test_run_sharded_git_diff_rename(tmp_path, git_repo, git):
+    docs = tmp_path / "docs"
+    docs.mkdir()
+    for i in range(8):
+        lines = "".join(f"line {i} {n}\n" for n in range(20))
+        (docs / f"page{i}.md").write_text(f"# page {i}\n\n{lines}")
+    git("add", ".")
+    git("commit", "-q", "-m", "init")
+    git("mv", "docs/page1.md", "docs/renamed1.md")
+    git("mv", "docs/page5.md", "docs/a5.md")
+    with open(docs / "renamed1.md", "a") as f:
+        f.write("new line\n")
+    (docs / "page6.md").write_text("# page 6\n\nchanged\n")
+
+    for word_diff, parse in [
+        (WordDiff.NONE, parse_unified_diff),
+        (WordDiff.PORCELAIN, parse_porcelain_diff),
+    ]:
+        single = parse(run_git_diff("HEAD", word_diff, "docs"))
+        sharded = run_sharded_git_diff("HEAD", word_diff, "docs", 4)
+
+        assert sharded == single
+        assert ("docs/page1.md", "docs/renamed1.md") in [
+            (d.from_file, d.to_file) for d in sharded
+        ]